@@ -1,48 +1,466 @@
 import os
+import re
+import sys
+import glob
+import json
+import hashlib
+from urllib.parse import quote
 
-# 定义文件路径
-INPUT_FILE = 'link.txt'
-OUTPUT_FILE = 'trojan_links.txt'
+# 生成任务配置：按输入文件分组，每个输入文件可对应多个模板/输出 (端口、路径、ALPN、指纹等)
+# 用法: python generate_config.py [配置文件]，默认读取 generate_config.json
+CONFIG_FILE = 'generate_config.json'
+# 写出缓冲区大小，数万域名 × 多个模板时减少系统调用次数
+WRITE_BUFFER_SIZE = 1 << 20
+# 域名校验：每个标签 1-63 个字符、不以连字符开头或结尾，总长不超过 253，顶级域为字母或 punycode
+HOSTNAME_PATTERN = re.compile(r'^(?=.{1,253}$)(?:(?!-)[a-z0-9-]{1,63}(?<!-)\.)+(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})$')
+# 报告中最多列出的无效域名数量
+MAX_REPORTED_REJECTS = 20
+# 排序输出 (输出模板设置 "ranked": true)：关联上次连通性测试写出的延迟记录，按延迟排序，
+# 连续 QUARANTINE_AFTER 次测试失败的域名移入隔离文件；可在配置的 ranking 段覆盖
+RANKING_RESULTS_GLOB = '*/*/success-nodes-parallel.latency.json'
+RANKING_STATE_FILE = 'link_health_state.json'
+QUARANTINE_AFTER = 3
 
-# 定义 Trojan 节点模板
-TROJAN_TEMPLATE = "trojan://bpb-trojan@www.vpslook.com:443?security=tls&sni={domain}&alpn=h3&fp=randomized&allowlnsecure=1&type=ws&host={domain}&path=%2Ftr%3Fed%3D2560#BPB-{domain}"
 
-def generate_trojan_links():
+def line_hash(line):
+    return hashlib.sha256(line.encode('utf-8')).hexdigest()[:16]
+
+
+def shard_of(domain, shard_count):
+    """按域名哈希分片：同一域名始终落在同一分片，列表增删不会打乱其它域名的分片归属。"""
+    return int(hashlib.sha256(domain.encode('utf-8')).hexdigest()[:8], 16) % shard_count
+
+
+def load_config(config_path):
+    """读取生成配置，把 defaults 合并进每个输出模板；返回 (任务列表, ranking 配置)。"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    defaults = config.get('defaults', {})
+    jobs = []
+    for job in config.get('jobs', []):
+        outputs = [{**defaults, **output} for output in job.get('outputs', [])]
+        if outputs:
+            jobs.append({'input': job['input'], 'outputs': outputs})
+    return jobs, config.get('ranking', {})
+
+
+def normalize_domain(domain):
+    """小写化、去掉末尾的点并转换为 punycode；不是合法主机名时返回 None。"""
+    domain = domain.lower().rstrip('.')
+    if not domain.isascii():
+        try:
+            domain = domain.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None
+    return domain if HOSTNAME_PATTERN.match(domain) else None
+
+
+class DomainStats:
+    """记录输入文件的校验结果，结束后统一报告。"""
+
+    def __init__(self):
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = []
+
+    def report(self, input_file):
+        print(f"{input_file}: 有效域名 {self.accepted} 个，重复 {self.duplicates} 个，无效 {len(self.rejected)} 个。")
+        for line_no, domain in self.rejected[:MAX_REPORTED_REJECTS]:
+            print(f"  ❌ 第 {line_no} 行无效域名: {domain}")
+        if len(self.rejected) > MAX_REPORTED_REJECTS:
+            print(f"  ... 其余 {len(self.rejected) - MAX_REPORTED_REJECTS} 个无效域名未列出")
+
+
+def iter_domains(input_file, stats):
+    """逐行读取输入文件中的域名，跳过空行和注释；规范化后去重，无效域名计入 stats。"""
+    seen = set()
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            raw = line.strip()
+            if not raw or line.startswith('#'):
+                continue
+            domain = normalize_domain(raw)
+            if domain is None:
+                stats.rejected.append((line_no, raw))
+                continue
+            if domain in seen:
+                stats.duplicates += 1
+                continue
+            seen.add(domain)
+            stats.accepted += 1
+            yield domain
+
+
+class Ranking:
+    """
+    最近一次连通性测试的延迟记录 + 跨运行的连续失效计数 (state_file)。
+    同一份测试结果只计数一次 (按 tested_at 判断)，生成脚本比测试跑得更频繁也不会重复累加。
+    """
+
+    def __init__(self, options):
+        self.quarantine_after = int(options.get('quarantine_after', QUARANTINE_AFTER))
+        self.state_file = options.get('state_file', RANKING_STATE_FILE)
+        self.results_path, self.results = self.load_latest_results(options.get('results', RANKING_RESULTS_GLOB))
+        self.latency = self.results.get('latency', {}) if self.results else {}
+        self.failed = set(self.results.get('failed', [])) if self.results else set()
+        self.state = self.load_json(self.state_file) or {'outputs': {}}
+
+    @staticmethod
+    def load_json(path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取 {path} 失败: {e}")
+            return None
+
+    def load_latest_results(self, pattern):
+        """按路径 (YYYY/MM) 取最新的一份延迟记录。"""
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            print(f"未找到测试结果 ({pattern})，排序输出按原顺序生成。")
+            return None, None
+        results = self.load_json(paths[-1])
+        if results:
+            print(f"使用测试结果 {paths[-1]} (测试时间 {results.get('tested_at', '未知')})。")
+        return paths[-1], results
+
+    def fresh_for(self, output_file):
+        """该输出上次计数后是否有新的测试结果。"""
+        record = self.state['outputs'].get(output_file, {})
+        return bool(self.results) and self.results.get('tested_at') != record.get('tested_at')
+
+    def update_streaks(self, output_file, streaks):
+        record = self.state['outputs'].get(output_file, {})
+        self.state['outputs'][output_file] = {
+            'tested_at': self.results.get('tested_at') if self.results else record.get('tested_at'),
+            'dead_streak': streaks,
+        }
+
+    def save(self):
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+
+
+class ShardWriter:
+    """
+    把一个输出按域名哈希拆成 K 个分片文件 (xxx.shard-0.txt ...)，并写出分片索引 xxx.shards.json，
+    供 CI 矩阵中的 K 个测试任务各取一片并行测试。
+    """
+
+    def __init__(self, output_file, shard_count):
+        base, ext = os.path.splitext(output_file)
+        self.shard_count = shard_count
+        self.index_file = f"{base}.shards.json"
+        self.files = [f"{base}.shard-{i}{ext}" for i in range(shard_count)]
+        self.tmp_files = [f"{path}.tmp" for path in self.files]
+        self.outs = [open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) for path in self.tmp_files]
+        self.digests = [hashlib.sha256() for _ in range(shard_count)]
+        self.counts = [0] * shard_count
+
+    def write(self, domain, link):
+        i = shard_of(domain, self.shard_count)
+        chunk = f"{link}\n"
+        self.outs[i].write(chunk)
+        self.digests[i].update(chunk.encode('utf-8'))
+        self.counts[i] += 1
+
+    def up_to_date(self):
+        """分片索引存在、分片数一致且分片文件都在时，才认为可以跳过写入。"""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return index.get('shards') == self.shard_count and all(os.path.exists(path) for path in self.files)
+
+    def discard(self):
+        for out, path in zip(self.outs, self.tmp_files):
+            out.close()
+            if os.path.exists(path):
+                os.remove(path)
+
+    def commit(self, output_sha256):
+        for out, tmp_path, path in zip(self.outs, self.tmp_files, self.files):
+            out.close()
+            os.replace(tmp_path, path)
+        index = {
+            'shards': self.shard_count,
+            'source_sha256': output_sha256,
+            'files': [
+                {'file': os.path.basename(path), 'count': count, 'sha256': digest.hexdigest()}
+                for path, count, digest in zip(self.files, self.counts, self.digests)
+            ],
+        }
+        with open(self.index_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        print(f"已拆分为 {self.shard_count} 个分片 ({'/'.join(map(str, self.counts))})，索引写入 {self.index_file}。")
+
+
+class RankedWriter:
     """
-    读取 link.txt 文件中的域名，生成 Trojan 链接并写入 trojan_links.txt 文件。
+    一个输出的排序版本 xxx.ranked.txt 与隔离文件 xxx.quarantine.txt，边生成边写入：
+    有延迟的按延迟升序在前，未测试过的保持原顺序其次，近期失败但未达到隔离阈值的排在最后。
+    未测试过的链接先写入临时文件、隔离的链接直接写入隔离文件，内存中只保留有测试记录的链接。
     """
-    if not os.path.exists(INPUT_FILE):
-        print(f"错误：输入文件 {INPUT_FILE} 不存在。")
+
+    def __init__(self, ranking, output_file):
+        base, ext = os.path.splitext(output_file)
+        self.ranking = ranking
+        self.output_file = output_file
+        self.ranked_file = f"{base}.ranked{ext}"
+        self.quarantine_file = f"{base}.quarantine{ext}"
+        self.unknown_file = f"{self.ranked_file}.unknown.tmp"
+        self.quarantine_tmp = f"{self.quarantine_file}.tmp"
+        self.old_streaks = ranking.state['outputs'].get(output_file, {}).get('dead_streak', {})
+        self.fresh = ranking.fresh_for(output_file)
+        self.streaks = {}
+        self.alive, self.dying = [], []
+        self.unknown_count = 0
+        self.quarantined_count = 0
+        self.unknown = open(self.unknown_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+        self.quarantine = open(self.quarantine_tmp, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+
+    def write(self, domain, link):
+        # 同一份测试结果只计数一次：没有新结果时沿用上次的连续失效次数
+        streak = self.old_streaks.get(domain, 0)
+        if self.fresh and link in self.ranking.failed:
+            streak += 1
+        elif self.fresh and link in self.ranking.latency:
+            streak = 0
+        if streak:
+            self.streaks[domain] = streak
+
+        if streak >= self.ranking.quarantine_after:
+            self.quarantine.write(f"\n{link}" if self.quarantined_count else link)
+            self.quarantined_count += 1
+        elif streak:
+            self.dying.append((streak, link))
+        elif link in self.ranking.latency:
+            self.alive.append((self.ranking.latency[link], link))
+        else:
+            self.unknown.write(f"{link}\n")
+            self.unknown_count += 1
+
+    def iter_ranked(self):
+        self.alive.sort(key=lambda item: item[0])
+        yield from (link for _, link in self.alive)
+        with open(self.unknown_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line.rstrip('\n')
+        self.dying.sort(key=lambda item: item[0])
+        yield from (link for _, link in self.dying)
+
+    def discard(self):
+        self.unknown.close()
+        self.quarantine.close()
+        for path in (self.unknown_file, self.quarantine_tmp, f"{self.ranked_file}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def commit(self):
+        self.unknown.close()
+        self.quarantine.close()
+        ranked_tmp = f"{self.ranked_file}.tmp"
+        count = 0
+        with open(ranked_tmp, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            for link in self.iter_ranked():
+                f.write(f"\n{link}" if count else link)
+                count += 1
+        os.replace(ranked_tmp, self.ranked_file)
+        os.replace(self.quarantine_tmp, self.quarantine_file)
+        os.remove(self.unknown_file)
+        self.ranking.update_streaks(self.output_file, self.streaks)
+        print(f"排序输出: {count} 个链接写入 {self.ranked_file}，隔离 {self.quarantined_count} 个写入 {self.quarantine_file}。")
+
+
+class OutputWriter:
+    """
+    一个模板对应的输出文件。边生成边写入临时文件，每行哈希同时追加到临时清单，
+    结束时与上次的清单比较：没有变化则丢弃临时文件，有变化才替换输出与清单并写出增量补丁。
+    内存中只保留上次清单的行哈希 (计算增删行所需)，本次的链接与哈希都不驻留内存。
+    """
+
+    def __init__(self, spec, ranking=None):
+        self.output_file = spec['file']
+        base, ext = os.path.splitext(self.output_file)
+        # 增量模式：清单记录上次输出每一行的内容哈希，差异写入补丁文件，供下游只拉取变化部分
+        self.manifest_file = f"{base}.manifest.json"
+        self.delta_file = f"{base}.delta.txt"
+        self.template = spec['template']
+        self.params = {key: value for key, value in spec.items() if key not in ('file', 'template', 'shards', 'ranked')}
+        if 'path' in self.params:
+            self.params['path'] = quote(self.params['path'], safe='')
+
+        self.manifest = self.load_manifest()
+        # 上次清单中本次尚未出现的行哈希：生成过程中逐个移除，结束时剩下的即为被删除的行
+        self.unmatched_hashes = set(self.manifest.pop('lines', [])) if self.manifest else set()
+        self.count = 0
+        self.digest = hashlib.sha256()
+        self.tmp_file = f"{self.output_file}.tmp"
+        self.added_file = f"{self.delta_file}.added.tmp"
+        self.manifest_tmp = f"{self.manifest_file}.tmp"
+        self.out = open(self.tmp_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+        self.added = open(self.added_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+        self.manifest_out = open(self.manifest_tmp, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+        self.manifest_out.write('{"lines": [')
+        self.added_count = 0
+        # 可选：shards > 1 时同时输出按域名哈希划分的分片文件
+        shard_count = int(spec.get('shards', 0) or 0)
+        self.shards = ShardWriter(self.output_file, shard_count) if shard_count > 1 else None
+        # 可选：ranked 时额外输出按延迟排序的 xxx.ranked.txt 与隔离的 xxx.quarantine.txt
+        self.ranked = RankedWriter(ranking, self.output_file) if ranking and spec.get('ranked') else None
+
+    def load_manifest(self):
+        """读取上次生成的清单；不存在或损坏时返回 None (按全量生成处理)。"""
+        if not os.path.exists(self.manifest_file):
+            return None
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取清单 {self.manifest_file} 失败，将全量生成: {e}")
+            return None
+
+    def write(self, domain):
+        link = self.template.format(domain=domain, **self.params)
+        # 与旧版保持一致：行之间用换行分隔，文件末尾没有换行
+        chunk = f"\n{link}" if self.count else link
+        self.out.write(chunk)
+        self.digest.update(chunk.encode('utf-8'))
+        h = line_hash(link)
+        self.manifest_out.write(f', "{h}"' if self.count else f'"{h}"')
+        self.count += 1
+        if h in self.unmatched_hashes:
+            self.unmatched_hashes.discard(h)
+        else:
+            self.added.write(f"+{link}\n")
+            self.added_count += 1
+        if self.shards:
+            self.shards.write(domain, link)
+        if self.ranked:
+            self.ranked.write(domain, link)
+
+    def output_unchanged_on_disk(self):
+        """确认输出文件与清单一致 (未被手动修改或删除)。"""
+        if not os.path.exists(self.output_file):
+            return False
+        digest = hashlib.sha256()
+        with open(self.output_file, 'rb') as f:
+            for block in iter(lambda: f.read(WRITE_BUFFER_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest() == self.manifest.get('output_sha256')
+
+    def discard(self):
+        self.out.close()
+        self.added.close()
+        self.manifest_out.close()
+        for path in (self.tmp_file, self.added_file, self.manifest_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+        if self.shards:
+            self.shards.discard()
+        if self.ranked:
+            self.ranked.discard()
+
+    def finish(self):
+        self.out.close()
+        self.added.close()
+        if self.ranked:
+            # 测试结果与输出内容无关，即使输出无变化也要重新排序
+            try:
+                self.ranked.commit()
+            except Exception as e:
+                print(f"写入排序输出 {self.ranked.ranked_file} 失败: {e}")
+        try:
+            # 输出内容的 sha256 相同即逐行相同，无需逐行比较哈希
+            output_sha256 = self.digest.hexdigest()
+            if (self.manifest and self.manifest.get('output_sha256') == output_sha256
+                    and self.manifest.get('count') == self.count and self.output_unchanged_on_disk()
+                    and (self.shards is None or self.shards.up_to_date())):
+                print(f"内容无变化 ({self.count} 个链接)，跳过写入 {self.output_file}。")
+                return
+
+            # 删除的行从旧输出文件中取回原文 (替换输出文件之前)
+            removed_hashes = self.unmatched_hashes
+            removed_count = 0
+            with open(self.delta_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as delta:
+                delta.write(f"# base: {self.manifest.get('output_sha256', '') if self.manifest else ''}\n")
+                delta.write(f"# target: {output_sha256}\n")
+                if removed_hashes and os.path.exists(self.output_file):
+                    with open(self.output_file, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            line = line.rstrip('\n')
+                            if line_hash(line) in removed_hashes:
+                                delta.write(f"-{line}\n")
+                                removed_count += 1
+                with open(self.added_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        delta.write(line)
+
+            os.replace(self.tmp_file, self.output_file)
+            print(f"成功生成 {self.count} 个 Trojan 链接，并写入 {self.output_file}。")
+            self.manifest_out.write(f'], "output_sha256": "{output_sha256}", "count": {self.count}}}')
+            self.manifest_out.close()
+            os.replace(self.manifest_tmp, self.manifest_file)
+            print(f"增量补丁: 新增 {self.added_count} 行，删除 {removed_count} 行，已写入 {self.delta_file}。")
+            if self.shards:
+                self.shards.commit(output_sha256)
+        except Exception as e:
+            print(f"写入文件 {self.output_file} 失败: {e}")
+        finally:
+            self.discard()
+
+
+def run_job(job, ranking):
+    """流式读取一次输入文件，同时写出该输入对应的全部模板输出。"""
+    input_file = job['input']
+    if not os.path.exists(input_file):
+        print(f"错误：输入文件 {input_file} 不存在。")
         return
 
-    generated_links = []
-    
+    writers = [OutputWriter(spec, ranking) for spec in job['outputs']]
+    stats = DomainStats()
     try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            domains = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        for domain in iter_domains(input_file, stats):
+            for writer in writers:
+                writer.write(domain)
     except Exception as e:
-        print(f"读取文件 {INPUT_FILE} 失败: {e}")
+        print(f"读取文件 {input_file} 失败: {e}")
+        for writer in writers:
+            writer.discard()
         return
 
-    if not domains:
-        print("警告：link.txt 中没有可用的域名。")
+    stats.report(input_file)
+    if not stats.accepted:
+        print(f"警告：{input_file} 中没有可用的域名。")
+        for writer in writers:
+            writer.discard()
         return
 
-    # 遍历域名列表，生成链接
-    for domain in domains:
-        # 使用 format() 方法替换模板中的占位符
-        link = TROJAN_TEMPLATE.format(domain=domain)
-        generated_links.append(link)
+    for writer in writers:
+        writer.finish()
+
 
-    # 将生成的链接写入输出文件
+def generate_trojan_links(config_path=CONFIG_FILE):
+    """
+    按配置为每个输入文件生成 Trojan 链接；每个输入文件只读取一次，所有模板的输出在同一遍中写出。
+    与上次的清单比较：没有变化时不写任何文件；有变化时同时写出只包含增删行的补丁文件。
+    """
     try:
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(generated_links))
-        
-        print(f"成功生成 {len(generated_links)} 个 Trojan 链接，并写入 {OUTPUT_FILE}。")
-        
-    except Exception as e:
-        print(f"写入文件 {OUTPUT_FILE} 失败: {e}")
+        jobs, ranking_options = load_config(config_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"读取配置 {config_path} 失败: {e}")
+        return
+
+    ranked = any(spec.get('ranked') for job in jobs for spec in job['outputs'])
+    ranking = Ranking(ranking_options) if ranked else None
+    for job in jobs:
+        run_job(job, ranking)
+    if ranking:
+        ranking.save()
 
 if __name__ == "__main__":
-    generate_trojan_links()
+    generate_trojan_links(sys.argv[1] if len(sys.argv) > 1 else CONFIG_FILE)
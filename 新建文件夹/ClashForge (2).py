@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*-
 # !/usr/bin/env python3
 import base64
-import subprocess
-import threading
 import time
 import urllib.parse
 import json
@@ -29,7 +27,11 @@ ssl._create_default_https_context = ssl._create_unverified_context
 import warnings
 warnings.filterwarnings('ignore')
 from requests_html import HTMLSession
-import psutil
+from node_parser import parse_proxy_dict, generate_proxy_fingerprint
+from node_health import NodeHealthStore
+from http_cache import HttpCache
+from config_validator import validate_proxies, prune_config, mihomo_config_tester, bisect_invalid_proxies
+from mihomo_supervisor import MihomoSupervisor, kill_registered
 
 
 # TEST_URL = "http://www.gstatic.com/generate_204"
@@ -43,8 +45,27 @@ SPEED_TEST = False
 SPEED_TEST_LIMIT = 5 # 只测试前30个节点的下行速度，每个节点测试5秒
 results_speed = []
 MAX_CONCURRENT_TESTS = 100
+# 自适应并发 (AIMD)：延迟测试的并发从 CONCURRENCY_INITIAL 起步，每 CONCURRENCY_WINDOW 个结果评估一次，
+# 超时比例和延迟中位数稳定时加性增长，相对基线突增时乘性下降；上限为 MAX_CONCURRENT_TESTS。关闭时使用固定并发
+ADAPTIVE_CONCURRENCY = True
+CONCURRENCY_INITIAL = 32
+CONCURRENCY_MIN = 4
+CONCURRENCY_STEP = 4             # 每个稳定窗口增加的并发数
+CONCURRENCY_BACKOFF = 0.7        # 拥塞时并发乘以该系数
+CONCURRENCY_WINDOW = 40          # 每个评估窗口的结果数
+CONCURRENCY_TIMEOUT_SPIKE = 0.15 # 窗口超时比例超过基线该值视为拥塞 (失效节点本身会超时，只看相对基线的突增)
+CONCURRENCY_LATENCY_SPIKE = 1.5  # 窗口延迟中位数超过基线该倍数视为拥塞 (mihomo 自身争用导致延迟虚高)
+# 策略组批量测速：mihomo 支持 /group/{name}/delay 时，一次请求由 mihomo 在服务端测完整组，返回 {节点名: 延迟}
+GROUP_DELAY = True
+GROUP_DELAY_MIN_VERSION = (1, 14, 0)  # 提供 /group 接口的最低 mihomo (Clash.Meta) 版本
+GROUP_DELAY_CHUNK_SIZE = 50           # 每个临时组的节点数；一次组测试在并发限制器中占用同样多的名额 (超过并发上限时单独运行)
+GROUP_DELAY_PREFIX = "__delay_test_"  # 临时组名前缀；临时组只写入启动时加载的运行时配置 (见 write_runtime_config)
+GROUP_DELAY_MIN_PENDING = 0.5         # 临时组中没有近期结果的节点占比不低于该值时整组测试，否则这些节点逐个测试
+GROUP_DELAY_EXTRA_TIMEOUT = 5         # 整组请求在 TIMEOUT 之外额外等待的时间 (秒)
 LIMIT = 10000 # 最多保留LIMIT个节点
+CLASH_READY_TIMEOUT = 60 # Clash 启动到 API 就绪的最长等待 (秒)
 CONFIG_FILE = 'clash_config.yaml'
+HEALTH_SCOPE = "clash" # 跨运行的节点健康记录 (node_health.py) 中 proxy_clean 使用的 scope
 INPUT = "input" # 从文件中加载代理节点，支持yaml/yml、txt(每条代理链接占一行)
 BAN = ["中国", "China", "CN", "电信", "移动", "联通"]
 headers = {
@@ -53,6 +74,19 @@ headers = {
     'User-Agent': 'Clash Verge/1.7.7'
 }
 
+# 订阅抓取：所有源共用一个 httpx.AsyncClient (连接池 + keep-alive，安装 h2 时启用 HTTP/2)，并发下载、边到边解析
+FETCH_TIMEOUT = 15           # 单次请求超时 (秒)
+FETCH_RETRIES = 2            # 连接错误、超时、429/5xx 时的重试次数
+FETCH_BACKOFF = 1            # 重试退避基数 (秒)，按次数翻倍并加随机抖动
+FETCH_PER_HOST_LIMIT = 4     # 同一主机的并发请求上限
+FETCH_MAX_CONNECTIONS = 64   # 连接池上限
+FETCH_RETRY_STATUS = {429, 500, 502, 503, 504}
+try:
+    import h2  # noqa: F401  HTTP/2 为可选依赖 (pip install httpx[http2])
+    FETCH_HTTP2 = True
+except ImportError:
+    FETCH_HTTP2 = False
+
 # Clash 配置文件的基础结构
 clash_config_template = {
     "port": 7890,
@@ -1227,145 +1261,78 @@ clash_config_template = {
     ]
 }
 
-# 解析 Hysteria2 链接
-def parse_hysteria2_link(link):
-    link = link[14:]
-    parts = link.split('@')
-    uuid = parts[0]
-    server_info = parts[1].split('?')
-    server = server_info[0].split(':')[0]
-    port = int(server_info[0].split(':')[1].split('/')[0].strip())
-    query_params = urllib.parse.parse_qs(server_info[1] if len(server_info) > 1 else '')
-    insecure = '1' in query_params.get('insecure', ['0'])
-    sni = query_params.get('sni', [''])[0]
-    name = urllib.parse.unquote(link.split('#')[-1].strip())
-
-    return {
-        "name": f"{name}",
-        "server": server,
-        "port": port,
-        "type": "hysteria2",
-        "password": uuid,
-        "auth": uuid,
-        "sni": sni,
-        "skip-cert-verify": not insecure,
-        "client-fingerprint": "chrome"
-    }
-
-# 解析 Shadowsocks 链接
-def parse_ss_link(link):
-    link = link[5:]
-    if "#" in link:
-        config_part, name = link.split('#')
-    else:
-        config_part, name = link, ""
-    decoded = base64.urlsafe_b64decode(config_part.split('@')[0] + '=' * (-len(config_part.split('@')[0]) % 4)).decode('utf-8')
-    method_passwd = decoded.split(':')
-    cipher, password = method_passwd if len(method_passwd) == 2 else (method_passwd[0], "")
-    server_info = config_part.split('@')[1]
-    server, port = server_info.split(':') if ":" in server_info else (server_info, "")
-
-    return {
-        "name": urllib.parse.unquote(name),
-        "type": "ss",
-        "server": server,
-        "port": int(port),
-        "cipher": cipher,
-        "password": password,
-        "udp": True
-    }
-
-# 解析 Trojan 链接
-def parse_trojan_link(link):
-    link = link[9:]
-    config_part, name = link.split('#')
-    user_info, host_info = config_part.split('@')
-    username, password = user_info.split(':') if ":" in user_info else ("", user_info)
-    host, port_and_query = host_info.split(':') if ":" in host_info else (host_info, "")
-    port, query = port_and_query.split('?', 1) if '?' in port_and_query else (port_and_query, "")
+class SubscriptionFetcher:
+    """
+    订阅源下载器：共享连接池，按主机限制并发，每个请求有超时，失败后指数退避加抖动重试。
+    """
 
-    return {
-        "name": urllib.parse.unquote(name),
-        "type": "trojan",
-        "server": host,
-        "port": int(port),
-        "password": password,
-        "sni": urllib.parse.parse_qs(query).get("sni", [""])[0],
-        "skip-cert-verify": urllib.parse.parse_qs(query).get("skip-cert-verify", ["false"])[0] == "true"
-    }
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.host_limits: Dict[str, Semaphore] = {}
+        # 条件请求缓存 (见 http_cache.py)：源未变化时服务器返回 304，复用缓存的正文和解析结果
+        self.cache = HttpCache()
 
-# 解析 VLESS 链接
-def parse_vless_link(link):
-    link = link[8:]
-    config_part, name = link.split('#')
-    user_info, host_info = config_part.split('@')
-    uuid = user_info
-    host, query = host_info.split('?', 1) if '?' in host_info else (host_info, "")
-    port = host.split(':')[-1] if ':' in host else ""
-    host = host.split(':')[0] if ':' in host else ""
-    return {
-        "name": urllib.parse.unquote(name),
-        "type": "vless",
-        "server": host,
-        "port": int(port),
-        "uuid": uuid,
-        "security": urllib.parse.parse_qs(query).get("security", ["none"])[0],
-        "tls": urllib.parse.parse_qs(query).get("security", ["none"])[0] == "tls",
-        "sni": urllib.parse.parse_qs(query).get("sni", [""])[0],
-        "skip-cert-verify": urllib.parse.parse_qs(query).get("skip-cert-verify", ["false"])[0] == "true",
-        "network": urllib.parse.parse_qs(query).get("type", ["tcp"])[0],
-        "ws-opts": {
-            "path": urllib.parse.parse_qs(query).get("path", [""])[0],
-            "headers": {
-                "Host": urllib.parse.parse_qs(query).get("host", [""])[0]
-            }
-        } if urllib.parse.parse_qs(query).get("type", ["tcp"])[0] == "ws" else {}
-    }
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            http2=FETCH_HTTP2,
+            verify=False,
+            follow_redirects=True,
+            headers=headers,
+            timeout=FETCH_TIMEOUT,
+            limits=httpx.Limits(max_connections=FETCH_MAX_CONNECTIONS, max_keepalive_connections=FETCH_MAX_CONNECTIONS),
+        )
+        return self
 
-# 解析 VMESS 链接
-def parse_vmess_link(link):
-    link = link[8:]
-    decoded_link = base64.urlsafe_b64decode(link + '=' * (-len(link) % 4)).decode("utf-8")
-    vmess_info = json.loads(decoded_link)
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.client.aclose()
+        self.cache.save()
+
+    def _host_limit(self, url: str) -> Semaphore:
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self.host_limits:
+            self.host_limits[host] = Semaphore(FETCH_PER_HOST_LIMIT)
+        return self.host_limits[host]
+
+    async def get(self, url: str) -> httpx.Response:
+        """GET 请求；重试用尽后返回最后一次响应，或抛出 httpx.HTTPError。304 会被换成带缓存正文的 200 响应。"""
+        limit = self._host_limit(url)
+        for attempt in range(FETCH_RETRIES + 1):
+            try:
+                async with limit:
+                    response = await self.client.get(url, headers=self.cache.request_headers(url))
+                if response.status_code not in FETCH_RETRY_STATUS or attempt == FETCH_RETRIES:
+                    status_code, content = self.cache.handle_response(url, response.status_code, response.headers, response.content)
+                    if status_code != response.status_code:
+                        response = httpx.Response(status_code, headers=response.headers, content=content, request=response.request)
+                    return response
+            except httpx.TransportError:
+                if attempt == FETCH_RETRIES:
+                    raise
+            # 退避期间不占用主机并发名额
+            await asyncio.sleep(FETCH_BACKOFF * 2 ** attempt + random.uniform(0, FETCH_BACKOFF))
 
-    return {
-        "name": urllib.parse.unquote(vmess_info.get("ps", "vmess")),
-        "type": "vmess",
-        "server": vmess_info["add"],
-        "port": int(vmess_info["port"]),
-        "uuid": vmess_info["id"],
-        "alterId": int(vmess_info.get("aid", 0)),
-        "cipher": "auto",
-        "network": vmess_info.get("net", "tcp"),
-        "tls": vmess_info.get("tls", "") == "tls",
-        "sni": vmess_info.get("sni", ""),
-        "ws-opts": {
-            "path": vmess_info.get("path", ""),
-            "headers": {
-                "Host": vmess_info.get("host", "")
-            }
-        } if vmess_info.get("net", "tcp") == "ws" else {}
-    }
 
 # 解析ss订阅源
-def parse_ss_sub(link):
+async def parse_ss_sub(fetcher, link):
     new_links = []
     try:
         # 发送请求并获取内容
-        response = requests.get(link, headers=headers, verify=False, allow_redirects=True)
+        response = await fetcher.get(link)
         if response.status_code == 200:
             data = response.json()
             new_links = [{"name": x['remarks'], "type": "ss", "server": x['server'], "port": x['server_port'], "cipher": x['method'],"password": x['password'], "udp": True} for x in data]
-            return new_links
-    except requests.RequestException as e:
+    except (httpx.HTTPError, ValueError) as e:
         print(f"请求错误: {e}")
-        return new_links
+    return new_links
 
-def parse_md_link(link):
+async def parse_md_link(fetcher, link):
     try:
         # 发送请求并获取内容
-        response = requests.get(link)
+        response = await fetcher.get(link)
         response.raise_for_status()  # 检查请求是否成功
+        hit, matches = fetcher.cache.load_parsed(link, "md_links", response.content)
+        if hit:
+            return matches
         content = response.text
         content = urllib.parse.unquote(content)
         # 定义正则表达式模式，匹配所需的协议链接
@@ -1373,9 +1340,10 @@ def parse_md_link(link):
 
         # 使用re.findall()提取所有匹配的链接
         matches = re.findall(pattern, content)
+        fetcher.cache.store_parsed(link, "md_links", response.content, matches)
         return matches
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"请求错误: {e}")
         return []
 
@@ -1406,78 +1374,125 @@ def match_nodes(text):
     yaml_data = {"proxies": proxies_list}
     return yaml_data
 
-# link非代理协议时(https)，请求url解析
-def process_url(url):
+# 解析订阅正文：YAML 返回 (节点字典列表, True)，Base64 返回 (链接列表, False)；都不是时返回 None (需要JS渲染)
+def parse_url_content(content):
+    isyaml = False
+    content = content.decode('utf-8')
+    if 'proxies:' in content:
+        if '</pre>' in content:
+            content = content.replace('<pre style="word-wrap: break-word; white-space: pre-wrap;">','').replace('</pre>','')
+        # YAML格式
+        yaml_data = yaml.safe_load(content)
+        if 'proxies' in yaml_data:
+            isyaml = True
+            proxies = yaml_data['proxies'] if yaml_data['proxies'] else []
+            return proxies,isyaml
+        return [],isyaml
+    # 尝试Base64解码
+    try:
+        decoded_bytes = base64.b64decode(content)
+        decoded_content = decoded_bytes.decode('utf-8')
+        decoded_content = urllib.parse.unquote(decoded_content)
+        return decoded_content.splitlines(),isyaml
+    except Exception as e:
+        return None
+
+# link非代理协议时(https)，请求url解析；内容既不是YAML也不是Base64时返回None，由调用方在主线程中做JS渲染 (process_js_url)
+async def process_url(fetcher, url):
     isyaml = False
     try:
         # 发送GET请求
-        response = requests.get(url, headers=headers, verify=False, allow_redirects=True)
+        response = await fetcher.get(url)
         # 确保响应状态码为200
         if response.status_code == 200:
-            content = response.content.decode('utf-8')
-            if 'proxies:' in content:
-                if '</pre>' in content:
-                    content = content.replace('<pre style="word-wrap: break-word; white-space: pre-wrap;">','').replace('</pre>','')
-                # YAML格式
-                yaml_data = yaml.safe_load(content)
-                if 'proxies' in yaml_data:
-                    isyaml = True
-                    proxies = yaml_data['proxies'] if yaml_data['proxies'] else []
-                    return proxies,isyaml
-            else:
-                # 尝试Base64解码
-                try:
-                    decoded_bytes = base64.b64decode(content)
-                    decoded_content = decoded_bytes.decode('utf-8')
-                    decoded_content = urllib.parse.unquote(decoded_content)
-                    return decoded_content.splitlines(),isyaml
-                except Exception as e:
-                    try:
-                        res = js_render(url)
-                        if 'external-controller' in res.html.text:
-                            # YAML格式
-                            try:
-                                yaml_data = yaml.safe_load(res.html.text)
-                            except Exception as e:
-                                yaml_data = match_nodes(res.html.text)
-                            finally:
-                                if 'proxies' in yaml_data:
-                                    isyaml = True
-                                    return yaml_data['proxies'], isyaml
-
-                        else:
-                            pattern = r'([A-Za-z0-9_+/\-]+={0,2})'
-                            matches = re.findall(pattern, res.html.text)
-                            stdout = matches[-1] if matches else []
-                            decoded_bytes = base64.b64decode(stdout)
-                            decoded_content = decoded_bytes.decode('utf-8')
-                            return decoded_content.splitlines(), isyaml
-                    except Exception as e:
-                        # 如果不是Base64编码，直接按行处理
-                        return [],isyaml
+            # 正文与上次解析时一致 (304 或内容未变) 时直接复用缓存的解析结果
+            hit, parsed = fetcher.cache.load_parsed(url, "process_url", response.content)
+            if not hit:
+                parsed = parse_url_content(response.content)
+                fetcher.cache.store_parsed(url, "process_url", response.content, parsed)
+            return tuple(parsed) if parsed is not None else None
         else:
             print(f"Failed to retrieve data from {url}, status code: {response.status_code}")
             return [],isyaml
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"An error occurred while requesting {url}: {e}")
         return [],isyaml
 
-# 解析不同的代理链接
-def parse_proxy_link(link):
+# JS渲染后解析 (requests_html/pyppeteer 需要在主线程运行，不放进事件循环)
+def process_js_url(url):
+    isyaml = False
     try:
-        if link.startswith("hysteria2://") or link.startswith("hy2://"):
-            return parse_hysteria2_link(link)
-        elif link.startswith("trojan://"):
-            return parse_trojan_link(link)
-        elif link.startswith("ss://"):
-            return parse_ss_link(link)
-        elif link.startswith("vless://"):
-            return parse_vless_link(link)
-        elif link.startswith("vmess://"):
-            return parse_vmess_link(link)
+        res = js_render(url)
+        if 'external-controller' in res.html.text:
+            # YAML格式
+            try:
+                yaml_data = yaml.safe_load(res.html.text)
+            except Exception as e:
+                yaml_data = match_nodes(res.html.text)
+            finally:
+                if 'proxies' in yaml_data:
+                    isyaml = True
+                    return yaml_data['proxies'], isyaml
+
+        else:
+            pattern = r'([A-Za-z0-9_+/\-]+={0,2})'
+            matches = re.findall(pattern, res.html.text)
+            stdout = matches[-1] if matches else []
+            decoded_bytes = base64.b64decode(stdout)
+            decoded_content = decoded_bytes.decode('utf-8')
+            return decoded_content.splitlines(), isyaml
     except Exception as e:
-        # print(e)
-        return None
+        # 如果不是Base64编码，直接按行处理
+        return [],isyaml
+    return [],isyaml
+
+# 并发抓取全部订阅源，每个源下载完成后立即解析；返回需要JS渲染的URL
+async def fetch_sources(links, resolve_name_conflicts):
+    js_urls = []
+
+    async with SubscriptionFetcher() as fetcher:
+        async def fetch_source(link):
+            """返回 (解析结果列表, 需要 JS 渲染的 URL 或 None)"""
+            results = []
+            if '|links' in link or '.md' in link:
+                link = link.replace('|links', '')
+                results.append((await parse_md_link(fetcher, link), False))
+            if '|ss' in link:
+                link = link.replace('|ss', '')
+                results.append((await parse_ss_sub(fetcher, link), True))
+            if '{' in link:
+                link = await resolve_template_url(fetcher, link)
+            print(f'当前正在处理link: {link}')
+            # 处理非特定协议的链接
+            parsed = await process_url(fetcher, link)
+            if parsed is None:
+                return results, link
+            results.append(parsed)
+            return results, None
+
+        started = time.time()
+        # 并发抓取，但按源的原始顺序处理结果：resolve_name_conflicts 给重名节点加的后缀与网络时序无关，输出可复现
+        sources = await asyncio.gather(*(fetch_source(link) for link in links), return_exceptions=True)
+        for source in sources:
+            if isinstance(source, Exception):
+                print(f"error: {source}")
+                continue
+            results, js_url = source
+            if js_url is not None:
+                js_urls.append(js_url)
+            for new_links, isyaml in results:
+                if isyaml:
+                    for node in new_links:
+                        resolve_name_conflicts(node)
+                else:
+                    handle_links(new_links, resolve_name_conflicts)
+        print(f"订阅源抓取完成: {len(links)} 个源，耗时 {time.time() - started:.2f} 秒 (HTTP/2: {'开启' if FETCH_HTTP2 else '未安装 h2，使用 HTTP/1.1'})")
+    return js_urls
+
+# 解析不同的代理链接
+def parse_proxy_link(link):
+    # 共用 node_parser：同一条链接只解析一次，返回新的 Clash 字典
+    return parse_proxy_dict(link)
 
 # 根据server和port共同约束去重
 def deduplicate_proxies(proxies_list):
@@ -1588,6 +1603,7 @@ def generate_clash_config(links,load_nodes):
         resolve_name_conflicts(node)
 
 
+    remote_links = []
     for link in links:
         if link.startswith(("hysteria2://", "hy2://","trojan://", "ss://", "vless://", "vmess://")):
             node = parse_proxy_link(link)
@@ -1595,29 +1611,17 @@ def generate_clash_config(links,load_nodes):
                 continue
             resolve_name_conflicts(node)
         else:
-            if '|links' in link or '.md' in link:
-                link = link.replace('|links', '')
-                new_links = parse_md_link(link)
-                handle_links(new_links,resolve_name_conflicts)
-            if '|ss' in link:
-                link = link.replace('|ss', '')
-                new_links = parse_ss_sub(link)
-                for node in new_links:
-                    resolve_name_conflicts(node)
-            if '{' in link:
-                link = resolve_template_url(link)
-            print(f'当前正在处理link: {link}')
-            # 处理非特定协议的链接
-            try:
-                new_links,isyaml = process_url(link)
-            except Exception as e:
-                print(f"error: {e}")
-                continue
-            if isyaml:
-                for node in new_links:
-                    resolve_name_conflicts(node)
-            else:
-                handle_links(new_links, resolve_name_conflicts)
+            remote_links.append(link)
+
+    # 订阅源并发下载；无法直接解析的页面最后在主线程中逐个做JS渲染
+    js_urls = asyncio.run(fetch_sources(remote_links, resolve_name_conflicts)) if remote_links else []
+    for link in js_urls:
+        new_links, isyaml = process_js_url(link)
+        if isyaml:
+            for node in new_links:
+                resolve_name_conflicts(node)
+        else:
+            handle_links(new_links, resolve_name_conflicts)
     final_nodes = deduplicate_proxies(final_nodes)
     # 重置group中节点name
     config["proxy-groups"][1]["proxies"] = []
@@ -1671,43 +1675,102 @@ def ensure_executable(file_path):
     if platform.system().lower() in ['linux', 'darwin']:
         os.chmod(file_path, 0o755)  # 设置文件为可执行
 
-# 处理 Clash 配置错误，解析错误信息并更新配置文件
-def handle_clash_error(error_message, config_file_path):
+# 启动前预校验配置：先在 Python 中一次性剔除所有无效节点，仍无法通过 mihomo -t 时再二分定位，最后只写一次配置文件；返回校验后的配置
+def prevalidate_config(config_file_path, clash_binary):
     start_time = time.time()
-    config_file_path = f'{config_file_path}.json' if os.path.exists(f'{config_file_path}.json') else config_file_path
+    with open(config_file_path, 'r', encoding='utf-8') as file:
+        config = json.load(file)
+    total = len(config.get('proxies', []))
+
+    valid_proxies, rejected = validate_proxies(config.get('proxies', []))
+    for index, name, reason in rejected[:20]:
+        print(f'  移除proxy[{index}] {name}: {reason}')
+    if len(rejected) > 20:
+        print(f'  ... 另有 {len(rejected) - 20} 个无效节点')
+    prune_config(config, valid_proxies)
+
+    test = mihomo_config_tester(clash_binary)
+    ok, output = test(config)
+    bisected = 0
+    if not ok:
+        bad_names = bisect_invalid_proxies(config, test)
+        if bad_names is None:
+            print(f'配置预校验：配置本身无法通过mihomo -t，与节点无关，交给启动时处理\n{output}')
+        else:
+            bisected = len(bad_names)
+            prune_config(config, [p for p in config['proxies'] if str(p['name']) not in bad_names])
 
+    if rejected or bisected:
+        with open(config_file_path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(config, ensure_ascii=False))
+    print(f'配置预校验：{total}个节点，规则校验移除{len(rejected)}个，mihomo -t二分移除{bisected}个，耗时{time.time() - start_time:.2f}s\n')
+    return config
+
+# 策略组批量测速用的临时组：随配置在启动时一次性加载，测速时不再热加载配置 (热加载会重启所有监听)
+def delay_test_groups(proxy_names: List[str]) -> List[dict]:
+    return [{"name": f"{GROUP_DELAY_PREFIX}{i // GROUP_DELAY_CHUNK_SIZE}", "type": "select",
+             "proxies": proxy_names[i:i + GROUP_DELAY_CHUNK_SIZE]}
+            for i in range(0, len(proxy_names), GROUP_DELAY_CHUNK_SIZE)]
+
+# 写出 mihomo 实际加载的运行时配置：在配置之外追加临时测速组，用户的配置文件保持不变
+def write_runtime_config(config: dict, path: str):
+    groups = delay_test_groups([str(p['name']) for p in config.get('proxies', [])]) if GROUP_DELAY else []
+    runtime_config = dict(config, **{'proxy-groups': list(config.get('proxy-groups', [])) + groups})
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(runtime_config, ensure_ascii=False))
+
+# 启动失败时的配置修复
+class ConfigRepairer:
+    """
+    配置只加载一次并常驻内存。删除节点只在 alive 中打墓碑标记 (O(1))，
+    proxies 列表、策略组引用和配置文件在 flush 时统一重建，每次重新启动 mihomo 前最多写盘一次。
+    """
+
+    def __init__(self, config_path: str, config: Optional[dict] = None):
+        self.config_path = config_path
+        if config is None:
+            with open(config_path, 'r', encoding='utf-8') as file:
+                config = json.load(file)
+        self.config = config
+        self.proxies: List[dict] = list(config.get('proxies', []))
+        self.alive: List[bool] = [True] * len(self.proxies)
+        # mihomo 报错中的 proxy 下标是上次写入文件的 proxies 中的位置：written[下标] -> self.proxies 中的位置
+        self.written: List[int] = list(range(len(self.proxies)))
+        self.removed = 0
+
+    def remove_index(self, index: int) -> Optional[str]:
+        """按 mihomo 报错的下标删除节点，返回节点名；下标无效或已删除时返回 None。"""
+        if index >= len(self.written) or not self.alive[self.written[index]]:
+            return None
+        position = self.written[index]
+        self.alive[position] = False
+        self.removed += 1
+        return str(self.proxies[position].get('name'))
+
+    def flush(self):
+        """有待写入的删除时重建配置并写盘。"""
+        if not self.removed:
+            return
+        start_time = time.time()
+        self.written = [i for i, alive in enumerate(self.alive) if alive]
+        prune_config(self.config, [self.proxies[i] for i in self.written])
+        with open(self.config_path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(self.config, ensure_ascii=False))
+        print(f'已写入修复后的配置：移除{self.removed}个节点，剩余{len(self.written)}个，耗时{time.time() - start_time:.2f}s')
+        self.removed = 0
+
+# 处理 Clash 配置错误：解析错误信息，在内存中删除问题节点 (由 ConfigRepairer.flush 在重新启动前写盘)
+def handle_clash_error(error_message, repairer):
     proxy_index_match = re.search(r'proxy (\d+):', error_message)
     if not proxy_index_match:
         return False
 
     problem_index = int(proxy_index_match.group(1))
-
-    try:
-        # 读取配置文件
-        with open(config_file_path, 'r', encoding='utf-8') as file:
-            config = json.load(file)
-
-        # 获取要删除的节点的name
-        problem_proxy_name = config['proxies'][problem_index]['name']
-        # 删除问题节点
-        del config['proxies'][problem_index]
-
-        # 从所有proxy-groups中删除该节点引用
-        proxies = config['proxy-groups'][1]["proxies"]
-        proxies.remove(problem_proxy_name)
-        for group in config["proxy-groups"][1:]:
-            group["proxies"] = proxies
-
-        # 保存更新后的配置
-        with open(config_file_path, 'w', encoding='utf-8') as file:
-            file.write(json.dumps(config,ensure_ascii=False))
-
-        print(f'配置异常：{error_message}修复配置异常，移除proxy[{problem_index}] {problem_proxy_name} 完毕，耗时{time.time() - start_time}s\n')
-        return True
-
-    except Exception as e:
-        print(f"处理配置文件时出错: {str(e)}")
+    problem_proxy_name = repairer.remove_index(problem_index)
+    if problem_proxy_name is None:
         return False
+    print(f'配置异常：{error_message}修复配置异常，移除proxy[{problem_index}] {problem_proxy_name}\n')
+    return True
 
 # 下载最新mihomo
 def download_and_extract_latest_release():
@@ -1781,56 +1844,16 @@ def download_and_extract_latest_release():
     else:
         print("No suitable release found for the current operating system.")
 
-def read_output(pipe, output_lines):
-    while True:
-        line = pipe.readline()
-        if line:
-            output_lines.append(line)
-        else:
-            break
-
 def kill_clash():
     """
-    在 macOS、Linux 和 Windows 上强制杀掉 Clash 进程。
-    支持配置文件：clash_config.yaml 和 clash_config.yaml.json
+    强制结束本工具启动过的 Clash 进程 (包括上次运行残留的)：只处理 mihomo_supervisor 登记表中的 PID，不扫描系统进程。
     """
-    # 根据操作系统定义 Clash 进程名
-    system = platform.system()
-    clash_process_names = {
-        "Windows": "clash.exe",
-        "Linux": "clash-linux",
-        "Darwin": "clash-darwin"  # macOS
-    }
-    config_files = ["clash_config.yaml", "clash_config.yaml.json"]
-    
-    # 检查是否支持当前操作系统
-    if system not in clash_process_names:
-        print("不支持的操作系统")
-        return
-    
-    # 获取当前系统的 Clash 进程名
-    process_name = clash_process_names[system]
-    
-    # 遍历所有进程，查找并终止 Clash 进程
-    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-        try:
-            # 如果进程名不匹配，跳过
-            if proc.info['name'] != process_name:
-                continue
-            
-            # 获取命令行参数并检查配置文件
-            cmdline = proc.info['cmdline']
-            if cmdline and len(cmdline) >= 3 and cmdline[1] == '-f' and cmdline[2] in config_files:
-                # 强制终止进程
-                proc.kill()
-                # print(f"Clash 进程 (PID: {proc.pid}) 已终止 ({system})")
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            # 忽略进程不存在、权限不足或僵尸进程的异常
-            pass
-    
-    # print(f"未找到 Clash 进程 ({system})")
+    killed = kill_registered()
+    if killed:
+        print(f"已结束 {killed} 个残留的 Clash 进程")
 
 def start_clash():
+    """启动 Clash 并等待 API 就绪，返回 MihomoSupervisor (后台监管，崩溃自动重启)；启动失败返回 None。"""
     download_and_extract_latest_release()
     system_platform = platform.system().lower()
 
@@ -1842,63 +1865,40 @@ def start_clash():
     else:
         raise OSError("Unsupported operating system.")
 
-    not_started = True
-
     global CONFIG_FILE
     CONFIG_FILE = f'{CONFIG_FILE}.json' if os.path.exists(f'{CONFIG_FILE}.json') else CONFIG_FILE
-    while not_started:
-        # print(f'加载配置{CONFIG_FILE}')
-        clash_process = subprocess.Popen(
-            [clash_binary, '-f', CONFIG_FILE],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8'
-        )
-
-        output_lines = []
-
-        # 启动线程来读取标准输出和标准错误
-        stdout_thread = threading.Thread(target=read_output, args=(clash_process.stdout, output_lines))
+    repairer = ConfigRepairer(CONFIG_FILE, prevalidate_config(CONFIG_FILE, clash_binary)) if CONFIG_FILE.endswith('.json') else None
+    if repairer:
+        config = repairer.config
+    else:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as file:
+            config = yaml.safe_load(file)
+    runtime_config_file = f"{os.path.splitext(CONFIG_FILE)[0]}.runtime.json"
+
+    # 每次启动前：写入修复后的配置，再从同一份配置生成运行时配置 (修复删除的节点同样从临时组中移除)
+    def before_start():
+        if repairer:
+            repairer.flush()
+        write_runtime_config(config, runtime_config_file)
+
+    supervisor = MihomoSupervisor(
+        clash_binary, runtime_config_file,
+        controller=CLASH_API_PORTS[0],
+        # 首次启动可能要下载 GeoIP.dat 等地理数据库，就绪等待放宽
+        ready_timeout=CLASH_READY_TIMEOUT,
+        before_start=before_start,
+        on_config_error=(lambda error_message: handle_clash_error(error_message, repairer)) if repairer else None,
+        auto_restart=True,
+        name="Clash",
+        secret=CLASH_API_SECRET,
+    )
+    if not supervisor.start_background():
+        print(f"Clash 启动失败: {supervisor.last_error}\n{supervisor.log_text()}")
+        supervisor.stop_background()
+        return None
+    print(f'Clash API启动成功 (耗时{supervisor.ready_seconds:.2f}s)，开始批量检测')
+    return supervisor
 
-        stdout_thread.start()
-
-        timeout = 3
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            stdout_thread.join(timeout=0.5)
-            if output_lines:
-                # 检查输出是否包含错误信息
-                if 'GeoIP.dat' in output_lines[-1]:
-                    print(output_lines[-1])
-                    time.sleep(5)
-                    if is_clash_api_running():
-                        return clash_process
-
-                if "Parse config error" in output_lines[-1]:
-                    if handle_clash_error(output_lines[-1], CONFIG_FILE):
-                        clash_process.kill()
-                        output_lines = []
-            if is_clash_api_running():
-                return clash_process
-
-
-        if not_started:
-            clash_process.kill()
-            continue
-        return clash_process
-
-
-def is_clash_api_running():
-    try:
-        url = f"http://{CLASH_API_HOST}:{CLASH_API_PORTS[0]}/configs"
-        response = requests.get(url)
-        # 检查响应状态码，200表示正常
-        print(f'Clash API启动成功，开始批量检测')
-        return response.status_code == 200
-    except requests.exceptions.RequestException:
-        # 捕获所有请求异常，包括连接错误等
-        return False
 
 # 切换到指定代理节点
 def switch_proxy(proxy_name='DIRECT'):
@@ -1925,8 +1925,119 @@ def switch_proxy(proxy_name='DIRECT'):
         return {"status": "error", "message": str(e)}
 
 # 调用ClashAPI
+# 根据 /version 的响应判断是否支持 /group/{name}/delay
+def supports_group_delay(version_info: dict) -> bool:
+    """只有 mihomo (meta 为 true) 提供该接口；无法解析的版本号 (如 alpha 构建) 视为支持，失败时仍会回退"""
+    if not version_info.get("meta"):
+        return False
+    match = re.match(r'v?(\d+)\.(\d+)\.(\d+)', str(version_info.get("version", "")))
+    if not match:
+        return True
+    return tuple(map(int, match.groups())) >= GROUP_DELAY_MIN_VERSION
+
+# 延迟测试的自适应并发控制
+class AdaptiveLimiter:
+    """
+    AIMD 并发限制器，用法同 Semaphore (async with)，每个节点测试结束后用 record 报告结果。
+    并发按节点计：策略组批量测试用 acquire(节点数)/release(节点数) 一次占用多个名额。
+    超时比例与延迟中位数的基线取各窗口的指数滑动平均；每次调整都打印并记入 history，便于事后核对选定的并发。
+    minimum == maximum 时并发固定 (ADAPTIVE_CONCURRENCY = False)。
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.window_delays: List[float] = []
+        self.window_timeouts = 0
+        self.window_total = 0
+        self.window_saturated = False  # 本窗口内并发是否用满过 (有请求因上限等待)
+        self.baseline_timeout_ratio: Optional[float] = None
+        self.baseline_delay: Optional[float] = None
+        self.history: List[tuple] = []  # (窗口序号, 调整前, 调整后, 原因)
+        self.windows = 0
+        self.stale = 0  # 下降时仍在进行的请求数：它们按旧并发发出，结果不计入之后的窗口
+
+    async def acquire(self, weight: int = 1):
+        """占用 weight 个名额；weight 超过当前并发上限时，等到完全空闲后单独运行"""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight + weight <= self.limit or self.in_flight == 0)
+            self.in_flight += weight
+            if self.in_flight >= self.limit:
+                self.window_saturated = True
+
+    async def release(self, weight: int = 1):
+        async with self.condition:
+            self.in_flight -= weight
+            self.condition.notify(max(self.limit - self.in_flight, 1))
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
+    def record(self, delay: Optional[float], timed_out: bool):
+        """报告一次测试结果：delay 为成功时的延迟，timed_out 表示请求超时 (其他失败只计入总数)。"""
+        if self.stale:
+            self.stale -= 1
+            return
+        self.window_total += 1
+        if delay is not None:
+            self.window_delays.append(delay)
+        elif timed_out:
+            self.window_timeouts += 1
+        if self.window_total >= CONCURRENCY_WINDOW:
+            self._adjust()
+
+    def _adjust(self):
+        self.windows += 1
+        timeout_ratio = self.window_timeouts / self.window_total
+        delays = sorted(self.window_delays)
+        median_delay = delays[len(delays) // 2] if delays else None
+        old_limit = self.limit
+
+        reason = None
+        if self.baseline_timeout_ratio is not None and timeout_ratio > self.baseline_timeout_ratio + CONCURRENCY_TIMEOUT_SPIKE:
+            reason = f"超时比例 {timeout_ratio:.0%} 高于基线 {self.baseline_timeout_ratio:.0%}"
+        elif median_delay is not None and self.baseline_delay and median_delay > self.baseline_delay * CONCURRENCY_LATENCY_SPIKE:
+            reason = f"延迟中位数 {median_delay:.0f}ms 高于基线 {self.baseline_delay:.0f}ms"
+        if reason:
+            self.limit = max(self.minimum, int(self.limit * CONCURRENCY_BACKOFF))
+            if self.limit < old_limit:
+                # 当前请求已经记录，其余仍在进行的请求不计入
+                self.stale = max(self.in_flight - 1, 0)
+        elif self.window_saturated:
+            # 只有并发在本窗口内确实用满过才增长，避免节点不足时空涨
+            self.limit = min(self.maximum, self.limit + CONCURRENCY_STEP)
+            reason = f"稳定 (超时 {timeout_ratio:.0%}，延迟中位数 {median_delay or 0:.0f}ms)"
+
+        # 基线：慢速指数滑动平均，拥塞窗口不计入
+        if not reason or self.limit >= old_limit:
+            self.baseline_timeout_ratio = timeout_ratio if self.baseline_timeout_ratio is None else 0.8 * self.baseline_timeout_ratio + 0.2 * timeout_ratio
+            if median_delay is not None:
+                self.baseline_delay = median_delay if self.baseline_delay is None else 0.8 * self.baseline_delay + 0.2 * median_delay
+
+        if self.limit != old_limit:
+            self.history.append((self.windows, old_limit, self.limit, reason))
+            print(f"\n[并发] 窗口{self.windows}: {old_limit} -> {self.limit}，{reason}")
+        self.window_delays = []
+        self.window_timeouts = 0
+        self.window_total = 0
+        self.window_saturated = self.in_flight >= self.limit
+
+    def summary(self) -> str:
+        if not self.history:
+            return f"并发保持 {self.limit}"
+        peak = max(h[2] for h in self.history)
+        decreases = sum(1 for h in self.history if h[2] < h[1])
+        return f"并发调整 {len(self.history)} 次 (下降 {decreases} 次)，峰值 {peak}，最终 {self.limit}"
+
 class ClashAPI:
-    def __init__(self, host: str, ports: List[int], secret: str = ""):
+    def __init__(self, host: str, ports: List[int], secret: str = "",
+                 health_store: Optional[NodeHealthStore] = None, fingerprints: Optional[Dict[str, str]] = None):
         self.host = host
         self.ports = ports
         self.base_url = None  # 将在连接检查时设置
@@ -1938,14 +2049,23 @@ class ClashAPI:
             'User-Agent': 'Clash Verge/1.7.7'
         }
         self.client = httpx.AsyncClient(timeout=TIMEOUT)
-        self.semaphore = Semaphore(MAX_CONCURRENT_TESTS)
+        self.semaphore = (AdaptiveLimiter(CONCURRENCY_INITIAL, CONCURRENCY_MIN, MAX_CONCURRENT_TESTS)
+                          if ADAPTIVE_CONCURRENCY else
+                          AdaptiveLimiter(MAX_CONCURRENT_TESTS, MAX_CONCURRENT_TESTS, MAX_CONCURRENT_TESTS))
         self._test_results_cache: Dict[str, ProxyTestResult] = {}
+        self.group_delay_supported = False  # 在 check_connection 中根据版本确定
+        # 持久化健康记录：节点名 -> 指纹，命中近期结果的节点不再实际测试
+        self.health_store = health_store
+        self.fingerprints = fingerprints or {}
+        self._health_records = health_store.lookup(self.fingerprints.values()) if health_store else {}
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.client.aclose()
+        if self.health_store:
+            self.health_store.close()
 
     async def check_connection(self) -> bool:
         """检查与 Clash API 的连接状态，自动尝试不同端口"""
@@ -1954,8 +2074,11 @@ class ClashAPI:
                 test_url = f"http://{self.host}:{port}"
                 response = await self.client.get(f"{test_url}/version")
                 if response.status_code == 200:
-                    version = response.json().get('version', 'unknown')
-                    print(f"成功连接到 Clash API (端口 {port})，版本: {version}")
+                    version_info = response.json()
+                    version = version_info.get('version', 'unknown')
+                    self.group_delay_supported = GROUP_DELAY and supports_group_delay(version_info)
+                    print(f"成功连接到 Clash API (端口 {port})，版本: {version}"
+                          f"{'，支持策略组批量测速' if self.group_delay_supported else ''}")
                     self.base_url = test_url
                     return True
             except httpx.RequestError:
@@ -1985,11 +2108,8 @@ class ClashAPI:
         except httpx.RequestError as e:
             raise ClashAPIException(f"请求错误: {e}")
 
-    async def test_proxy_delay(self, proxy_name: str) -> ProxyTestResult:
-        """测试指定代理节点的延迟，使用缓存避免重复测试"""
-        if not self.base_url:
-            raise ClashAPIException("未建立与 Clash API 的连接")
-
+    def _cached_result(self, proxy_name: str) -> Optional[ProxyTestResult]:
+        """返回近期的测试结果 (本次运行的缓存或持久化的健康记录)，没有时返回 None"""
         # 检查缓存
         if proxy_name in self._test_results_cache:
             cached_result = self._test_results_cache[proxy_name]
@@ -1997,26 +2117,151 @@ class ClashAPI:
             if (datetime.now() - cached_result.tested_time).total_seconds() < 60:
                 return cached_result
 
+        # 检查持久化的健康记录 (跨运行)
+        fingerprint = self.fingerprints.get(proxy_name)
+        verdict = NodeHealthStore.cached_verdict(self._health_records.get(fingerprint)) if self.health_store else None
+        if verdict is not None:
+            result = ProxyTestResult(proxy_name, verdict[1] if verdict[0] else None)
+            self._test_results_cache[proxy_name] = result
+            return result
+        return None
+
+    def _record_result(self, result: ProxyTestResult):
+        """更新缓存和健康记录"""
+        self._test_results_cache[result.name] = result
+        if self.health_store:
+            self.health_store.record(self.fingerprints.get(result.name), result.is_valid, result.delay if result.is_valid else None)
+
+    async def test_proxy_delay(self, proxy_name: str) -> ProxyTestResult:
+        """测试指定代理节点的延迟，使用缓存避免重复测试"""
+        if not self.base_url:
+            raise ClashAPIException("未建立与 Clash API 的连接")
+
+        cached_result = self._cached_result(proxy_name)
+        if cached_result is not None:
+            return cached_result
+
         async with self.semaphore:
+            timed_out = False
             try:
                 response = await self.client.get(
                     f"{self.base_url}/proxies/{urllib.parse.quote(proxy_name, safe='')}/delay",
                     headers=self.headers,
                     params={"url": TEST_URL, "timeout": int(TIMEOUT * 1000)}
                 )
+                # mihomo 在节点测试超时时返回 504
+                timed_out = response.status_code == 504
                 response.raise_for_status()
                 delay = response.json().get("delay")
                 result = ProxyTestResult(proxy_name, delay)
+            except httpx.TimeoutException:
+                timed_out = True
+                result = ProxyTestResult(proxy_name)
             except httpx.HTTPError:
                 result = ProxyTestResult(proxy_name)
             except Exception as e:
                 result = ProxyTestResult(proxy_name)
                 # print(e)
             finally:
-                # 更新缓存
-                self._test_results_cache[proxy_name] = result
+                self.semaphore.record(result.delay if result.is_valid else None, timed_out)
+                self._record_result(result)
                 return result
 
+    async def loaded_delay_groups(self) -> Dict[str, List[str]]:
+        """读取 mihomo 当前加载的临时测速组 {组名: [节点名]} (见 write_runtime_config)；读取失败时返回空字典"""
+        try:
+            proxies = (await self.get_proxies()).get("proxies", {})
+        except ClashAPIException as e:
+            print(f"\n读取临时测速组失败，改为逐个测试: {e}")
+            return {}
+        return {name: info.get("all", []) for name, info in proxies.items() if name.startswith(GROUP_DELAY_PREFIX)}
+
+    async def test_group_delay(self, group_name: str, proxy_names: List[str]) -> Optional[List[ProxyTestResult]]:
+        """
+        一次请求测试整个策略组，mihomo 只返回测通的节点，不在结果中的视为超时失效。
+        请求在并发限制器中占用与节点数相同的名额，每个节点的结果都反馈给限制器，与逐个测试共用同一套并发控制。
+        返回 None 表示该组无法批量测试 (接口不存在或请求出错)，调用方应逐个测试。
+        """
+        weight = len(proxy_names)
+        await self.semaphore.acquire(weight)
+        try:
+            try:
+                response = await self.client.get(
+                    f"{self.base_url}/group/{urllib.parse.quote(group_name, safe='')}/delay",
+                    headers=self.headers,
+                    params={"url": TEST_URL, "timeout": int(TIMEOUT * 1000)},
+                    timeout=TIMEOUT + GROUP_DELAY_EXTRA_TIMEOUT
+                )
+            except httpx.HTTPError:
+                return None
+            if response.status_code == 404:
+                # 不支持 /group 接口的内核，之后都走逐个测试
+                self.group_delay_supported = False
+                return None
+            if response.status_code not in (200, 504):
+                return None
+
+            # 504 表示组内节点全部超时
+            delays = response.json() if response.status_code == 200 else {}
+            results = []
+            for name in proxy_names:
+                result = ProxyTestResult(name, delays.get(name) or None)
+                self.semaphore.record(result.delay if result.is_valid else None, not result.is_valid)
+                self._record_result(result)
+                results.append(result)
+            return results
+        finally:
+            await self.semaphore.release(weight)
+
+    async def group_delay_batches(self, proxies: List[str]):
+        """
+        按策略组批量测试 proxies，逐批产出 List[ProxyTestResult]。有近期结果的节点直接产出；其余节点借助启动时
+        随配置加载的临时组 (每组 GROUP_DELAY_CHUNK_SIZE 个) 并发测试，并发受限制器约束 (见 test_group_delay)。
+        临时组中待测节点占比低于 GROUP_DELAY_MIN_PENDING、不在任何临时组中或组测试失败的节点逐个测试。
+        """
+        if not self.base_url:
+            raise ClashAPIException("未建立与 Clash API 的连接")
+
+        pending = []
+        cached = []
+        for name in proxies:
+            result = self._cached_result(name)
+            if result is None:
+                pending.append(name)
+            else:
+                cached.append(result)
+        if cached:
+            yield cached
+        if not pending:
+            return
+
+        pending_set = set(pending)
+        groups = []
+        grouped = set()
+        for group_name, members in (await self.loaded_delay_groups()).items():
+            todo = [name for name in members if name in pending_set and name not in grouped]
+            if todo and len(todo) >= len(members) * GROUP_DELAY_MIN_PENDING:
+                groups.append((group_name, members, todo))
+                grouped.update(todo)
+        singles = [name for name in pending if name not in grouped]
+
+        async def test_chunk(group_name, members, todo):
+            results = await self.test_group_delay(group_name, members) if self.group_delay_supported else None
+            if results is None:
+                return await asyncio.gather(*(self.test_proxy_delay(name) for name in todo))
+            # 组内已有近期结果的节点顺带重测，只产出本次请求的节点
+            return [result for result in results if result.name in pending_set]
+
+        tasks = [asyncio.ensure_future(test_chunk(*group)) for group in groups]
+        tasks += [asyncio.ensure_future(self.test_proxy_delay(name)) for name in singles]
+        try:
+            for future in asyncio.as_completed(tasks):
+                result = await future
+                yield result if isinstance(result, list) else [result]
+        finally:
+            for task in tasks:
+                task.cancel()
+
 # 更新clash配置
 class ClashConfig:
     """Clash 配置管理类"""
@@ -2143,8 +2388,19 @@ def print_test_summary(group_name: str, results: List[ProxyTestResult]):
 
 # 测试一组代理节点
 async def test_group_proxies(clash_api: ClashAPI, proxies: List[str]) -> List[ProxyTestResult]:
-    """测试一组代理节点"""
-    print(f"开始测试 {len(proxies)} 个节点 (最大并发: {MAX_CONCURRENT_TESTS})")
+    """测试一组代理节点；mihomo 支持时借助启动时加载的临时组批量测试，否则逐个测试"""
+    concurrency = (f"自适应并发: 初始 {clash_api.semaphore.limit}，上限 {MAX_CONCURRENT_TESTS}" if ADAPTIVE_CONCURRENCY
+                   else f"最大并发: {MAX_CONCURRENT_TESTS}")
+    if clash_api.group_delay_supported:
+        print(f"开始测试 {len(proxies)} 个节点 (策略组批量测速，每组 {GROUP_DELAY_CHUNK_SIZE} 个，{concurrency})")
+        results = []
+        async for batch in clash_api.group_delay_batches(proxies):
+            results.extend(batch)
+            print(f"\r进度: {len(results)}/{len(proxies)} ({len(results) / len(proxies) * 100:.1f}%)", end="", flush=True)
+        print(f"\n{clash_api.semaphore.summary()}")
+        return results
+
+    print(f"开始测试 {len(proxies)} 个节点 ({concurrency})")
 
     # 创建所有测试任务
     tasks = [clash_api.test_proxy_delay(proxy_name) for proxy_name in proxies]
@@ -2159,6 +2415,7 @@ async def test_group_proxies(clash_api: ClashAPI, proxies: List[str]) -> List[Pr
         total = len(tasks)
         print(f"\r进度: {done}/{total} ({done / total * 100:.1f}%)", end="", flush=True)
 
+    print(f"\n{clash_api.semaphore.summary()}")
     return results
 
 async def proxy_clean():
@@ -2195,8 +2452,12 @@ async def proxy_clean():
     # 开始测试
     start_time = datetime.now()
 
+    # 跨运行的节点健康记录，按节点指纹查询
+    fingerprints = {p['name']: generate_proxy_fingerprint(p) for p in config.config.get('proxies') or []}
+    health_store = NodeHealthStore(scope=HEALTH_SCOPE)
+
     # 创建支持多端口的API实例
-    async with ClashAPI(CLASH_API_HOST, CLASH_API_PORTS, CLASH_API_SECRET) as clash_api:
+    async with ClashAPI(CLASH_API_HOST, CLASH_API_PORTS, CLASH_API_SECRET, health_store, fingerprints) as clash_api:
         if not await clash_api.check_connection():
             return
 
@@ -2308,7 +2569,7 @@ def extract_file_pattern(url):
     return None
 
 # 从GitHub API获取匹配指定后缀的文件名
-def get_github_filename(github_url, file_suffix):
+async def get_github_filename(fetcher, github_url, file_suffix):
     match = re.match(r'https://raw\.githubusercontent\.com/([^/]+)/([^/]+)/[^/]+/[^/]+/([^/]+)', github_url)
     if not match:
         raise ValueError("无法从URL中提取owner和repo信息")
@@ -2320,7 +2581,7 @@ def get_github_filename(github_url, file_suffix):
     path_part = re.sub(r'\{x\}' + re.escape(file_suffix) + '(?:/|$)', '', path_part)
     api_url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path_part}"
 
-    response = requests.get(api_url)
+    response = await fetcher.get(api_url)
     if response.status_code != 200:
         raise Exception(f"GitHub API请求失败: {response.status_code} {response.text}")
 
@@ -2367,7 +2628,7 @@ def parse_template(template_url, datetime_vars):
     return re.sub(r'\{([^}]+)\}', replace_template, template_url)
 
 # 完整解析模板URL
-def resolve_template_url(template_url):
+async def resolve_template_url(fetcher, template_url):
     # 先处理代理前缀
     url, proxy_prefix = strip_proxy_prefix(template_url)
 
@@ -2382,7 +2643,7 @@ def resolve_template_url(template_url):
         # 提取文件后缀
         file_suffix = extract_file_pattern(resolved_url)
         if file_suffix:
-            filename = get_github_filename(resolved_url, file_suffix)
+            filename = await get_github_filename(fetcher, resolved_url, file_suffix)
             # 替换 {x}<suffix> 为实际文件名
             resolved_url = re.sub(r'\{x\}' + re.escape(file_suffix), filename, resolved_url)
 
@@ -2559,7 +2820,7 @@ def work(links,check=False,allowed_types=[],only_check=False):
             finally:
                 print(f'关闭Clash API')
                 if clash_process is not None:
-                    clash_process.kill()
+                    clash_process.stop_background()
 
     except KeyboardInterrupt:
         print("\n用户中断执行")
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import base64
-import urllib.parse
 import json
 import re
 import yaml
@@ -12,6 +11,7 @@ import sys
 import requests
 import os
 from datetime import datetime
+from node_parser import parse_proxy_dict
 
 # Constants
 CONFIG_FILE = 'data/clash_config.yaml'
@@ -52,174 +52,6 @@ CLASH_CONFIG_TEMPLATE = {
 
 # --- 代理解析函数 ---
 
-def parse_hysteria2_link(link):
-    """Parses a Hysteria2 link."""
-    try:
-        parsed_url = urllib.parse.urlparse(link)
-        server = parsed_url.hostname
-        port = parsed_url.port
-        params = urllib.parse.parse_qs(parsed_url.query)
-        name = urllib.parse.unquote(parsed_url.fragment) if parsed_url.fragment else f"{server}:{port}"
-        password = parsed_url.username or params.get('password', [''])[0]
-        obfs = params.get('obfs', [''])[0]
-        alpn = params.get('alpn', [''])[0]
-        fast_open = params.get('fast-open', ['false'])[0].lower() == 'true'
-
-        return {
-            'name': name,
-            'type': 'hysteria2',
-            'server': server,
-            'port': port,
-            'password': password,
-            'obfs': obfs if obfs else None,
-            'alpn': [a.strip() for a in alpn.split(',')] if alpn else None,
-            'fast-open': fast_open,
-        }
-    except Exception as e:
-        print(f"Error parsing Hysteria2 link {link}: {e}")
-        return None
-
-def parse_ss_link(link):
-    """Parses a Shadowsocks link."""
-    try:
-        parsed_url = urllib.parse.urlparse(link)
-        encoded_userinfo = parsed_url.username
-        server = parsed_url.hostname
-        port = parsed_url.port
-        name = urllib.parse.unquote(parsed_url.fragment) if parsed_url.fragment else f"{server}:{port}"
-
-        method, password = None, None
-        if encoded_userinfo:
-            missing_padding = len(encoded_userinfo) % 4
-            if missing_padding: encoded_userinfo += '=' * (4 - missing_padding)
-            decoded_userinfo = base64.b64decode(encoded_userinfo).decode('utf-8')
-            method, password = decoded_userinfo.split(':', 1)
-            
-        return {
-            'name': name, 'type': 'ss', 'server': server, 'port': port,
-            'cipher': method, 'password': password,
-        }
-    except Exception as e:
-        print(f"Error parsing SS link {link}: {e}")
-        return None
-
-
-def parse_trojan_link(link):
-    """Parses a Trojan link."""
-    try:
-        parsed_url = urllib.parse.urlparse(link)
-        password = parsed_url.username
-        server = parsed_url.hostname
-        port = parsed_url.port
-        name = urllib.parse.unquote(parsed_url.fragment) if parsed_url.fragment else f"{server}:{port}"
-        params = urllib.parse.parse_qs(parsed_url.query)
-
-        sni = params.get('sni', [None])[0]
-        alpn = params.get('alpn', [None])[0]
-        allow_insecure = params.get('allowInsecure', ['0'])[0] 
-        skip_cert_verify = params.get('skip-cert-verify', ['false'])[0].lower() == 'true' or allow_insecure == '1'
-        
-        type_param = params.get('type', ['tcp'])[0]
-        host = params.get('host', [None])[0]
-        path = params.get('path', [None])[0]
-        
-        network_settings = {}
-        if type_param == 'ws':
-             network_settings = {
-                 'network': 'ws',
-                 'ws-path': path,
-                 'ws-headers': {'Host': host} if host else None
-             }
-
-        proxy_dict = {
-            'name': name, 'type': 'trojan', 'server': server, 'port': port, 'password': password,
-            'sni': sni if sni else None,
-            'alpn': [a.strip() for a in alpn.split(',')] if alpn else None,
-            'skip-cert-verify': skip_cert_verify,
-            **network_settings
-        }
-        return {k: v for k, v in proxy_dict.items() if v is not None}
-    except Exception as e:
-        print(f"Error parsing Trojan link {link}: {e}")
-        return None
-
-
-def parse_vless_link(link):
-    """Parses a VLESS link."""
-    try:
-        parsed_url = urllib.parse.urlparse(link)
-        uuid = parsed_url.username
-        server = parsed_url.hostname
-        port = parsed_url.port
-        name = urllib.parse.unquote(parsed_url.fragment) if parsed_url.fragment else f"{server}:{port}"
-        params = urllib.parse.parse_qs(parsed_url.query)
-
-        security = params.get('security', [None])[0]
-        sni = params.get('sni', [None])[0]
-        alpn = params.get('alpn', [None])[0]
-        type_param = params.get('type', ['tcp'])[0]
-        ws_path = params.get('path', [None])[0]
-        ws_headers_str = params.get('host', [None])[0]
-
-        tls_settings = {}
-        if security == 'tls' or security == 'xtls':
-             tls_settings = {
-                 'serverName': sni if sni else server,
-                 'sni': sni if sni else None,
-                 'alpn': [a.strip() for a in alpn.split(',')] if alpn else None,
-                 'skip-cert-verify': params.get('allowInsecure', ['0'])[0] == '1' 
-             }
-        
-        network_settings = {}
-        if type_param == 'ws':
-             network_settings = {'path': ws_path, 'headers': {'Host': ws_headers_str} if ws_headers_str else None}
-
-        proxy_dict = {
-            'name': name, 'type': 'vless', 'server': server, 'port': port, 'uuid': uuid, 
-            'encryption': params.get('encryption', ['none'])[0], 'network': type_param,
-            **tls_settings, **network_settings
-        }
-        return {k: v for k, v in proxy_dict.items() if v is not None}
-
-    except Exception as e:
-        print(f"Error parsing VLESS link {link}: {e}")
-        return None
-
-
-def parse_vmess_link(link):
-    """Parses a VMESS link."""
-    try:
-        if not link.startswith("vmess://"): return None
-        encoded_json = link[8:]
-        missing_padding = len(encoded_json) % 4
-        if missing_padding: encoded_json += '=' * (4 - missing_padding)
-
-        config = json.loads(base64.b64decode(encoded_json).decode('utf-8'))
-        
-        name = config.get('ps', f"{config.get('add')}:{config.get('port')}")
-        server = config.get('add')
-        port = config.get('port')
-        uuid = config.get('id')
-        alterId = config.get('aid', 0)
-        network = config.get('net', 'tcp')
-        tls = config.get('tls', '').lower() == 'tls'
-        
-        proxy_dict = {
-            'name': name, 'type': 'vmess', 'server': server, 'port': port, 
-            'uuid': uuid, 'alterId': alterId, 'cipher': config.get('scy', 'auto'),
-            'network': network, 'tls': tls, 
-            'skip-cert-verify': config.get('allowInsecure', 0) == 1,
-            'ws-path': config.get('path') if network == 'ws' else None,
-            'ws-headers': {'Host': config.get('host')} if network == 'ws' and config.get('host') else None,
-            'servername': config.get('sni') or (config.get('host') if network == 'ws' else None),
-        }
-
-        return {k: v for k, v in proxy_dict.items() if v is not None}
-
-    except Exception as e:
-        print(f"Error parsing VMESS link {link}: {e}")
-        return None
-
 def parse_ss_sub(link):
     """Parses a Shadowsocks subscription link (base64 encoded SS links)."""
     print(f"Parsing SS sub link: {link}")
@@ -234,7 +66,7 @@ def parse_ss_sub(link):
         decoded_content = base64.b64decode(content).decode('utf-8')
         ss_links = [line.strip() for line in decoded_content.splitlines() if line.strip()]
         
-        return [parse_ss_link(ss_link) for ss_link in ss_links if ss_link.startswith("ss://")]
+        return [parse_proxy_dict(ss_link) for ss_link in ss_links if ss_link.startswith("ss://")]
     except Exception as e:
         print(f"Error processing SS subscription link {link}: {e}")
         return []
@@ -256,14 +88,8 @@ def process_url(url):
         return []
 
 def parse_proxy_link(link):
-    """Parses a single proxy link based on its scheme."""
-    link = link.strip()
-    if link.startswith("ss://"): return parse_ss_link(link)
-    elif link.startswith("vmess://"): return parse_vmess_link(link)
-    elif link.startswith("vless://"): return parse_vless_link(link)
-    elif link.startswith("trojan://"): return parse_trojan_link(link)
-    elif link.startswith("hysteria2://"): return parse_hysteria2_link(link)
-    else: return None
+    """Parses a single proxy link via the shared node_parser module."""
+    return parse_proxy_dict(link)
 
 # --- 辅助功能函数 ---
 
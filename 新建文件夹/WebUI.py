@@ -9,10 +9,17 @@ import yaml
 import requests
 import json
 import glob
+import sys
+import importlib.util
 import streamlit.components.v1 as components
 
-# 导入ClashForge模块
-from ClashForge import (
+# 导入ClashForge模块：完整实现 (mihomo 监管、测速等) 在 "ClashForge (2).py" 中，文件名不是合法的模块名，按路径加载
+_CLASHFORGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ClashForge (2).py")
+if "clashforge" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location("clashforge", _CLASHFORGE_PATH)
+    sys.modules["clashforge"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["clashforge"])
+from clashforge import (
     generate_clash_config, merge_lists, switch_proxy,
     filter_by_types_alt, read_txt_files, read_yaml_files,
     start_clash, proxy_clean, kill_clash,
@@ -350,6 +357,9 @@ if "delays" not in st.session_state:
 # 自动启动Clash
 def is_clash_running():
     """检查Clash是否正在运行"""
+    # 由本页面启动的 Clash 直接读取监管器的健康状态
+    if st.session_state.get("clash_process") is not None:
+        return st.session_state.clash_process.health()["state"] == "ready"
     try:
         # 尝试访问Clash API来检查服务是否运行
         response = requests.get(f"http://127.0.0.1:9090/proxies", timeout=2)
@@ -370,10 +380,10 @@ def _start_clash(rerun=True):
                 st.error("启动Clash失败，请检查Clash程序是否存在")
 
 def _stop_clash(rerun=True):
-    """停止 Clash，首先尝试使用进程对象，如果失败则使用 PID"""
+    """停止 Clash，首先通过 start_clash 返回的 MihomoSupervisor 停止，失败时按 PID 登记表清理"""
     if st.session_state.clash_process:
         try:
-            st.session_state.clash_process.kill()
+            st.session_state.clash_process.stop_background()
             st.session_state.clash_process = None
             st.session_state.clash_running = False
             # print("Clash 已成功停止")
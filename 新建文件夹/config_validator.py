@@ -0,0 +1,246 @@
+# config_validator.py
+# mihomo 配置预校验：启动前在 Python 中按 mihomo 的解析规则一次性检查全部 proxies，剔除所有无效节点；
+# 仍无法通过时再用 mihomo -t (只解析配置、不启动) 二分定位剩余的问题节点，保证配置第一次启动就能加载成功。
+# 规则只覆盖 mihomo 确定会拒绝的情况，宁可漏判 (由二分兜底) 也不误删节点。
+
+import base64
+import binascii
+import json
+import os
+import re
+import subprocess
+import tempfile
+
+MIHOMO_TEST_TIMEOUT = 60   # 单次 mihomo -t 的超时 (秒)
+
+SUPPORTED_TYPES = {
+    "ss", "ssr", "vmess", "vless", "trojan", "hysteria", "hysteria2", "tuic", "wireguard",
+    "socks5", "http", "snell", "ssh", "mieru", "anytls", "direct", "dns",
+}
+SS_CIPHERS = {
+    "none", "dummy", "rc4-md5", "chacha20", "chacha20-ietf", "xchacha20", "chacha20-ietf-poly1305",
+    "xchacha20-ietf-poly1305", "chacha8-ietf-poly1305", "xchacha8-ietf-poly1305", "rabbit128-poly1305",
+    "aes-128-cfb", "aes-192-cfb", "aes-256-cfb", "aes-128-ctr", "aes-192-ctr", "aes-256-ctr",
+    "aes-128-gcm", "aes-192-gcm", "aes-256-gcm", "aes-128-ccm", "aes-192-ccm", "aes-256-ccm",
+    "aes-128-gcm-siv", "aes-256-gcm-siv", "aegis-128l", "aegis-256", "aez-384", "deoxys-ii-256-128",
+    "lea-128-gcm", "lea-192-gcm", "lea-256-gcm",
+    "2022-blake3-aes-128-gcm", "2022-blake3-aes-256-gcm", "2022-blake3-chacha20-poly1305",
+}
+# Shadowsocks 2022 的密码是 Base64 编码的定长密钥 (多用户时以冒号分隔)
+SS2022_KEY_SIZES = {"2022-blake3-aes-128-gcm": 16, "2022-blake3-aes-256-gcm": 32, "2022-blake3-chacha20-poly1305": 32}
+SS_PLUGINS = {"obfs", "v2ray-plugin", "shadow-tls", "restls", "gost-plugin", "kcptun"}
+SSR_OBFS = {"plain", "http_simple", "http_post", "random_head", "tls1.2_ticket_auth", "tls1.2_ticket_fastauth"}
+SSR_PROTOCOLS = {"origin", "auth_sha1_v4", "auth_aes128_md5", "auth_aes128_sha1", "auth_chain_a", "auth_chain_b"}
+VMESS_CIPHERS = {"", "auto", "none", "zero", "aes-128-gcm", "chacha20-poly1305"}
+VLESS_FLOWS = {"", "xtls-rprx-vision", "xtls-rprx-vision-udp443"}
+_SHORT_ID_PATTERN = re.compile(r"[0-9a-fA-F]{0,16}")
+_PROXY_INDEX_PATTERN = re.compile(r"proxy (\d+):")
+
+
+def _is_port(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    return isinstance(value, int) and 0 < value < 65536
+
+
+def _b64_key_size(value):
+    try:
+        return len(base64.b64decode(value + "=" * (-len(value) % 4), validate=True))
+    except (binascii.Error, ValueError):
+        return None
+
+
+def _check_ss(proxy):
+    cipher = str(proxy.get("cipher", "")).lower()
+    if cipher not in SS_CIPHERS:
+        return f"不支持的 ss cipher: {cipher}"
+    if proxy.get("password") is None:
+        return "缺少 password"
+    if cipher in SS2022_KEY_SIZES:
+        for key in str(proxy["password"]).split(":"):
+            if _b64_key_size(key) != SS2022_KEY_SIZES[cipher]:
+                return "ss 2022 密钥长度不符"
+    if proxy.get("plugin") and proxy["plugin"] not in SS_PLUGINS:
+        return f"不支持的 ss plugin: {proxy['plugin']}"
+    return None
+
+
+def _check_ssr(proxy):
+    cipher = str(proxy.get("cipher", "")).lower()
+    if cipher not in SS_CIPHERS or cipher.startswith("2022-"):
+        return f"不支持的 ssr cipher: {cipher}"
+    if proxy.get("obfs") not in SSR_OBFS:
+        return f"不支持的 ssr obfs: {proxy.get('obfs')}"
+    if proxy.get("protocol") not in SSR_PROTOCOLS:
+        return f"不支持的 ssr protocol: {proxy.get('protocol')}"
+    return None
+
+
+def _check_reality(proxy):
+    opts = proxy.get("reality-opts")
+    if not opts:
+        return None
+    if not isinstance(opts, dict):
+        return "reality-opts 格式错误"
+    public_key = str(opts.get("public-key", "")).replace("-", "+").replace("_", "/")
+    if _b64_key_size(public_key) != 32:
+        return "REALITY public-key 无效"
+    if not _SHORT_ID_PATTERN.fullmatch(str(opts.get("short-id", "") or "")):
+        return "REALITY short-id 无效"
+    return None
+
+
+def _check_vmess(proxy):
+    if not proxy.get("uuid"):
+        return "缺少 uuid"
+    if str(proxy.get("cipher", "") or "").lower() not in VMESS_CIPHERS:
+        return f"不支持的 vmess cipher: {proxy.get('cipher')}"
+    if proxy.get("alterId") not in (None, "") and not str(proxy["alterId"]).isdigit():
+        return "alterId 不是整数"
+    return _check_reality(proxy)
+
+
+def _check_vless(proxy):
+    if not proxy.get("uuid"):
+        return "缺少 uuid"
+    if str(proxy.get("flow", "") or "") not in VLESS_FLOWS:
+        return f"不支持的 vless flow: {proxy.get('flow')}"
+    return _check_reality(proxy)
+
+
+def _check_trojan(proxy):
+    if not proxy.get("password"):
+        return "缺少 password"
+    return _check_reality(proxy)
+
+
+def _check_wireguard(proxy):
+    if _b64_key_size(str(proxy.get("private-key", ""))) != 32:
+        return "wireguard private-key 无效"
+    return None
+
+
+_TYPE_CHECKS = {
+    "ss": _check_ss,
+    "ssr": _check_ssr,
+    "vmess": _check_vmess,
+    "vless": _check_vless,
+    "trojan": _check_trojan,
+    "wireguard": _check_wireguard,
+}
+# 这些类型可以只有 ports (端口跳跃) 而没有 port
+_PORT_RANGE_TYPES = {"hysteria", "hysteria2", "tuic"}
+
+
+def check_proxy(proxy):
+    """检查单个节点，返回 mihomo 会拒绝它的原因；看不出问题时返回 None。"""
+    if not isinstance(proxy, dict):
+        return "不是字典"
+    p_type = proxy.get("type")
+    if p_type not in SUPPORTED_TYPES:
+        return f"不支持的类型: {p_type}"
+    if p_type in ("direct", "dns"):
+        return None
+    if not proxy.get("server") or not isinstance(proxy["server"], str):
+        return "缺少 server"
+    if not _is_port(proxy.get("port")) and not (p_type in _PORT_RANGE_TYPES and proxy.get("ports")):
+        return f"端口无效: {proxy.get('port')}"
+    check = _TYPE_CHECKS.get(p_type)
+    return check(proxy) if check else None
+
+
+def validate_proxies(proxies):
+    """
+    一次遍历检查全部节点，返回 (有效节点列表, [(原下标, 节点名, 原因)])。
+    节点名为空或重复 (mihomo 要求节点名唯一) 同样视为无效，重复时保留第一个。
+    """
+    valid = []
+    rejected = []
+    seen_names = set()
+    for index, proxy in enumerate(proxies):
+        name = proxy.get("name") if isinstance(proxy, dict) else None
+        reason = check_proxy(proxy)
+        if reason is None and (name is None or str(name) == ""):
+            reason = "缺少 name"
+        elif reason is None and str(name) in seen_names:
+            reason = "节点名重复"
+        if reason is not None:
+            rejected.append((index, name, reason))
+            continue
+        seen_names.add(str(name))
+        valid.append(proxy)
+    return valid, rejected
+
+
+def prune_config(config, valid_proxies):
+    """用 valid_proxies 替换 config 的 proxies，并从所有策略组中删除已不存在的节点引用 (组为空时补 DIRECT)。"""
+    removed = {str(p.get("name")) for p in config.get("proxies", []) if isinstance(p, dict)} - {str(p["name"]) for p in valid_proxies}
+    config["proxies"] = valid_proxies
+    for group in config.get("proxy-groups", []):
+        if removed and isinstance(group.get("proxies"), list):
+            group["proxies"] = [name for name in group["proxies"] if name not in removed]
+        if not group.get("proxies") and not group.get("use"):
+            group["proxies"] = ["DIRECT"]
+    return config
+
+
+def mihomo_config_tester(clash_binary):
+    """
+    返回 test(config) -> (是否通过, 输出)：把配置写入临时文件后执行 mihomo -t。
+    只关心节点能否解析，规则替换为 MATCH,DIRECT，避免 GEOIP 等规则去下载地理数据库。
+    """
+    def test(config):
+        config = dict(config, rules=["MATCH,DIRECT"])
+        fd, path = tempfile.mkstemp(suffix=".json", prefix="mihomo-test-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(config, f, ensure_ascii=False)
+            try:
+                result = subprocess.run([clash_binary, "-t", "-f", path], capture_output=True, text=True,
+                                        encoding="utf-8", errors="replace", timeout=MIHOMO_TEST_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                return False, "mihomo -t 超时"
+            return result.returncode == 0, result.stdout + result.stderr
+        finally:
+            os.remove(path)
+    return test
+
+
+def bisect_invalid_proxies(config, test):
+    """
+    用 test (见 mihomo_config_tester) 找出 mihomo 仍会拒绝的节点，返回这些节点的名称集合。
+    错误信息带 proxy 下标时直接定位；否则把节点一分为二分别测试，k 个坏节点约需 k·log2(n) 次测试。
+    只保留 proxies 为空的配置都无法通过时说明问题不在节点上，返回 None。
+    """
+    def subset(proxies):
+        # 浅拷贝即可：prune_config 只会替换 proxies 和各组的 proxies 列表，不修改原对象
+        return prune_config(dict(config, **{"proxy-groups": [dict(g) for g in config.get("proxy-groups", [])]}), proxies)
+
+    if not test(subset([]))[0]:
+        return None
+
+    bad = set()
+
+    def search(proxies):
+        while proxies:
+            ok, output = test(subset(proxies))
+            if ok:
+                return
+            if len(proxies) == 1:
+                bad.add(str(proxies[0]["name"]))
+                return
+            match = _PROXY_INDEX_PATTERN.search(output)
+            if match and int(match.group(1)) < len(proxies):
+                index = int(match.group(1))
+                bad.add(str(proxies[index]["name"]))
+                proxies = proxies[:index] + proxies[index + 1:]
+                continue
+            middle = len(proxies) // 2
+            search(proxies[:middle])
+            search(proxies[middle:])
+            return
+
+    search(list(config.get("proxies", [])))
+    return bad
@@ -1,259 +1,38 @@
 import requests
 import base64
 import os
-import json
-import re
 import yaml
-from urllib.parse import urlparse, parse_qs, unquote
-import hashlib
 import socket
 import time
 import concurrent.futures
+from node_parser import generate_proxy_fingerprint
+from node_health import NodeHealthStore
+from dns_cache import pre_resolve
+from http_cache import HttpCache
+from parse_cache import ParseCache
+from subscription_stream import iter_subscription_proxies, STREAM_CHUNK_SIZE
 
 # --- 🎯 配置常量 ---
-# 直接将链接硬编码到脚本中
-SUBSCRIPTION_URL = "https://raw.githubusercontent.com/qjlxg/pin/refs/heads/main/trojan_links.txt"
+# 直接将链接硬编码到脚本中；使用 generate_config.py 按上次测试延迟排序、并已剔除连续失效域名的列表
+SUBSCRIPTION_URL = "https://raw.githubusercontent.com/qjlxg/pin/refs/heads/main/trojan_links.ranked.txt"
+# 排序列表尚未生成 (还没有测试结果可供排序) 或为空时回退到未排序的完整列表
+SUBSCRIPTION_FALLBACKS = {
+    SUBSCRIPTION_URL: "https://raw.githubusercontent.com/qjlxg/pin/refs/heads/main/trojan_links.txt",
+}
 OUTPUT_YAML_FILE = "base64.yaml"
 OUTPUT_BASE64_FILE = "base64.txt"
 
 MAX_WORKERS_CONNECTIVITY_TEST = 30
+# 整段订阅正文的解析结果在解析缓存 (见 parse_cache.py) 中的 kind，按正文的 sha256 存取
+PAYLOAD_CACHE_KIND = "payload"
+# 跨运行的节点健康记录 (见 node_health.py)，TCP 检测结果单独使用一个 scope
+HEALTH_SCOPE = "tcp"
 EXCLUDE_KEYWORDS = [
     "cdn.jsdelivr.net", "statically.io", "googletagmanager.com",
     "www.w3.org", "fonts.googleapis.com", "schemes.ogf.org", "clashsub.net",
     "t.me", "api.w.org",
 ]
 
-# --- Proxy Parsing Functions ---
-def generate_proxy_fingerprint(proxy_data):
-    """
-    根据代理的核心连接信息生成一个唯一的哈希指纹。
-    修正：为 Vmess/Trojan 添加 servername (SNI) 以区分同一服务器下的不同节点。
-    """
-    try:
-        p_type = str(proxy_data.get('type', '')).lower()
-        server = str(proxy_data.get('server', ''))
-        port = str(proxy_data.get('port', ''))
-
-        fingerprint_parts = [p_type, server, port]
-
-        if p_type == 'vmess':
-            fingerprint_parts.append(str(proxy_data.get('uuid', '')))
-            fingerprint_parts.append(str(proxy_data.get('alterId', '')))
-            # --- 修正 1：添加 servername ---
-            if proxy_data.get('servername'):
-                 fingerprint_parts.append(str(proxy_data['servername']))
-        elif p_type == 'trojan':
-            fingerprint_parts.append(str(proxy_data.get('password', '')))
-            # --- 修正 1：添加 servername ---
-            if proxy_data.get('servername'):
-                 fingerprint_parts.append(str(proxy_data['servername']))
-        elif p_type == 'ss':
-            fingerprint_parts.append(str(proxy_data.get('password', '')))
-            fingerprint_parts.append(str(proxy_data.get('cipher', '')))
-        elif p_type == 'hysteria2':
-            fingerprint_parts.append(str(proxy_data.get('password', '')))
-
-        unique_string = "_".join(fingerprint_parts)
-        return hashlib.md5(unique_string.encode('utf-8')).hexdigest()
-    except Exception as e:
-        # print(f"Error generating fingerprint for proxy: {proxy_data}, reason: {e}")
-        return None
-
-def parse_vmess(vmess_url):
-    try:
-        json_str = base64.b64decode(vmess_url[8:]).decode('utf-8')
-        config = json.loads(json_str)
-
-        name = config.get('ps', f"Vmess-{config.get('add')}")
-        server = config.get('add')
-        port = config.get('port')
-        uuid = config.get('id')
-        alterId = config.get('aid', 0)
-        cipher = config.get('scy', 'auto')
-        network = config.get('net', 'tcp')
-        tls = config.get('tls', '') == 'tls'
-        servername = config.get('sni', config.get('host', '')) if tls else ''
-        skip_cert_verify = config.get('skip-cert-verify', False)
-
-        proxy = {
-            'name': name,
-            'type': 'vmess',
-            'server': server,
-            'port': port,
-            'uuid': uuid,
-            'alterId': alterId,
-            'cipher': cipher,
-            'network': network,
-            'tls': tls,
-        }
-
-        if servername:
-            proxy['servername'] = servername
-        if skip_cert_verify:
-            proxy['skip-cert-verify'] = True
-            
-        # 修正：VMess的WebSocket/gRPC配置需要转换成Clash格式
-        if network == 'ws' and 'path' in config:
-            proxy['ws-opts'] = {'path': config.get('path', '/')}
-            if config.get('host'):
-                proxy['ws-opts']['headers'] = {'Host': config['host']}
-        
-        if network == 'grpc':
-            proxy['grpc-opts'] = {'grpc-service-name': config.get('path', '')}
-            
-        return proxy
-    except Exception as e:
-        # print(f"解析 Vmess 链接失败: {vmess_url[:50]}...，原因: {e}")
-        return None
-
-def parse_trojan(trojan_url):
-    try:
-        parsed = urlparse(trojan_url)
-        password = parsed.username
-        server = parsed.hostname
-        port = parsed.port
-        name = unquote(parsed.fragment) if parsed.fragment else f"Trojan-{server}"
-
-        params = parse_qs(parsed.query)
-        tls = True
-        skip_cert_verify = params.get('allowInsecure', ['0'])[0] == '1'
-        servername = params.get('sni', [server])[0]
-        
-        # --- 修正 2：添加 WebSocket/gRPC 解析 ---
-        network = params.get('type', ['tcp'])[0] # 提取网络类型
-        
-        proxy = {
-            'name': name,
-            'type': 'trojan',
-            'server': server,
-            'port': port,
-            'password': password,
-            'tls': tls,
-            'network': network, # 添加网络类型
-        }
-        
-        if servername:
-            proxy['servername'] = servername
-        if skip_cert_verify:
-            proxy['skip-cert-verify'] = True
-            
-        if network == 'ws':
-            ws_path = params.get('path', ['/'])[0]
-            ws_host = params.get('host', [servername])[0] # 默认使用 SNI 作为 Host
-            proxy['ws-opts'] = {
-                'path': unquote(ws_path),
-                'headers': {
-                    'Host': ws_host
-                }
-            }
-        
-        if network == 'grpc':
-            proxy['grpc-opts'] = {'grpc-service-name': params.get('path', [''])[0]}
-        # --- 修正 2 结束 ---
-
-        return proxy
-    except Exception as e:
-        # print(f"解析 Trojan 链接失败: {trojan_url[:50]}...，原因: {e}")
-        return None
-
-# parse_shadowsocks, parse_hysteria2, test_tcp_connectivity, _parse_single_proxy_link, 
-# _try_parse_yaml_proxies, _try_parse_v2rayn_json_proxies, _parse_proxies_from_decoded_text
-# 及其余代码保持不变 (为简洁省略，请在您的实际脚本中保留它们)
-
-def parse_shadowsocks(ss_url):
-    try:
-        encoded_part = ss_url[5:]
-        name = "Shadowsocks"
-        plugin_info_str = ""
-
-        if '#' in encoded_part:
-            encoded_part, fragment = encoded_part.split('#', 1)
-            name = unquote(fragment)
-
-        if '/?plugin=' in encoded_part:
-            encoded_part, plugin_info_str = encoded_part.split('/?plugin=', 1)
-            plugin_info_str = unquote(plugin_info_str)
-
-        missing_padding = len(encoded_part) % 4
-        if missing_padding:
-            encoded_part += '=' * (4 - missing_padding)
-
-        try:
-            decoded_bytes = base64.urlsafe_b64decode(encoded_part)
-            try:
-                decoded_str = decoded_bytes.decode('utf-8')
-            except UnicodeDecodeError:
-                decoded_str = decoded_bytes.decode('latin-1', errors='ignore')
-                # print(f"    Warning: Shadowsocks link decoded to non-UTF-8 characters, using latin-1 for {ss_url[:50]}...")
-
-            parts = decoded_str.split('@', 1)
-            if len(parts) != 2:
-                raise ValueError(f"Invalid format after base64 decoding: Missing '@' separator or incorrect structure.")
-
-            method_password = parts[0]
-            method_password_parts = method_password.split(':', 1)
-            if len(method_password_parts) != 2:
-                raise ValueError(f"Invalid method:password format: '{method_password}'")
-            method = method_password_parts[0]
-            password = method_password_parts[1]
-
-            server_port_and_tail = parts[1]
-            clean_server_port_match = re.match(r'^[\w\d\.\-]+\:(\d+)', server_port_and_tail)
-            if clean_server_port_match:
-                server = server_port_and_tail.split(':')[0]
-                port = int(clean_server_port_match.group(1))
-            else:
-                raise ValueError(f"Invalid server:port format in: '{server_port_and_tail}'")
-
-            proxy = {
-                'name': name,
-                'type': 'ss',
-                'server': server,
-                'port': port,
-                'cipher': method,
-                'password': password,
-            }
-            if plugin_info_str:
-                proxy['plugin-info'] = plugin_info_str
-            return proxy
-        except base64.binascii.Error as b64_err:
-            raise ValueError(f"Base64 decoding error: {b64_err}")
-    except Exception as e:
-        # print(f"解析 Shadowsocks 链接失败: {ss_url[:100]}...，原因: {e}")
-        return None
-
-def parse_hysteria2(hy2_url):
-    try:
-        parsed = urlparse(hy2_url)
-        uuid = parsed.username
-        server = parsed.hostname
-        port = parsed.port
-        name = unquote(parsed.fragment) if parsed.fragment else f"Hysteria2-{server}"
-
-        params = parse_qs(parsed.query)
-        tls = params.get('security', [''])[0].lower() == 'tls'
-        servername = params.get('sni', [''])[0]
-        skip_cert_verify = params.get('insecure', ['0'])[0] == '1'
-        fast_open = params.get('fastopen', ['0'])[0] == '1'
-
-        proxy = {
-            'name': name,
-            'type': 'hysteria2',
-            'server': server,
-            'port': port,
-            'password': uuid,
-            'tls': tls,
-            'skip-cert-verify': skip_cert_verify,
-            'fast-open': fast_open,
-        }
-        if servername:
-            proxy['servername'] = servername
-        if params.get('alpn'):
-            proxy['alpn'] = ','.join(params['alpn'])
-        return proxy
-    except Exception as e:
-        # print(f"解析 Hysteria2 链接失败: {hy2_url[:50]}...，原因: {e}")
-        return None
 # --- Connectivity Test Function (保持不变) ---
 def test_tcp_connectivity(server, port, timeout=1, retries=1, delay=0.5):
     for i in range(retries + 1):
@@ -269,79 +48,49 @@ def test_tcp_connectivity(server, port, timeout=1, retries=1, delay=0.5):
             return False
     return False
 
-# --- Subscription Parsing Helper Functions (保持不变) ---
-def _parse_single_proxy_link(line):
-    """Helper function to parse a single proxy link string."""
-    line = line.strip()
-    if line.startswith("vmess://"):
-        return parse_vmess(line)
-    elif line.startswith("trojan://"):
-        return parse_trojan(line)
-    elif line.startswith("ss://"):
-        return parse_shadowsocks(line)
-    elif line.startswith("hysteria2://"):
-        return parse_hysteria2(line)
-    return None
-
-def _try_parse_yaml_proxies(text):
-    try:
-        data = yaml.safe_load(text)
-        if isinstance(data, dict) and 'proxies' in data and isinstance(data['proxies'], list):
-            return data['proxies']
-        elif isinstance(data, list) and all(isinstance(item, dict) and 'type' in item for item in data):
-            return data
-        return None
-    except yaml.YAMLError:
-        return None
-
-def _try_parse_v2rayn_json_proxies(text):
-    try:
-        data = json.loads(text)
-        if isinstance(data, list) and all(isinstance(item, dict) and 'v' in item and 'ps' in item for item in data):
-            parsed_list = []
-            for node in data:
-                vmess_link = f"vmess://{base64.b64encode(json.dumps(node).encode('utf-8')).decode('utf-8')}"
-                p = parse_vmess(vmess_link)
-                if p:
-                    parsed_list.append(p)
-            return parsed_list
-        return None
-    except json.JSONDecodeError:
-        return None
+def _decorate_proxy_name(proxy_dict):
+    """在节点名后附加短指纹，保证去重后的节点名称唯一。"""
+    original_name = proxy_dict.get('name', f"{proxy_dict.get('type', 'UNKNOWN').upper()}-{proxy_dict.get('server', 'unknown')}")
+    # 修正 4：确保为去重后的节点重新生成指纹，以添加到名称中
+    short_fingerprint = generate_proxy_fingerprint(proxy_dict)[:6]
+    max_name_len = 50
 
-def _parse_proxies_from_decoded_text(decoded_text, url_for_logging):
-    """
-    Tries to parse proxies from decoded text content.
-    Attempts YAML, then V2RayN JSON, then line-by-line.
-    Returns a list of parsed proxy dicts, or an empty list if none found.
-    """
-    proxies = []
-
-    yaml_proxies = _try_parse_yaml_proxies(decoded_text)
-    if yaml_proxies:
-        print(f"  --- URL: {url_for_logging} Identified as YAML subscription, found {len(yaml_proxies)} proxies ---")
-        return yaml_proxies
-
-    json_node_proxies = _try_parse_v2rayn_json_proxies(decoded_text)
-    if json_node_proxies:
-        print(f"  --- URL: {url_for_logging} Identified as V2RayN JSON node list, found {len(json_node_proxies)} proxies ---")
-        return json_node_proxies
+    if len(original_name) > max_name_len - (len(short_fingerprint) + 1):
+        display_name = original_name[:max_name_len - (len(short_fingerprint) + 4)] + "..."
+    else:
+        display_name = original_name
 
-    lines = decoded_text.split('\n')
-    parsed_line_count = 0
-    for line in lines:
-        proxy = _parse_single_proxy_link(line)
-        if proxy:
-            proxies.append(proxy)
-            parsed_line_count += 1
+    proxy_dict['name'] = f"{display_name}-{short_fingerprint}"
+    return proxy_dict
 
-    if parsed_line_count > 0:
-        print(f"  --- URL: {url_for_logging} Identified as plaintext, {parsed_line_count} proxy nodes parsed ---")
+# --- Fetch and Decode URLs (保持不变) ---
+def fetch_url_proxies(url, http_cache, parse_cache):
+    """下载并解析一个订阅链接，返回代理字典列表；请求失败时抛出 requests 异常。"""
+    # 正文边下载边写入 HTTP 缓存并计算哈希，不在内存中持有完整正文 (304 时直接使用缓存的正文)
+    with requests.get(url, timeout=20, headers=http_cache.request_headers(url), stream=True) as response:
+        status_code, digest = http_cache.spool_response(
+            url, response.status_code, response.headers, response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+        if status_code != 200:
+            response.raise_for_status()
+            return []
+
+    # 正文与以前见过的完全相同 (不论来自哪个链接、有无 ETag) 时直接复用整段的解析结果
+    hit, proxies = parse_cache.get(PAYLOAD_CACHE_KIND, digest)
+    if hit:
+        print(f"  --- URL: {url} Content seen before, reusing {len(proxies)} cached proxies ---")
+        return proxies
+    # 流式解析 (见 subscription_stream.py)
+    formats = []
+    proxies = list(iter_subscription_proxies(http_cache.iter_body(url), parse_cache, formats))
+    print(f"  --- URL: {url} Format: {' -> '.join(formats)}, {len(proxies)} proxies parsed ---")
+    parse_cache.put(PAYLOAD_CACHE_KIND, digest, proxies)
     return proxies
 
-# --- Fetch and Decode URLs (保持不变) ---
+
 def fetch_and_decode_urls_to_clash_proxies(urls, enable_connectivity_test=True):
     all_raw_proxies = []
+    http_cache = HttpCache()
+    parse_cache = ParseCache()
 
     for url_idx, url in enumerate(urls):
         url = url.strip()
@@ -353,80 +102,29 @@ def fetch_and_decode_urls_to_clash_proxies(urls, enable_connectivity_test=True):
             continue
 
         print(f"Processing URL ({url_idx + 1}/{len(urls)}): {url}")
-        current_proxies_from_url = []
 
-        try:
-            response = requests.get(url, timeout=20)
-            response.raise_for_status()
-            content = response.content
-            print(f"  --- URL: {url} Downloaded content size: {len(content)} bytes ---")
-
-            decoded_successfully = False
+        current_proxies_from_url = []
+        for source_url in (url, SUBSCRIPTION_FALLBACKS.get(url)):
+            if not source_url or current_proxies_from_url:
+                break
+            if source_url != url:
+                print(f"  --- URL: {url} 不可用或为空，回退到 {source_url} ---")
             try:
-                decoded_content_utf8 = content.decode('utf-8')
-                decoded_successfully = True
-
-                proxies_from_utf8 = _parse_proxies_from_decoded_text(decoded_content_utf8, url)
-                if proxies_from_utf8:
-                    current_proxies_from_url.extend(proxies_from_utf8)
-                else:
-                    stripped_content = decoded_content_utf8.strip()
-                    if len(stripped_content) > 0 and (len(stripped_content) % 4 == 0 or '=' not in stripped_content) and re.fullmatch(r'[A-Za-z0-9+/=]*', stripped_content):
-                        try:
-                            missing_padding = len(stripped_content) % 4
-                            if missing_padding:
-                                stripped_content += '=' * (4 - missing_padding)
-
-                            decoded_from_base64_in_utf8 = base64.b64decode(stripped_content).decode('utf-8')
-                            print(f"  --- URL: {url} Content (originally UTF-8) was Base64, re-decoding and parsing ---")
-                            proxies_from_b64_in_utf8 = _parse_proxies_from_decoded_text(decoded_from_base64_in_utf8, url)
-                            if proxies_from_b64_in_utf8:
-                                current_proxies_from_url.extend(proxies_from_b64_in_utf8)
-                        except (base64.binascii.Error, UnicodeDecodeError) as e_b64_utf8:
-                            # print(f"  --- URL: {url} Looked like Base64 (in UTF-8 text) but failed to decode/parse: {e_b64_utf8} ---")
-                            pass
-                        except Exception as e_generic_b64_utf8:
-                            # print(f"  --- URL: {url} Unexpected error during Base64 (in UTF-8 text) processing: {e_generic_b64_utf8} ---")
-                            pass
-            except UnicodeDecodeError:
-                # print(f"  --- URL: {url} UTF-8 decoding failed. Will try direct Base64. ---")
-                pass
-
-            if not current_proxies_from_url:
-                try:
-                    cleaned_byte_content = content.strip()
-                    try:
-                        b64_text_equivalent = cleaned_byte_content.decode('ascii')
-                    except UnicodeDecodeError:
-                        b64_text_equivalent = cleaned_byte_content.decode('latin-1', errors='ignore')
-
-                    missing_padding = len(b64_text_equivalent) % 4
-                    if missing_padding:
-                        cleaned_byte_content += b'=' * (4 - missing_padding)
-
-                    decoded_content_b64 = base64.b64decode(cleaned_byte_content).decode('utf-8')
-                    proxies_from_b64 = _parse_proxies_from_decoded_text(decoded_content_b64, url)
-                    if proxies_from_b64:
-                        current_proxies_from_url.extend(proxies_from_b64)
-                except (base64.binascii.Error, UnicodeDecodeError) as b64_err:
-                    if not decoded_successfully:
-                        # print(f"  --- URL: {url} Direct Base64 decoding or subsequent UTF-8 conversion failed: {b64_err} ---")
-                        pass
-                except Exception as e_b64_direct:
-                    # print(f"  --- URL: {url} Unexpected error during direct Base64 processing: {e_b64_direct} ---")
-                    pass
-
-            if current_proxies_from_url:
-                all_raw_proxies.extend(current_proxies_from_url)
-                print(f"  +++ URL: {url} Successfully parsed {len(current_proxies_from_url)} proxies. +++")
-            else:
-                content_snippet = content[:100].decode('latin-1', errors='ignore')
-                print(f"  --- URL: {url} No proxies successfully parsed from this URL. Content snippet (latin-1, first 100 chars): '{content_snippet}' ---")
-
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to fetch data from URL: {url}, reason: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred while processing URL {url}: {e}")
+                current_proxies_from_url = fetch_url_proxies(source_url, http_cache, parse_cache)
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to fetch data from URL: {source_url}, reason: {e}")
+            except Exception as e:
+                print(f"An unexpected error occurred while processing URL {source_url}: {e}")
+
+        if current_proxies_from_url:
+            all_raw_proxies.extend(current_proxies_from_url)
+            print(f"  +++ URL: {url} Successfully parsed {len(current_proxies_from_url)} proxies. +++")
+        else:
+            print(f"  --- URL: {url} No proxies successfully parsed from this URL. ---")
+
+    http_cache.save()
+    parse_cache.close()
+    print(f"HTTP 缓存: {http_cache.hits} 个订阅源未变化 (304)；解析缓存: 命中 {parse_cache.hits} 条，新解析 {parse_cache.misses} 条")
 
     # --- Deduplication and Connectivity Test (Parallelized) ---
     unique_proxies_for_test = {}
@@ -443,55 +141,65 @@ def fetch_and_decode_urls_to_clash_proxies(urls, enable_connectivity_test=True):
     final_filtered_proxies = []
 
     if enable_connectivity_test:
-        print(f"\n开始并行连通性测试，共 {len(proxies_to_test_list)} 个唯一代理...")
+        health_store = NodeHealthStore(scope=HEALTH_SCOPE)
+        health_records = health_store.lookup(unique_proxies_for_test.keys())
+        # TCP 连通性只与 server:port 有关：按端点分组，每个端点只连接一次，结果分发给组内所有节点
+        endpoint_groups = {}
+        cached_alive = cached_dead = 0
+        candidates = []
+        for fingerprint, p in unique_proxies_for_test.items():
+            if not p.get('server') or p.get('port') is None:
+                continue
+            verdict = NodeHealthStore.cached_verdict(health_records.get(fingerprint))
+            if verdict is not None:
+                # 近期检测过：健康的直接保留，持续失效且仍在退避期内的直接跳过
+                if verdict[0]:
+                    cached_alive += 1
+                    final_filtered_proxies.append(_decorate_proxy_name(p))
+                else:
+                    cached_dead += 1
+                continue
+            candidates.append((fingerprint, p, str(p.get('sni') or p.get('servername') or '')))
+
+        # DNS 预解析 (见 dns_cache.py)：server 或 SNI 为 NXDOMAIN 的节点不再做连接测试，其余节点直接连接解析出的 IP
+        dns = pre_resolve({str(p['server']) for _, p, _ in candidates} | {sni for _, _, sni in candidates if sni})
+        nxdomain_dropped = 0
+        for fingerprint, p, sni in candidates:
+            if dns.is_nxdomain(str(p['server'])) or (sni and dns.is_nxdomain(sni)):
+                nxdomain_dropped += 1
+                health_store.record(fingerprint, False)
+                continue
+            endpoint_groups.setdefault((p['server'], p['port']), []).append(p)
+        print(f"\n健康记录命中: 沿用可用 {cached_alive} 个，退避跳过 {cached_dead} 个；NXDOMAIN 剔除 {nxdomain_dropped} 个")
+        print(f"开始并行连通性测试，共 {sum(len(g) for g in endpoint_groups.values())} 个唯一代理，{len(endpoint_groups)} 个唯一端点...")
         with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS_CONNECTIVITY_TEST) as executor:
-            future_to_proxy = {
-                executor.submit(test_tcp_connectivity, p['server'], p['port']): p
-                for p in proxies_to_test_list if p.get('server') and p.get('port') is not None
+            future_to_endpoint = {
+                executor.submit(test_tcp_connectivity, dns.lookup_ip(str(server)) or server, port): (server, port)
+                for server, port in endpoint_groups
             }
             processed_count = 0
-            total_testable_proxies = len(future_to_proxy)
+            total_testable_endpoints = len(future_to_endpoint)
 
-            for future in concurrent.futures.as_completed(future_to_proxy):
-                proxy_dict = future_to_proxy[future]
-                server = proxy_dict.get('server')
-                port = proxy_dict.get('port')
+            for future in concurrent.futures.as_completed(future_to_endpoint):
+                server, port = future_to_endpoint[future]
                 processed_count += 1
                 try:
                     is_reachable = future.result()
-                    if is_reachable:
-                        original_name = proxy_dict.get('name', f"{proxy_dict.get('type', 'UNKNOWN').upper()}-{proxy_dict.get('server', 'unknown')}")
-                        # 修正 4：确保为去重后的节点重新生成指纹，以添加到名称中
-                        short_fingerprint = generate_proxy_fingerprint(proxy_dict)[:6] 
-                        max_name_len = 50
-
-                        if len(original_name) > max_name_len - (len(short_fingerprint) + 1):
-                            display_name = original_name[:max_name_len - (len(short_fingerprint) + 4)] + "..."
-                        else:
-                            display_name = original_name
-
-                        proxy_dict['name'] = f"{display_name}-{short_fingerprint}"
-                        final_filtered_proxies.append(proxy_dict)
                 except Exception as exc:
                     # print(f"  连通性测试 {server}:{port} 时发生异常: {exc}")
-                    pass
+                    is_reachable = False
+                for proxy_dict in endpoint_groups[(server, port)]:
+                    health_store.record(generate_proxy_fingerprint(proxy_dict), is_reachable)
+                    if is_reachable:
+                        final_filtered_proxies.append(_decorate_proxy_name(proxy_dict))
 
-                if processed_count % 50 == 0 or processed_count == total_testable_proxies:
-                    print(f"    进度: 已测试 {processed_count}/{total_testable_proxies} 个代理...")
+                if processed_count % 50 == 0 or processed_count == total_testable_endpoints:
+                    print(f"    进度: 已测试 {processed_count}/{total_testable_endpoints} 个端点...")
+        health_store.close()
     else:
         print("跳过连通性测试 (已禁用)。所有解析出的唯一代理将被添加。")
         for proxy_dict in proxies_to_test_list:
-            original_name = proxy_dict.get('name', f"{proxy_dict.get('type', 'UNKNOWN').upper()}-{proxy_dict.get('server', 'unknown')}")
-            short_fingerprint = generate_proxy_fingerprint(proxy_dict)[:6]
-            max_name_len = 50
-
-            if len(original_name) > max_name_len - (len(short_fingerprint) + 1):
-                display_name = original_name[:max_name_len - (len(short_fingerprint) + 4)] + "..."
-            else:
-                display_name = original_name
-
-            proxy_dict['name'] = f"{display_name}-{short_fingerprint}"
-            final_filtered_proxies.append(proxy_dict)
+            final_filtered_proxies.append(_decorate_proxy_name(proxy_dict))
 
     print(f"Successfully parsed, deduplicated, tested, and aggregated {len(final_filtered_proxies)} unique and reachable proxy nodes.")
     # 返回成功的代理列表和空的 URL 列表（因为我们不再更新 URL 文件）
@@ -0,0 +1,226 @@
+# dns_cache.py
+# 离线 DNS 预解析：在连接测试之前，用有并发上限的异步 UDP 解析器批量解析节点的 server/SNI 域名，
+# 结果带 TTL 写入 JSON 缓存 (域名 → IP，与 hosts 文件等价)，可直接生成 mihomo 配置中的 hosts: 段。
+# NXDOMAIN 的域名同样缓存 (负缓存)，测试脚本据此在任何连接测试之前剔除节点。
+
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import struct
+import time
+
+DNS_CACHE_PATH = os.environ.get("NODE_DNS_CACHE", "dns_cache.json")
+# 上游 DNS 服务器，逗号分隔，可带端口 (例如本地测试桩 127.0.0.1:5353)
+DNS_SERVERS = [s.strip() for s in os.environ.get("NODE_DNS_SERVERS", "1.1.1.1,8.8.8.8").split(",") if s.strip()]
+DNS_CONCURRENCY = 100      # 同时进行的查询数上限
+DNS_TIMEOUT = 2            # 单次查询超时 (秒)
+DNS_RETRIES = 2            # 每个域名最多查询几次 (依次轮换上游服务器)
+DNS_MIN_TTL = 60           # TTL 下限 (秒)，避免过短的 TTL 让缓存失去意义
+DNS_MAX_TTL = 24 * 3600    # TTL 上限 (秒)
+DNS_NEGATIVE_TTL = 3600    # NXDOMAIN 结果的缓存时长 (秒)
+# 劫持或故障的解析器可能对所有域名都返回 NXDOMAIN：有结果的域名中 NXDOMAIN 占比超过该值 (且样本足够) 时整体作废
+DNS_NXDOMAIN_SANITY_RATIO = 0.9
+DNS_NXDOMAIN_SANITY_MIN = 20
+
+STATUS_OK = "ok"               # 有 A 记录
+STATUS_EMPTY = "empty"         # 域名存在但没有 A 记录
+STATUS_NXDOMAIN = "nxdomain"   # 域名不存在
+
+_TYPE_A = 1
+_RCODE_NXDOMAIN = 3
+
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _parse_server(server):
+    host, _, port = server.rpartition(":") if server.count(":") == 1 else (server, "", "")
+    return (host, int(port)) if port else (server, 53)
+
+
+def build_query(domain, query_id):
+    """构造 A 记录查询报文 (RD=1)。"""
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(bytes([len(label)]) + label for label in (l.encode("ascii") for l in domain.split("."))) + b"\0"
+    return header + qname + struct.pack("!HH", _TYPE_A, 1)
+
+
+def _skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+
+
+def parse_response(data, query_id):
+    """解析应答报文，返回 (rcode, [IP], 最小 TTL)；报文 ID 不匹配或格式错误时抛出 ValueError。"""
+    if len(data) < 12:
+        raise ValueError("应答报文过短")
+    response_id, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+    if response_id != query_id:
+        raise ValueError("应答 ID 不匹配")
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_name(data, offset) + 4
+    ips = []
+    ttl = None
+    for _ in range(ancount):
+        offset = _skip_name(data, offset)
+        rtype, _, rttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        if rtype == _TYPE_A and rdlength == 4:
+            ips.append(".".join(str(b) for b in data[offset:offset + 4]))
+            ttl = rttl if ttl is None else min(ttl, rttl)
+        offset += rdlength
+    return flags & 0x000F, ips, ttl
+
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, future):
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class DnsCache:
+    """
+    带 TTL 的域名解析缓存。records 为 {域名: {"status", "ips", "expires"}}；
+    查询失败 (超时、SERVFAIL) 不写入缓存，下次运行重新解析。
+    """
+
+    def __init__(self, path=DNS_CACHE_PATH, servers=None):
+        self.path = path
+        self.servers = [_parse_server(s) for s in (servers or DNS_SERVERS)]
+        self.records = self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 读取 DNS 缓存 {self.path} 失败，将重新解析: {e}", flush=True)
+            return {}
+        now = time.time()
+        return {domain: r for domain, r in records.items() if r.get("expires", 0) > now}
+
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        records = {domain: r for domain, r in self.records.items() if r["expires"] > now}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, domain, now=None):
+        record = self.records.get(domain.lower())
+        if record and record["expires"] > (now or time.time()):
+            return record
+        return None
+
+    def lookup_ip(self, host):
+        """返回已解析的第一个 IP，IP 字面量原样返回，未解析时返回 None。"""
+        if is_ip_address(host):
+            return host
+        record = self.get(host)
+        return record["ips"][0] if record and record["ips"] else None
+
+    def is_nxdomain(self, host):
+        record = self.get(host)
+        return bool(record) and record["status"] == STATUS_NXDOMAIN
+
+    def discard_nxdomain(self, domains):
+        for domain in domains:
+            record = self.records.get(domain)
+            if record and record["status"] == STATUS_NXDOMAIN:
+                del self.records[domain]
+
+    def hosts(self, domains):
+        """生成 mihomo 配置 hosts: 段 ({域名: IP})，只包含已成功解析的域名。"""
+        entries = {}
+        for domain in domains:
+            ip = None if is_ip_address(domain) else self.lookup_ip(domain)
+            if ip:
+                entries[domain] = ip
+        return entries
+
+    async def _query(self, domain, server):
+        loop = asyncio.get_running_loop()
+        query_id = random.randint(0, 0xFFFF)
+        future = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(lambda: _QueryProtocol(future), remote_addr=server)
+        try:
+            transport.sendto(build_query(domain, query_id))
+            data = await asyncio.wait_for(future, timeout=DNS_TIMEOUT)
+            return parse_response(data, query_id)
+        finally:
+            transport.close()
+
+    async def _resolve_one(self, domain, limit):
+        async with limit:
+            for attempt in range(DNS_RETRIES):
+                server = self.servers[attempt % len(self.servers)]
+                try:
+                    rcode, ips, ttl = await self._query(domain, server)
+                except (OSError, ValueError, IndexError, struct.error, asyncio.TimeoutError):
+                    continue
+                if rcode == _RCODE_NXDOMAIN:
+                    self.records[domain] = {"status": STATUS_NXDOMAIN, "ips": [], "expires": time.time() + DNS_NEGATIVE_TTL}
+                    return
+                if rcode != 0:
+                    continue
+                ttl = min(max(ttl or DNS_MIN_TTL, DNS_MIN_TTL), DNS_MAX_TTL)
+                status = STATUS_OK if ips else STATUS_EMPTY
+                self.records[domain] = {"status": status, "ips": ips, "expires": time.time() + ttl}
+                return
+
+    async def resolve_many(self, domains):
+        """解析缓存中没有或已过期的域名 (IP 字面量跳过)，返回本次实际查询的域名数。"""
+        now = time.time()
+        pending = {d.lower() for d in domains if d and not is_ip_address(d) and self.get(d, now) is None}
+        if pending:
+            limit = asyncio.Semaphore(DNS_CONCURRENCY)
+            await asyncio.gather(*(self._resolve_one(domain, limit) for domain in pending))
+        return len(pending)
+
+
+async def pre_resolve_async(domains, path=DNS_CACHE_PATH, servers=None):
+    """批量预解析并写回缓存，返回 DnsCache；供已在事件循环中的调用方使用。"""
+    cache = DnsCache(path, servers)
+    domains = {d.lower() for d in domains if d and not is_ip_address(d)}
+    started = time.monotonic()
+    queried = await cache.resolve_many(domains)
+    nxdomain = sum(1 for d in domains if cache.is_nxdomain(d))
+    answered = sum(1 for d in domains if cache.get(d))
+    if answered >= DNS_NXDOMAIN_SANITY_MIN and nxdomain > answered * DNS_NXDOMAIN_SANITY_RATIO:
+        print(f"⚠️ {nxdomain}/{answered} 个域名返回 NXDOMAIN，上游解析器可能被劫持或故障，忽略本次 NXDOMAIN 结果", flush=True)
+        cache.discard_nxdomain(domains)
+        nxdomain = 0
+    cache.save()
+    print(f"🌐 DNS 预解析: {len(domains)} 个域名，缓存命中 {len(domains) - queried} 个，"
+          f"查询 {queried} 个，NXDOMAIN {nxdomain} 个，耗时 {time.monotonic() - started:.2f}s", flush=True)
+    return cache
+
+
+def pre_resolve(domains, path=DNS_CACHE_PATH, servers=None):
+    """同步入口，见 pre_resolve_async。"""
+    return asyncio.run(pre_resolve_async(domains, path, servers))
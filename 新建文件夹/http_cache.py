@@ -0,0 +1,172 @@
+# http_cache.py
+# 订阅源的条件请求缓存：正文与 ETag/Last-Modified 一起存盘，下次请求带上 If-None-Match/If-Modified-Since，
+# 服务器返回 304 时直接复用缓存的正文；解析结果按正文的 sha256 缓存，正文没变就连解析也省掉。
+# 与具体的 HTTP 库无关：调用方用 request_headers 补充请求头，再把响应交给 handle_response (或流式的 spool_response)。
+
+import hashlib
+import json
+import os
+import time
+
+HTTP_CACHE_DIR = os.environ.get("NODE_HTTP_CACHE", "http_cache")
+HTTP_CACHE_RETENTION = 7 * 24 * 3600   # 超过该时长未使用的条目在 save 时清理 (秒)
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+def _sha256(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+class HttpCache:
+    """
+    index.json 记录 {URL: {"etag", "last_modified", "sha256", "used_at"}}；
+    正文存为 <URL 哈希>.body，解析结果存为 <URL 哈希>.<key>.json ({"sha256": 正文哈希, "result": ...})。
+    """
+
+    def __init__(self, directory=HTTP_CACHE_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        self.index = self._load_index()
+        self.hits = 0
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 读取 HTTP 缓存索引失败，将重新下载: {e}", flush=True)
+            return {}
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    def _path(self, url, suffix):
+        return os.path.join(self.directory, f"{self._key(url)}.{suffix}")
+
+    def request_headers(self, url):
+        """返回条件请求头；没有缓存或缓存正文丢失时返回空字典。"""
+        entry = self.index.get(url)
+        if not entry or not os.path.exists(self._path(url, "body")):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def handle_response(self, url, status_code, headers, body):
+        """
+        处理响应，返回 (状态码, 正文)：304 且有缓存时换成缓存正文并视为 200；
+        200 时按响应的 ETag/Last-Modified 更新缓存 (两者都没有则不缓存)。
+        """
+        if status_code == 304:
+            body = self.cached_body(url)
+            if body is None:
+                return status_code, b""
+            self.index[url]["used_at"] = time.time()
+            self.hits += 1
+            return 200, body
+        if status_code == 200:
+            etag = headers.get("ETag")
+            last_modified = headers.get("Last-Modified")
+            if etag or last_modified:
+                with open(self._path(url, "body"), "wb") as f:
+                    f.write(body)
+                self.index[url] = {"etag": etag, "last_modified": last_modified, "sha256": _sha256(body), "used_at": time.time()}
+            else:
+                self.index.pop(url, None)
+        return status_code, body
+
+    def cached_body(self, url):
+        try:
+            with open(self._path(url, "body"), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def spool_response(self, url, status_code, headers, chunks):
+        """
+        handle_response 的流式版本，返回 (状态码, 正文 sha256)，不在内存中持有完整正文：
+        200 时边读边写入缓存文件并计算哈希，304 且有缓存时视为 200，之后用 iter_body 按块读取正文。
+        没有验证器的正文同样落盘 (只是不发条件请求)，调用方可以先按正文哈希查解析缓存 (见 parse_cache.py)，命中时不必解析。
+        """
+        entry = self.index.get(url)
+        if status_code == 304:
+            if not entry or not os.path.exists(self._path(url, "body")):
+                return status_code, None
+            entry["used_at"] = time.time()
+            self.hits += 1
+            return 200, entry["sha256"]
+        if status_code != 200:
+            return status_code, None
+        # 旧条目先作废，新正文完整写入后再登记
+        self.index.pop(url, None)
+        path = self._path(url, "body")
+        tmp_path = f"{path}.tmp"
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.index[url] = {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                           "sha256": digest.hexdigest(), "used_at": time.time()}
+        return status_code, digest.hexdigest()
+
+    def iter_body(self, url):
+        """按块读取缓存的正文。"""
+        with open(self._path(url, "body"), "rb") as f:
+            while True:
+                chunk = f.read(_READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def load_parsed(self, url, key, body=None):
+        """
+        正文与解析时一致时返回 (True, 解析结果)，否则返回 (False, None)。
+        body 为 None 时以索引中记录的正文哈希为准 (流式读取、尚未读取正文时使用)。
+        """
+        entry = self.index.get(url)
+        if not entry or (body is not None and entry.get("sha256") != _sha256(body)):
+            return False, None
+        try:
+            with open(self._path(url, f"{key}.json"), "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        if cached.get("sha256") != entry["sha256"]:
+            return False, None
+        return True, cached["result"]
+
+    def store_parsed(self, url, key, body, result):
+        """缓存解析结果 (需可 JSON 序列化)；只对有验证器的 URL 生效。body 为 None 时使用索引中记录的正文哈希。"""
+        entry = self.index.get(url)
+        if not entry:
+            return
+        digest = entry["sha256"] if body is None else _sha256(body)
+        with open(self._path(url, f"{key}.json"), "w", encoding="utf-8") as f:
+            json.dump({"sha256": digest, "result": result}, f, ensure_ascii=False)
+
+    def save(self):
+        """写回索引，并清理长期未使用的条目。"""
+        expired = [url for url, entry in self.index.items() if entry.get("used_at", 0) < time.time() - HTTP_CACHE_RETENTION]
+        for url in expired:
+            del self.index[url]
+        live = {self._key(url) for url in self.index}
+        for name in os.listdir(self.directory):
+            if name != "index.json" and name.split(".", 1)[0] not in live:
+                os.remove(os.path.join(self.directory, name))
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,362 @@
+# mihomo_supervisor.py
+# mihomo 进程监管：以 asyncio 子进程管道启动 mihomo，逐行读取日志判断就绪与配置错误，异常退出后按指数退避重启，并提供健康状态。
+# 启动的进程记录在自己的 PID 登记表中，清理残留进程时只处理登记过的 PID，不再扫描全部系统进程或 killall。
+# 已在事件循环中的调用方 (测试脚本) 直接 await start/stop；同步调用方 (ClashForge、WebUI) 使用 start_background，
+# 监管循环运行在后台线程的事件循环中，日志管道始终有人读取。
+
+import asyncio
+import collections
+import json
+import os
+import signal
+import threading
+import time
+
+try:
+    import psutil  # 可选：用于核对登记的 PID 未被系统复用
+except ImportError:
+    psutil = None
+
+# PID 登记表固定放在脚本目录 (可用环境变量覆盖)，从其他工作目录调用 kill_registered 也能找到
+MIHOMO_REGISTRY_PATH = os.environ.get(
+    "NODE_MIHOMO_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mihomo_pids.json"))
+READY_MARKERS = ("RESTful API listening", "RESTful API unix listening")
+CONFIG_ERROR_MARKER = "Parse config error"
+READY_TIMEOUT = 30            # 启动到就绪的最长等待 (秒)
+READY_BACKOFF_START = 0.02    # 控制器连通检查的首次间隔 (秒)
+READY_BACKOFF_MAX = 0.5       # 控制器连通检查的间隔上限 (秒)
+RESTART_BACKOFF_START = 1     # 启动失败或崩溃后的首次重启等待 (秒)，之后翻倍
+RESTART_BACKOFF_MAX = 30      # 重启等待上限 (秒)
+STABLE_UPTIME = 60            # 运行超过该时长后崩溃视为偶发，重启等待重新从 RESTART_BACKOFF_START 开始
+MAX_START_ATTEMPTS = 5        # 非配置错误导致的启动失败最多重试次数
+MAX_CONFIG_REPAIRS = 1000     # 配置错误经 on_config_error 修复后立即重启的次数上限
+STOP_TIMEOUT = 1              # terminate 后等待退出的时长 (秒)，超时后 kill
+LOG_TAIL_LINES = 200          # 内存中保留的日志行数
+
+STATE_STOPPED = "stopped"
+STATE_STARTING = "starting"
+STATE_READY = "ready"
+STATE_RESTARTING = "restarting"
+STATE_FAILED = "failed"
+
+_registry_lock = threading.Lock()
+
+
+def _process_created(pid):
+    if psutil is None:
+        return None
+    try:
+        return psutil.Process(pid).create_time()
+    except psutil.Error:
+        return None
+
+
+def _update_registry(path, pid, entry=None):
+    """登记 (entry 不为 None) 或注销一个 PID；登记表为 {pid: {"binary", "created"}}。"""
+    if not path:
+        return
+    with _registry_lock:
+        registry = _load_registry(path)
+        if entry is None:
+            registry.pop(str(pid), None)
+        else:
+            registry[str(pid)] = entry
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(registry, f)
+        os.replace(tmp_path, path)
+
+
+def _load_registry(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_registered_process(pid, entry):
+    """确认 PID 仍是登记时的 mihomo 进程，避免误杀复用了该 PID 的其他进程。"""
+    if psutil is not None:
+        created = _process_created(pid)
+        return created is not None and entry.get("created") is not None and abs(created - entry["created"]) < 1
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return os.path.basename(entry.get("binary", "")).encode() in f.read()
+    except OSError:
+        return False
+
+
+def kill_registered(path=MIHOMO_REGISTRY_PATH):
+    """强制结束登记表中仍在运行的 mihomo 进程 (例如上次运行异常退出后的残留)，返回结束的进程数。"""
+    with _registry_lock:
+        registry = _load_registry(path)
+        killed = 0
+        for pid, entry in registry.items():
+            if not _is_registered_process(int(pid), entry):
+                continue
+            try:
+                os.kill(int(pid), getattr(signal, "SIGKILL", signal.SIGTERM))
+                killed += 1
+            except OSError:
+                pass
+        if registry and os.path.exists(path):
+            os.remove(path)
+    return killed
+
+
+def _open_controller(controller):
+    if isinstance(controller, str):
+        return asyncio.open_unix_connection(controller)
+    return asyncio.open_connection("127.0.0.1", controller)
+
+
+async def controller_accepting(controller):
+    """控制器 (TCP 端口或 Unix 套接字路径) 能否建立连接。"""
+    try:
+        _, writer = await asyncio.wait_for(_open_controller(controller), timeout=0.5)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def controller_responding(controller, secret=None):
+    """控制器能否应答带认证的 GET /version (HTTP/1.0，读到连接关闭为止)。"""
+    try:
+        reader, writer = await asyncio.wait_for(_open_controller(controller), timeout=0.5)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        auth = f"Authorization: Bearer {secret}\r\n" if secret else ""
+        writer.write(f"GET /version HTTP/1.0\r\nHost: 127.0.0.1\r\n{auth}\r\n".encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(4096), timeout=0.5)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+    return response.split(b"\r\n", 1)[0].split()[1:2] == [b"200"] and b'"version"' in response
+
+
+class MihomoSupervisor:
+    """
+    一个 mihomo 进程的完整生命周期。日志出现监听行，或进程仍在运行且控制器应答带 secret 认证的 /version 即视为就绪；
+    启动前控制器端口已被其他进程占用时只认日志，避免把别人的监听误当成自己就绪。
+    启动失败且日志含配置错误时调用 on_config_error(错误行)，返回 True 表示已修复，立即重启，
+    其他失败按指数退避重试。auto_restart 为 True 时，就绪后进程意外退出会自动重启。
+    before_start 在每次启动前调用 (例如写入修复后的配置)。
+    """
+
+    def __init__(self, binary, config_path, work_dir=None, controller=None, log_path=None,
+                 ready_timeout=READY_TIMEOUT, max_start_attempts=MAX_START_ATTEMPTS,
+                 max_config_repairs=MAX_CONFIG_REPAIRS, before_start=None, on_config_error=None,
+                 auto_restart=False, registry_path=MIHOMO_REGISTRY_PATH, name="mihomo", secret=None):
+        self.binary = binary
+        self.config_path = config_path
+        self.work_dir = work_dir
+        self.controller = controller
+        self.log_path = log_path
+        self.ready_timeout = ready_timeout
+        self.max_start_attempts = max_start_attempts
+        self.max_config_repairs = max_config_repairs
+        self.before_start = before_start
+        self.on_config_error = on_config_error
+        self.auto_restart = auto_restart
+        self.registry_path = registry_path
+        self.name = name
+        self.secret = secret
+
+        self.process = None
+        self.state = STATE_STOPPED
+        self.log_tail = collections.deque(maxlen=LOG_TAIL_LINES)
+        self.last_error = None
+        self.restarts = 0
+        self.started_at = None
+        self.ready_seconds = None
+        self._ready = None
+        self._reader = None
+        self._watcher = None
+        self._stopping = False
+        self._controller_taken = False
+        self._loop = None
+        self._thread = None
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    def health(self):
+        """健康状态快照。"""
+        return {
+            "state": self.state,
+            "pid": self.pid,
+            "alive": self.alive(),
+            "restarts": self.restarts,
+            "uptime": round(time.monotonic() - self.started_at, 1) if self.alive() and self.started_at else 0,
+            "ready_seconds": self.ready_seconds,
+            "last_error": self.last_error,
+        }
+
+    def log_text(self, limit=3000):
+        return "\n".join(self.log_tail)[-limit:]
+
+    async def _launch(self):
+        if self.before_start:
+            self.before_start()
+        command = [self.binary, "-f", self.config_path] + (["-d", self.work_dir] if self.work_dir else [])
+        self.log_tail.clear()
+        self.last_error = None
+        self._ready = asyncio.Event()
+        self._controller_taken = self.controller is not None and await controller_accepting(self.controller)
+        if self._controller_taken:
+            print(f"⚠️ {self.name} 的控制器 {self.controller} 在启动前已被占用，只根据日志判断就绪", flush=True)
+        self.process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, limit=1 << 20)
+        self.started_at = time.monotonic()
+        _update_registry(self.registry_path, self.process.pid,
+                         {"binary": self.binary, "created": _process_created(self.process.pid)})
+        self._reader = asyncio.ensure_future(self._read_log(self.process))
+
+    async def _read_log(self, process):
+        log_file = open(self.log_path, "w", encoding="utf-8") if self.log_path else None
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    return
+                text = line.decode("utf-8", errors="replace").rstrip()
+                self.log_tail.append(text)
+                if log_file:
+                    log_file.write(text + "\n")
+                if any(marker in text for marker in READY_MARKERS):
+                    self._ready.set()
+                elif CONFIG_ERROR_MARKER in text or "level=fatal" in text:
+                    self.last_error = text
+        finally:
+            if log_file:
+                log_file.close()
+
+    async def _wait_ready(self):
+        deadline = time.monotonic() + self.ready_timeout
+        interval = READY_BACKOFF_START
+        while time.monotonic() < deadline:
+            if self._ready.is_set():
+                return True
+            if self.process.returncode is not None:
+                # 进程已退出：等日志读完，保证 last_error 是完整的
+                await asyncio.wait({self._reader}, timeout=1)
+                return False
+            if (self.controller is not None and not self._controller_taken
+                    and await controller_responding(self.controller, self.secret) and self.process.returncode is None):
+                return True
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            interval = min(interval * 2, READY_BACKOFF_MAX)
+        self.last_error = self.last_error or f"{self.ready_timeout}s 内未就绪"
+        return False
+
+    async def _terminate(self):
+        process = self.process
+        if process is None:
+            return
+        if process.returncode is None:
+            try:
+                process.terminate()
+                await asyncio.wait_for(process.wait(), timeout=STOP_TIMEOUT)
+            except ProcessLookupError:
+                pass
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        if self._reader is not None:
+            await asyncio.wait({self._reader}, timeout=1)
+            self._reader.cancel()
+            self._reader = None
+        _update_registry(self.registry_path, process.pid)
+        self.process = None
+
+    async def _start_with_retries(self):
+        attempts = repairs = 0
+        backoff = RESTART_BACKOFF_START
+        while not self._stopping:
+            self.state = STATE_STARTING
+            await self._launch()
+            if await self._wait_ready():
+                self.state = STATE_READY
+                self.ready_seconds = time.monotonic() - self.started_at
+                return True
+            await self._terminate()
+            if (self.on_config_error and self.last_error and CONFIG_ERROR_MARKER in self.last_error
+                    and repairs < self.max_config_repairs and self.on_config_error(self.last_error)):
+                repairs += 1
+                continue
+            attempts += 1
+            if attempts >= self.max_start_attempts:
+                break
+            self.state = STATE_RESTARTING
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+        self.state = STATE_FAILED if not self._stopping else STATE_STOPPED
+        return False
+
+    async def _watch(self):
+        """就绪后监视进程，意外退出时重启；短时间内反复崩溃时重启等待按指数增长。"""
+        backoff = RESTART_BACKOFF_START
+        while not self._stopping:
+            returncode = await self.process.wait()
+            if self._stopping:
+                return
+            uptime = time.monotonic() - self.started_at
+            print(f"⚠️ {self.name} 意外退出 (code {returncode}，运行 {uptime:.0f}s)，准备重启", flush=True)
+            await self._terminate()
+            self.restarts += 1
+            self.state = STATE_RESTARTING
+            backoff = RESTART_BACKOFF_START if uptime > STABLE_UPTIME else backoff
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+            if not await self._start_with_retries():
+                print(f"❌ {self.name} 重启失败: {self.last_error}", flush=True)
+                return
+
+    async def start(self):
+        """启动 mihomo 并等待就绪，返回是否成功。"""
+        self._stopping = False
+        if not await self._start_with_retries():
+            return False
+        if self.auto_restart and self._watcher is None:
+            self._watcher = asyncio.ensure_future(self._watch())
+        return True
+
+    async def stop(self):
+        self._stopping = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.wait({self._watcher})
+            self._watcher = None
+        await self._terminate()
+        self.state = STATE_STOPPED
+
+    def start_background(self):
+        """同步调用方使用：在后台线程的事件循环中启动并持续监管，阻塞到就绪或失败。"""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name=f"{self.name}-supervisor", daemon=True)
+            self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self.start(), self._loop).result()
+
+    def stop_background(self):
+        """停止进程并关闭后台事件循环。"""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
@@ -0,0 +1,151 @@
+# node_health.py
+# 跨运行持久化的节点健康记录 (SQLite)，按 generate_proxy_fingerprint 生成的节点指纹存储
+# 近期健康的节点直接复用上次结果，持续失效的节点按连续失败次数指数退避后再测
+
+import os
+import sqlite3
+import threading
+import time
+
+HEALTH_DB_PATH = os.environ.get("NODE_HEALTH_DB", "node_health.sqlite3")
+HEALTHY_TTL = int(os.environ.get("NODE_HEALTH_TTL", 3 * 3600))   # 健康结果的有效期 (秒)
+DEAD_BACKOFF_BASE = 3600              # 首次失败后的跳过时长 (秒)，之后每连续失败一次翻倍
+DEAD_BACKOFF_MAX = 24 * 3600          # 跳过时长上限 (秒)
+RECORD_RETENTION = 14 * 24 * 3600     # 超过该时长未检测的记录在关闭时清理
+OUTAGE_MIN_SAMPLE = 5                 # 判定网络故障所需的最少上次健康节点数
+OUTAGE_FAILURE_RATIO = 0.9            # 上次健康的节点失败比例达到该值时视为网络故障
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS node_health (
+    scope TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    latency_ms INTEGER,
+    failure_streak INTEGER NOT NULL DEFAULT 0,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (scope, fingerprint)
+)
+"""
+
+_UPSERT = """
+INSERT INTO node_health (scope, fingerprint, ok, latency_ms, failure_streak, checked_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (scope, fingerprint) DO UPDATE SET
+    ok = excluded.ok,
+    latency_ms = excluded.latency_ms,
+    failure_streak = CASE WHEN excluded.ok THEN 0 ELSE node_health.failure_streak + 1 END,
+    checked_at = excluded.checked_at
+"""
+
+
+class HealthRecord:
+    __slots__ = ("fingerprint", "ok", "latency_ms", "failure_streak", "checked_at")
+
+    def __init__(self, fingerprint, ok, latency_ms, failure_streak, checked_at):
+        self.fingerprint = fingerprint
+        self.ok = bool(ok)
+        self.latency_ms = latency_ms
+        self.failure_streak = failure_streak
+        self.checked_at = checked_at
+
+
+class NodeHealthStore:
+    """
+    节点健康记录。scope 用于区分不同的检测方式 (例如 TCP 连通性与 mihomo 延迟测试)，互不混用。
+    record 只写入内存缓冲，flush/close 时在一个事务中批量写盘。
+    """
+
+    def __init__(self, path=HEALTH_DB_PATH, scope="default"):
+        self.path = path
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.pending = []
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def lookup(self, fingerprints):
+        """批量读取记录，返回 {指纹: HealthRecord}。"""
+        fingerprints = [fp for fp in set(fingerprints) if fp]
+        records = {}
+        with self.lock:
+            for i in range(0, len(fingerprints), 500):
+                chunk = fingerprints[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT fingerprint, ok, latency_ms, failure_streak, checked_at FROM node_health "
+                    f"WHERE scope = ? AND fingerprint IN ({','.join('?' * len(chunk))})",
+                    [self.scope, *chunk],
+                )
+                for row in rows:
+                    records[row[0]] = HealthRecord(*row)
+        return records
+
+    @staticmethod
+    def cached_verdict(record, now=None):
+        """
+        根据历史记录决定能否跳过本次检测：返回 (是否可用, 延迟) 表示沿用缓存结果，返回 None 表示需要重新检测。
+        """
+        if record is None:
+            return None
+        age = (now or time.time()) - record.checked_at
+        if record.ok:
+            return (True, record.latency_ms) if age < HEALTHY_TTL else None
+        backoff = min(DEAD_BACKOFF_BASE * 2 ** max(record.failure_streak - 1, 0), DEAD_BACKOFF_MAX)
+        return (False, None) if age < backoff else None
+
+    def record(self, fingerprint, ok, latency_ms=None):
+        if not fingerprint:
+            return
+        with self.lock:
+            self.pending.append((self.scope, fingerprint, int(bool(ok)), latency_ms, 0 if ok else 1, time.time()))
+
+    def flush(self):
+        """
+        批量写盘。上次健康的节点在本批中几乎全部失败时，判定为本机网络中断、mihomo 缺失或控制器不可达，
+        本批失败记录不写入，避免所有节点进入退避；本批没有上次健康的节点时无从判断，照常写入。
+        """
+        with self.lock:
+            if not self.pending:
+                return
+            rows = self.pending
+            self.pending = []
+            if self._looks_like_outage(rows):
+                rows = [row for row in rows if row[2]]
+            if rows:
+                with self.conn:
+                    self.conn.executemany(_UPSERT, rows)
+
+    def _looks_like_outage(self, rows):
+        """以上次健康的节点为对照组：样本足够且失败率超过阈值时视为网络故障 (调用方持有 self.lock)。"""
+        outcome = {row[1]: row[2] for row in rows}
+        fingerprints = list(outcome)
+        previously_ok = []
+        for i in range(0, len(fingerprints), 500):
+            chunk = fingerprints[i:i + 500]
+            previously_ok += [fp for (fp,) in self.conn.execute(
+                f"SELECT fingerprint FROM node_health "
+                f"WHERE scope = ? AND ok = 1 AND fingerprint IN ({','.join('?' * len(chunk))})",
+                [self.scope, *chunk],
+            )]
+        if len(previously_ok) < OUTAGE_MIN_SAMPLE:
+            return False
+        failed = sum(1 for fp in previously_ok if not outcome[fp])
+        if failed / len(previously_ok) < OUTAGE_FAILURE_RATIO:
+            return False
+        print(f"⚠️ 上次健康的 {len(previously_ok)} 个节点中 {failed} 个本次失败，疑似网络故障，"
+              f"不写入失败记录 (scope={self.scope})", flush=True)
+        return True
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM node_health WHERE checked_at < ?", (time.time() - RECORD_RETENTION,))
+            self.conn.close()
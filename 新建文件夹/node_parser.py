@@ -0,0 +1,305 @@
+# node_parser.py
+# 各脚本共用的节点链接解析库：链接 → ProxyNode → Clash/mihomo proxies 字典
+# 支持 trojan / vless / vmess / ss / hysteria2 (hy2)
+
+import base64
+import copy
+import hashlib
+import json
+import re
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs, unquote
+
+# 解析结果缓存的条目上限 (按链接字符串缓存，同一条链接在一次运行中只解析一次)
+PARSE_CACHE_SIZE = 65536
+
+SUPPORTED_SCHEMES = ("trojan", "vless", "vmess", "ss", "hysteria2", "hy2")
+
+
+class ProxyNode:
+    """
+    解析后的节点。server/port 等连接信息单独存放，其余 Clash 字段放在 options 中。
+    解析结果会被缓存共享，请勿原地修改，需要字典时调用 to_clash_dict。
+    """
+
+    __slots__ = ("link", "type", "name", "server", "port", "options")
+
+    def __init__(self, link, type, name, server, port, options):
+        self.link = link
+        self.type = type
+        self.name = name
+        self.server = server
+        self.port = port
+        self.options = options
+
+    @property
+    def endpoint(self):
+        return self.server, self.port
+
+    def to_clash_dict(self, name=None):
+        """生成 Clash/mihomo proxies 列表中的一项，name 可覆盖节点名。"""
+        proxy = {
+            "name": self.name if name is None else name,
+            "type": self.type,
+            "server": self.server,
+            "port": self.port,
+        }
+        proxy.update(copy.deepcopy(self.options))
+        return proxy
+
+    def __repr__(self):
+        return f"ProxyNode({self.type}, {self.server}:{self.port}, {self.name!r})"
+
+
+# --- 工具函数 ---
+
+def _b64decode(data):
+    """兼容标准/URL 安全字母表以及缺失填充的 base64 解码。"""
+    data = data.strip().replace('-', '+').replace('_', '/')
+    data += '=' * (-len(data) % 4)
+    return base64.b64decode(data)
+
+
+def _first(params, *keys, default=""):
+    for key in keys:
+        if params.get(key):
+            return params[key][0]
+    return default
+
+
+def _is_true(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _check_endpoint(server, port):
+    if not server:
+        raise ValueError("缺少服务器地址")
+    port = int(port)
+    if not 0 < port < 65536:
+        raise ValueError(f"端口超出范围: {port}")
+    return server, port
+
+
+def _node_name(fragment, server, port):
+    name = unquote(fragment).strip() if fragment else ""
+    return name or f"{server}:{port}"
+
+
+def _transport_options(network, path, host, service_name):
+    """ws / grpc 传输层字段。"""
+    if network == "ws":
+        ws_opts = {"path": unquote(path) or "/"}
+        if host:
+            ws_opts["headers"] = {"Host": host}
+        return {"network": "ws", "ws-opts": ws_opts}
+    if network == "grpc":
+        return {"network": "grpc", "grpc-opts": {"grpc-service-name": service_name or "GunService"}}
+    return {}
+
+
+def _alpn(value):
+    return [a.strip() for a in value.split(",") if a.strip()] if value else None
+
+
+# --- 各协议解析器 (失败时抛出异常) ---
+
+def parse_trojan(link):
+    parsed = urlparse(link)
+    server, port = _check_endpoint(parsed.hostname, parsed.port or 443)
+    params = parse_qs(parsed.query)
+    sni = _first(params, "sni", "peer") or server
+    options = {
+        "password": unquote(parsed.username or ""),
+        "udp": True,
+        "sni": sni,
+        "skip-cert-verify": _is_true(_first(params, "allowInsecure", "allowinsecure", "insecure", "skip-cert-verify", default="0")),
+    }
+    alpn = _alpn(_first(params, "alpn"))
+    if alpn:
+        options["alpn"] = alpn
+    fingerprint = _first(params, "fp")
+    if fingerprint:
+        options["client-fingerprint"] = fingerprint
+    network = _first(params, "type", default="tcp").lower()
+    options.update(_transport_options(network, _first(params, "path"), _first(params, "host") or sni, _first(params, "serviceName", "path")))
+    return ProxyNode(link, "trojan", _node_name(parsed.fragment, server, port), server, port, options)
+
+
+def parse_vless(link):
+    parsed = urlparse(link)
+    server, port = _check_endpoint(parsed.hostname, parsed.port or 443)
+    params = parse_qs(parsed.query)
+    security = _first(params, "security", default="none").lower()
+    sni = _first(params, "sni", "peer") or server
+    options = {"uuid": parsed.username or "", "udp": True}
+    flow = _first(params, "flow")
+    if flow:
+        options["flow"] = flow
+    if security in ("tls", "xtls", "reality"):
+        options["tls"] = True
+        options["servername"] = sni
+        options["skip-cert-verify"] = _is_true(_first(params, "allowInsecure", "insecure", default="0"))
+        fingerprint = _first(params, "fp")
+        if fingerprint:
+            options["client-fingerprint"] = fingerprint
+        alpn = _alpn(_first(params, "alpn"))
+        if alpn:
+            options["alpn"] = alpn
+    if security == "reality":
+        public_key = _first(params, "pbk")
+        if not public_key:
+            raise ValueError("Reality 需要 pbk")
+        options["reality-opts"] = {"public-key": public_key, "short-id": _first(params, "sid")}
+        options.setdefault("client-fingerprint", "chrome")
+    network = _first(params, "type", default="tcp").lower()
+    options.update(_transport_options(network, _first(params, "path"), _first(params, "host") or sni, _first(params, "serviceName")))
+    return ProxyNode(link, "vless", _node_name(parsed.fragment, server, port), server, port, options)
+
+
+def parse_vmess(link):
+    config = json.loads(_b64decode(link[8:].split('#', 1)[0]).decode("utf-8"))
+    server, port = _check_endpoint(config.get("add"), config.get("port"))
+    tls = str(config.get("tls", "")).lower() == "tls"
+    host = config.get("host", "")
+    sni = config.get("sni") or host or server
+    options = {
+        "uuid": config.get("id", ""),
+        "alterId": int(config.get("aid", 0) or 0),
+        "cipher": config.get("scy") or "auto",
+        "udp": True,
+        "tls": tls,
+    }
+    if tls:
+        options["servername"] = sni
+        options["skip-cert-verify"] = _is_true(config.get("allowInsecure", config.get("skip-cert-verify", 0)))
+    network = str(config.get("net", "tcp")).lower()
+    options.update(_transport_options(network, config.get("path", ""), host or (sni if tls else ""), config.get("path", "")))
+    name = str(config.get("ps", "")).strip() or f"{server}:{port}"
+    return ProxyNode(link, "vmess", name, server, port, options)
+
+
+def parse_shadowsocks(link):
+    body, _, fragment = link[5:].partition('#')
+    body, _, query = body.partition('?')
+    body = body.rstrip('/')
+    if '@' in body:
+        # SIP002: ss://base64(method:password)@server:port 或明文 method:password
+        userinfo, _, host_port = body.rpartition('@')
+        userinfo = unquote(userinfo)
+        if ':' not in userinfo:
+            userinfo = _b64decode(userinfo).decode("utf-8")
+    else:
+        # 旧格式: ss://base64(method:password@server:port)
+        userinfo, _, host_port = _b64decode(body).decode("utf-8").rpartition('@')
+    cipher, _, password = userinfo.partition(':')
+    if not cipher or not password:
+        raise ValueError("无效的 method:password")
+    host_match = re.match(r'^\[?([^\]]+?)\]?:(\d+)$', host_port)
+    if not host_match:
+        raise ValueError(f"无效的 server:port: {host_port}")
+    server, port = _check_endpoint(host_match.group(1), host_match.group(2))
+    options = {"cipher": cipher, "password": password, "udp": True}
+    plugin = _first(parse_qs(query), "plugin")
+    if plugin:
+        plugin_name, *plugin_args = unquote(plugin).split(';')
+        plugin_opts = dict(arg.split('=', 1) if '=' in arg else (arg, True) for arg in plugin_args)
+        if plugin_name in ("obfs-local", "simple-obfs"):
+            options["plugin"] = "obfs"
+            options["plugin-opts"] = {"mode": plugin_opts.get("obfs", "http"), "host": plugin_opts.get("obfs-host", "")}
+        elif plugin_name == "v2ray-plugin":
+            options["plugin"] = "v2ray-plugin"
+            options["plugin-opts"] = {
+                "mode": plugin_opts.get("mode", "websocket"),
+                "tls": "tls" in plugin_opts,
+                "host": plugin_opts.get("host", ""),
+                "path": plugin_opts.get("path", "/"),
+            }
+        else:
+            raise ValueError(f"不支持的 ss 插件: {plugin_name}")
+    return ProxyNode(link, "ss", _node_name(fragment, server, port), server, port, options)
+
+
+def parse_hysteria2(link):
+    parsed = urlparse(link)
+    server, port = _check_endpoint(parsed.hostname, parsed.port or 443)
+    params = parse_qs(parsed.query)
+    options = {
+        "password": unquote(parsed.username or "") or _first(params, "auth", "password"),
+        "sni": _first(params, "sni", "peer") or server,
+        "skip-cert-verify": _is_true(_first(params, "insecure", "allowInsecure", default="0")),
+        "alpn": _alpn(_first(params, "alpn")) or ["h3"],
+    }
+    if _first(params, "obfs") == "salamander":
+        options["obfs"] = "salamander"
+        options["obfs-password"] = _first(params, "obfs-password")
+    for key, field in (("up", "up"), ("down", "down")):
+        if _first(params, key):
+            options[field] = _first(params, key)
+    return ProxyNode(link, "hysteria2", _node_name(parsed.fragment, server, port), server, port, options)
+
+
+# 协议 → 解析器 分发表
+PARSERS = {
+    "trojan": parse_trojan,
+    "vless": parse_vless,
+    "vmess": parse_vmess,
+    "ss": parse_shadowsocks,
+    "hysteria2": parse_hysteria2,
+    "hy2": parse_hysteria2,
+}
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_proxy_link(link):
+    """解析单条节点链接，返回 ProxyNode；不支持的协议或解析失败返回 None。"""
+    link = link.strip()
+    parser = PARSERS.get(link.split("://", 1)[0].lower()) if "://" in link else None
+    if parser is None:
+        return None
+    try:
+        return parser(link)
+    except Exception:
+        return None
+
+
+def parse_proxy_dict(link):
+    """解析链接并直接返回 Clash 字典，失败返回 None。"""
+    node = parse_proxy_link(link)
+    return node.to_clash_dict() if node else None
+
+
+def generate_proxy_fingerprint(proxy_data):
+    """
+    根据代理的核心连接信息生成一个唯一的哈希指纹 (不含节点名)，用于去重和健康记录。
+    修正：为 Vmess/Trojan/VLESS 添加 servername (SNI) 以区分同一服务器下的不同节点 (Trojan 的 SNI 字段为 sni)。
+    """
+    try:
+        p_type = str(proxy_data.get('type', '')).lower()
+        server = str(proxy_data.get('server', ''))
+        port = str(proxy_data.get('port', ''))
+
+        fingerprint_parts = [p_type, server, port]
+
+        if p_type == 'vmess':
+            fingerprint_parts.append(str(proxy_data.get('uuid', '')))
+            fingerprint_parts.append(str(proxy_data.get('alterId', '')))
+            if proxy_data.get('servername'):
+                 fingerprint_parts.append(str(proxy_data['servername']))
+        elif p_type == 'vless':
+            fingerprint_parts.append(str(proxy_data.get('uuid', '')))
+            if proxy_data.get('servername'):
+                 fingerprint_parts.append(str(proxy_data['servername']))
+        elif p_type == 'trojan':
+            fingerprint_parts.append(str(proxy_data.get('password', '')))
+            if proxy_data.get('sni') or proxy_data.get('servername'):
+                 fingerprint_parts.append(str(proxy_data.get('sni') or proxy_data['servername']))
+        elif p_type == 'ss':
+            fingerprint_parts.append(str(proxy_data.get('password', '')))
+            fingerprint_parts.append(str(proxy_data.get('cipher', '')))
+        elif p_type == 'hysteria2':
+            fingerprint_parts.append(str(proxy_data.get('password', '')))
+
+        unique_string = "_".join(fingerprint_parts)
+        return hashlib.md5(unique_string.encode('utf-8')).hexdigest()
+    except Exception:
+        return None
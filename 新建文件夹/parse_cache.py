@@ -0,0 +1,112 @@
+# parse_cache.py
+# 订阅内容的解析结果缓存 (SQLite)，以内容的 SHA-256 为键，kind 区分缓存对象：
+# kind="payload" 为整段订阅正文 (键为 HttpCache.spool_response 计算的正文哈希)，正文相同时不论来自哪个链接、有无 ETag 都直接复用；
+# kind="line" 为单条链接，正文变化但其中大部分链接未变时，只需解析新增的行；解析失败的行同样缓存 (结果为 null)，下次直接跳过。
+# 按最近使用时间 (LRU) 淘汰，总大小超过上限时在 close 时删除最久未用的条目。
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+PARSE_CACHE_PATH = os.environ.get("NODE_PARSE_CACHE", "parse_cache.sqlite3")
+PARSE_CACHE_MAX_BYTES = int(os.environ.get("NODE_PARSE_CACHE_MAX_BYTES", 128 * 1024 * 1024))   # 缓存结果总大小上限 (字节)
+_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parse_cache (
+    kind TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (kind, digest)
+)
+"""
+
+# 按最近使用时间从新到旧累加大小，超出上限的部分即为需要淘汰的最久未用条目
+_EVICT = """
+DELETE FROM parse_cache WHERE rowid IN (
+    SELECT rowid FROM (
+        SELECT rowid, SUM(size) OVER (ORDER BY used_at DESC, rowid DESC) AS running_size FROM parse_cache
+    ) WHERE running_size > ?
+)
+"""
+
+
+def content_digest(text):
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class ParseCache:
+    """
+    get_many/put_many 按批读写；命中的条目只在内存中记录，close 时统一刷新使用时间并按大小上限淘汰。
+    结果以 JSON 存储，每次命中都得到新的对象，调用方可以放心修改。
+    """
+
+    def __init__(self, path=PARSE_CACHE_PATH, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touched = set()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_many(self, kind, digests):
+        """批量读取，返回 {digest: 解析结果}；不在缓存中的 digest 不出现在结果里。"""
+        digests = list(set(digests))
+        found = {}
+        for i in range(0, len(digests), _BATCH_SIZE):
+            chunk = digests[i:i + _BATCH_SIZE]
+            rows = self.conn.execute(
+                f"SELECT digest, result FROM parse_cache WHERE kind = ? AND digest IN ({','.join('?' * len(chunk))})",
+                [kind, *chunk],
+            )
+            for digest, result in rows:
+                found[digest] = json.loads(result)
+        self.touched.update((kind, digest) for digest in found)
+        self.hits += len(found)
+        self.misses += len(digests) - len(found)
+        return found
+
+    def get(self, kind, digest):
+        """返回 (是否命中, 解析结果)。"""
+        found = self.get_many(kind, [digest])
+        return (True, found[digest]) if digest in found else (False, None)
+
+    def put_many(self, kind, results):
+        """写入 {digest: 解析结果} (需可 JSON 序列化)。"""
+        now = time.time()
+        rows = []
+        for digest, result in results.items():
+            encoded = json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=str)
+            rows.append((kind, digest, encoded, len(encoded), now))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO parse_cache VALUES (?, ?, ?, ?, ?)", rows)
+
+    def put(self, kind, digest, result):
+        self.put_many(kind, {digest: result})
+
+    def close(self):
+        now = time.time()
+        touched = list(self.touched)
+        with self.conn:
+            for i in range(0, len(touched), _BATCH_SIZE):
+                self.conn.executemany(
+                    "UPDATE parse_cache SET used_at = ? WHERE kind = ? AND digest = ?",
+                    [(now, kind, digest) for kind, digest in touched[i:i + _BATCH_SIZE]],
+                )
+            evicted = self.conn.execute(_EVICT, (self.max_bytes,)).rowcount
+        if evicted:
+            print(f"🧹 解析缓存超过 {self.max_bytes // (1024 * 1024)} MB，淘汰最久未用的 {evicted} 条", flush=True)
+        self.conn.close()
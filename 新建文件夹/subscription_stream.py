@@ -0,0 +1,260 @@
+# subscription_stream.py
+# 流式订阅解析：根据正文开头几 KB 判断格式 (Clash YAML / V2RayN JSON / 明文链接 / Base64)，
+# 之后按块增量解码、解析，以生成器逐个产出 Clash 代理字典。整个过程不持有完整正文，
+# 峰值内存只与块大小和单个节点有关，与订阅大小无关。Base64 正文边解码边重新判断格式 (例如 Base64 包裹的 YAML)。
+
+import base64
+import binascii
+import codecs
+import json
+import re
+from itertools import chain
+
+import yaml
+
+from node_parser import parse_proxy_dict
+from parse_cache import content_digest
+
+STREAM_CHUNK_SIZE = 64 * 1024   # iter_content 的块大小 (字节)
+SNIFF_SIZE = 4096               # 用于判断格式的开头字节数
+LINE_BATCH_SIZE = 1000          # 明文链接按批查询解析缓存
+
+FORMAT_YAML = "yaml"
+FORMAT_JSON = "json"
+FORMAT_LINKS = "links"
+FORMAT_BASE64 = "base64"
+
+# Clash 配置常见的顶层键；开头出现这些键即按 YAML 处理 (proxies: 可能在几 KB 之后)
+_YAML_KEY_PATTERN = re.compile(
+    rb"^(proxies|proxy-groups|rules|port|mixed-port|socks-port|allow-lan|mode|log-level|dns|external-controller)\s*:",
+    re.MULTILINE,
+)
+_YAML_LIST_PATTERN = re.compile(rb"^-\s*(\{|name\s*:|type\s*:)")
+_BASE64_PATTERN = re.compile(rb"[A-Za-z0-9+/=_-]+")
+_WHITESPACE = re.compile(rb"\s+")
+
+
+def sniff_format(head):
+    """根据正文开头判断格式，返回 FORMAT_* 之一。"""
+    head = head.lstrip(b"\xef\xbb\xbf").lstrip()
+    if head.startswith(b"["):
+        return FORMAT_JSON
+    if _YAML_KEY_PATTERN.search(head) or _YAML_LIST_PATTERN.match(head):
+        return FORMAT_YAML
+    if b"://" in head:
+        return FORMAT_LINKS
+    if head and _BASE64_PATTERN.fullmatch(_WHITESPACE.sub(b"", head)):
+        return FORMAT_BASE64
+    return FORMAT_LINKS
+
+
+def _peek(chunks, size):
+    """读出开头至少 size 字节用于判断格式，返回 (开头字节, 包含全部内容的块迭代器)。"""
+    chunks = iter(chunks)
+    head = []
+    length = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        head.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            break
+    return b"".join(head)[:size], chain(head, chunks)
+
+
+def _iter_text(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _iter_lines(text_chunks):
+    pending = ""
+    for text in text_chunks:
+        lines = (pending + text).split("\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _iter_base64_decoded(chunks):
+    """增量 Base64 解码 (兼容 URL 安全字母表、换行和缺失的填充)，每次只解码 4 的整数倍长度。"""
+    pending = b""
+    for chunk in chunks:
+        pending += _WHITESPACE.sub(b"", chunk).replace(b"-", b"+").replace(b"_", b"/")
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield base64.b64decode(pending[:usable])
+            pending = pending[usable:]
+    pending = pending.rstrip(b"=")
+    if pending:
+        yield base64.b64decode(pending + b"=" * (-len(pending) % 4))
+
+
+class _TextStream:
+    """把文本块迭代器包装成带 read(size) 的文件对象，供 yaml 的 Reader 按需读取。"""
+
+    def __init__(self, text_chunks):
+        self.chunks = text_chunks
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            text = next(self.chunks, None)
+            if text is None:
+                break
+            self.buffer += text
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _iter_yaml_proxies(text_chunks):
+    """
+    按事件流解析 YAML：只在内存中构造顶层 proxies 列表 (或顶层节点列表) 的当前一项，其余顶层键的值跳过。
+    """
+    loader = yaml.SafeLoader(_TextStream(text_chunks))
+    try:
+        loader.get_event()   # StreamStart
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()   # DocumentStart
+        if loader.check_event(yaml.SequenceStartEvent):
+            loader.get_event()
+            yield from _iter_yaml_sequence(loader)
+            return
+        if not loader.check_event(yaml.MappingStartEvent):
+            return
+        loader.get_event()
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_document(loader.compose_node(None, None))
+            if key == "proxies" and loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                yield from _iter_yaml_sequence(loader)
+                return
+            loader.compose_node(None, None)
+            loader.anchors = {}
+    finally:
+        loader.dispose()
+
+
+def _iter_yaml_sequence(loader):
+    while not loader.check_event(yaml.SequenceEndEvent):
+        item = loader.construct_document(loader.compose_node(None, None))
+        loader.anchors = {}
+        if isinstance(item, dict) and "type" in item:
+            yield item
+
+
+def _iter_json_array(text_chunks):
+    """增量解析顶层 JSON 数组，逐个产出元素。"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    text_chunks = iter(text_chunks)
+    exhausted = False
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if not started and buffer:
+            if buffer[0] != "[":
+                raise ValueError("不是 JSON 数组")
+            buffer = buffer[1:].lstrip()
+            started = True
+            continue
+        if started and buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            else:
+                yield item
+                buffer = buffer[end:]
+                continue
+        if exhausted:
+            return
+        text = next(text_chunks, None)
+        if text is None:
+            exhausted = True
+        else:
+            buffer += text
+
+
+def _iter_v2rayn_proxies(text_chunks):
+    for node in _iter_json_array(text_chunks):
+        if not (isinstance(node, dict) and "v" in node and "ps" in node):
+            continue
+        vmess_link = f"vmess://{base64.b64encode(json.dumps(node).encode('utf-8')).decode('utf-8')}"
+        proxy = parse_proxy_dict(vmess_link)
+        if proxy:
+            yield proxy
+
+
+def parse_link_lines(lines, parse_cache=None):
+    """逐行解析链接；有解析缓存 (见 parse_cache.py) 时按行内容的 SHA-256 批量查缓存，只解析没见过的行。"""
+    lines = [line for line in lines if line.strip()]
+    if parse_cache is None:
+        return [proxy for proxy in map(parse_proxy_dict, lines) if proxy]
+
+    digests = [content_digest(line) for line in lines]
+    cached = parse_cache.get_many("line", digests)
+    parsed = {}
+    for line, digest in zip(lines, digests):
+        if digest not in cached and digest not in parsed:
+            parsed[digest] = parse_proxy_dict(line)
+    if parsed:
+        parse_cache.put_many("line", parsed)
+    cached.update(parsed)
+    return [cached[digest] for digest in digests if cached[digest]]
+
+
+def _iter_link_proxies(text_chunks, parse_cache):
+    batch = []
+    for line in _iter_lines(text_chunks):
+        batch.append(line)
+        if len(batch) >= LINE_BATCH_SIZE:
+            yield from parse_link_lines(batch, parse_cache)
+            batch = []
+    if batch:
+        yield from parse_link_lines(batch, parse_cache)
+
+
+def _iter_proxies(chunks, parse_cache, formats):
+    head, chunks = _peek(chunks, SNIFF_SIZE)
+    fmt = sniff_format(head)
+    formats.append(fmt)
+    try:
+        if fmt == FORMAT_BASE64:
+            yield from _iter_proxies(_iter_base64_decoded(chunks), parse_cache, formats)
+        elif fmt == FORMAT_YAML:
+            yield from _iter_yaml_proxies(_iter_text(chunks))
+        elif fmt == FORMAT_JSON:
+            yield from _iter_v2rayn_proxies(_iter_text(chunks))
+        else:
+            yield from _iter_link_proxies(_iter_text(chunks), parse_cache)
+    except (yaml.YAMLError, ValueError, binascii.Error) as e:
+        print(f"  ⚠️ 按 {fmt} 格式解析时出错，已停止解析该订阅: {e}", flush=True)
+
+
+def iter_subscription_proxies(chunks, parse_cache=None, formats=None):
+    """
+    流式解析订阅正文 (字节块迭代器)，逐个产出 Clash 代理字典。
+    formats 为列表时，依次追加识别出的格式 (Base64 包裹时为 ["base64", 内层格式])，便于调用方打印日志。
+    格式与内容不符导致解析出错时就此结束，已产出的节点保留。
+    解析器可能在正文结束前停止 (YAML 读完 proxies 列表、JSON 读到 "]"、解析出错)，之后仍会读完剩余的块 (不解码)，
+    保证调用方传入的包装迭代器 (例如边读边写缓存、计算哈希的迭代器) 完整走完。
+    """
+    chunks = iter(chunks)
+    yield from _iter_proxies(chunks, parse_cache, formats if formats is not None else [])
+    for _ in chunks:
+        pass
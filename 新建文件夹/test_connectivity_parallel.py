@@ -5,16 +5,22 @@ import sys
 import datetime
 import pytz
 import re
-import base64
 import json
 import tempfile
 import shutil
-import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import subprocess
+import asyncio
+import socket
+import ssl
+import threading
 import requests
-from urllib.parse import quote, unquote, urlparse, parse_qs
+import httpx
+from node_parser import parse_proxy_link, generate_proxy_fingerprint
+from node_health import NodeHealthStore
+from dns_cache import pre_resolve_async
+from mihomo_supervisor import MihomoSupervisor, kill_registered
+from urllib.parse import quote, unquote
+from concurrent.futures import ProcessPoolExecutor
 from requests.exceptions import Timeout, ConnectionError
 
 # 强制日志实时刷新
@@ -26,6 +32,13 @@ REMOTE_CONFIG_URLS = [
     "https://raw.githubusercontent.com/qjlxg/pin/refs/heads/main/trojan_links.txt",
 ]
 
+# 分片测试：设置 NODE_SHARD=i 时只下载 generate_config.py 生成的第 i 个分片，供 CI 矩阵并行运行；
+# 各分片结果写入独立文件，最后用 --merge 合并 (见 merge_results)
+NODE_SHARD = os.environ.get("NODE_SHARD", "")
+SHARD_URL_TEMPLATE = "https://raw.githubusercontent.com/qjlxg/pin/refs/heads/main/trojan_links.shard-{shard}.txt"
+if NODE_SHARD:
+    REMOTE_CONFIG_URLS = [SHARD_URL_TEMPLATE.format(shard=NODE_SHARD)]
+
 TEST_URLS = [
     "http://www.google.com/generate_204",
     "http://www.youtube.com",
@@ -40,7 +53,48 @@ MAX_RETRIES = 2
 VERBOSE = True
 SHARED_GEO_DIR = "./geodata_cache"
 
-API_WAIT_LOOPS = int(MAX_API_WAIT_TIME / 0.5) 
+API_SECRET = 'githubactions'
+API_HEADERS = {'Authorization': f'Bearer {API_SECRET}'}
+
+# asyncio 探测引擎：全局并发预算 + 每个 mihomo 控制器的并发上限
+ASYNC_MAX_CONCURRENCY = 256
+ASYNC_PER_HOST_LIMIT = 32
+
+# 控制器地址：默认向系统申请空闲 TCP 端口；开启后改用 Unix 域套接字，完全不占用 TCP 端口
+CONTROLLER_UNIX = False
+
+# mihomo 进程由 mihomo_supervisor.py 监管：跟踪日志中的监听行判断就绪，辅以指数退避的端口连通检查
+MIHOMO_BINARY = "./mihomo-linux-amd64"
+STARTUP_HISTOGRAM_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, MAX_API_WAIT_TIME]
+
+# 多路复用：一个 mihomo 进程加载一整片节点，并发调用 delay API
+MULTIPLEX_MODE = True
+MULTIPLEX_SHARD_SIZE = 500   # 每个 mihomo 实例加载的节点数
+MULTIPLEX_INSTANCES = 2      # 同时运行的 mihomo 实例数
+MULTIPLEX_MAX_REPAIRS = 50   # 配置加载失败时最多剔除的问题节点数
+
+# 预处理：节点解析在进程池中完成，节点数较少时直接在当前进程解析
+PRECOMPUTE_PROCESSES = os.cpu_count() or 1
+PRECOMPUTE_MIN_POOL_SIZE = 2000
+
+# 预筛选漏斗：先做廉价的 TCP 连接、再做带 SNI 的 TLS 握手，只有通过的节点才进入 mihomo 延迟测试
+PREFILTER_MODE = True
+PREFILTER_TCP_CONCURRENCY = 200   # TCP 阶段并发上限
+PREFILTER_TLS_CONCURRENCY = 100   # TLS 阶段并发上限
+PREFILTER_TIMEOUT = 5             # 单次连接/握手超时 (秒)
+
+# 跨运行的节点健康记录 (见 node_health.py)：近期健康的节点沿用上次结果，持续失效的节点指数退避
+HEALTH_CACHE_MODE = True
+HEALTH_SCOPE = "delay"
+
+# DNS 预解析 (见 dns_cache.py)：连接测试前批量解析 server/SNI 域名，NXDOMAIN 的节点直接判定失败，
+# 解析结果写入 mihomo 配置的 hosts: 段，预筛选阶段也直接连接解析出的 IP
+DNS_PRERESOLVE_MODE = True
+RESOLVED_HOSTS = {}
+
+# 常驻进程池：回退路径不再每个节点启动一次 mihomo，而是通过 PUT /configs 热切换配置
+WARM_POOL_SIZE = MAX_WORKERS
+WARM_POOL_RECYCLE_AFTER = 200  # 每个常驻进程测试多少个节点后重启，防止内存累积
 
 
 # --- 节点获取函数（未变动） ---
@@ -75,329 +129,706 @@ def fetch_and_parse_nodes():
     return all_nodes
 
 
-def test_single_node(node_link):
-    clash_process = None
-    
-    try:
-        with tempfile.TemporaryDirectory(prefix="mihomo_test_") as temp_dir: 
-            
-            proxy_name_final = "NODE"
-            remark_match = re.search(r'#(.+)', node_link)
-            if remark_match:
-                try:
-                    proxy_name_final = re.sub(r'[\'\":\[\]]', '', unquote(remark_match.group(1)).strip())[:60]
-                except:
-                    pass
+def get_proxy_name(node_link):
+    """从链接备注中提取节点名称。"""
+    proxy_name_final = "NODE"
+    remark_match = re.search(r'#(.+)', node_link)
+    if remark_match:
+        try:
+            proxy_name_final = re.sub(r'[\'\":\[\]]', '', unquote(remark_match.group(1)).strip())[:60]
+        except:
+            pass
+    return proxy_name_final
+
+
+def render_mihomo_config(proxies, controller):
+    """
+    生成完整的 mihomo 配置 (JSON 文本，YAML 是 JSON 的超集，mihomo 可直接加载)，
+    proxies 为 ProxyNode.to_clash_dict 生成的字典列表。
+    controller 为 TCP 端口 (int) 或 Unix 套接字路径 (str)；延迟测试只走控制器 API，不需要入站端口。
+    """
+    config = {
+        "log-level": "info",
+        "allow-lan": False,
+        "mode": "rule",
+        "secret": API_SECRET,
+        "geodata-dir": SHARED_GEO_DIR,
+        "geodata-loader": "memconservative",
+        "proxies": proxies,
+        "proxy-groups": [{
+            "name": "NODE_TEST_GROUP",
+            "type": "select",
+            # 常驻进程的初始配置不含节点，select 组至少需要一个成员
+            "proxies": [p["name"] for p in proxies] or ["DIRECT"],
+        }],
+    }
+    hosts = {p["server"]: RESOLVED_HOSTS[p["server"]] for p in proxies if p["server"] in RESOLVED_HOSTS}
+    if hosts:
+        config["hosts"] = hosts
+    if isinstance(controller, str):
+        config["external-controller-unix"] = controller
+    else:
+        config["external-controller"] = f"127.0.0.1:{controller}"
+    return json.dumps(config, ensure_ascii=False)
 
-            if VERBOSE:
-                print(f"\n开始测试 → {proxy_name_final}", flush=True)
-
-            for attempt in range(MAX_RETRIES):
-                if VERBOSE and MAX_RETRIES > 1:
-                    print(f"  第 {attempt+1}/{MAX_RETRIES} 次尝试", flush=True)
-                
-                if clash_process:
-                    clash_process.terminate() 
-                    try:
-                        clash_process.wait(timeout=1)
-                    except subprocess.TimeoutExpired:
-                        clash_process.kill()
-                        clash_process.wait()
-                    clash_process = None
-
-                seed_str = f"{node_link}_{attempt}_{threading.get_ident()}_{int(time.time()*100000)}"
-                seed = abs(hash(seed_str)) % 25000
-                api_port = 30000 + seed
-                proxy_port = 40000 + seed
-                unique_id = f"t{threading.get_ident()}_a{attempt}_{seed}"
-                config_path = os.path.join(temp_dir, f"config_{unique_id}.yaml")
-                log_path = os.path.join(temp_dir, f"mihomo_{unique_id}.log")
-
-                proxy_config_yaml = ""
-                protocol = ""
-
-                # --- 协议解析与配置生成 (Trojan, VLESS, VMESS, Hysteria2) ---
-                try:
-                    url_parts = urlparse(node_link)
-                    raw_protocol = url_parts.scheme.lower()
-                    protocol = raw_protocol
-                    if raw_protocol in ['hy2', 'hysteria2']:
-                        protocol = 'hysteria2'
-
-                    # VLESS 解析 (保持 V6 一致)
-                    if protocol == 'vless':
-                        uuid = url_parts.username
-                        server = url_parts.hostname
-                        port = url_parts.port or 443
-                        params = parse_qs(url_parts.query)
-                        security = params.get('security', ['none'])[0].lower()
-                        flow = params.get('flow', [''])[0]
-                        network = params.get('type', ['tcp'])[0].lower()
-                        sni = params.get('sni', params.get('peer', ['']))[0] or server
-                        allow_insecure = params.get('allowInsecure', ['0'])[0] in ['1', 'true']
-                        tls_config = ""
-                        if security in ['tls', 'reality']:
-                            skip_verify = "true" if security == 'reality' or allow_insecure else "false"
-                            if security == 'reality':
-                                pbk = params.get('pbk', [''])[0]
-                                short_id = params.get('sid', [''])[0]
-                                if not pbk: raise ValueError("Reality 需要 pbk")
-                                tls_config = f"    tls: true\n    skip-cert-verify: true\n    servername: {sni}\n    reality-opts:\n      public-key: {pbk}\n      short-id: {short_id or '0'}\n"
-                            else:
-                                tls_config = f"    tls: true\n    skip-cert-verify: {skip_verify}\n    servername: {sni}\n"
-                        transport_config = ""
-                        if network == 'ws':
-                            path = unquote(params.get('path', ['/'])[0])
-                            host = params.get('host', [sni])[0]
-                            transport_config = f"    network: ws\n    ws-opts:\n      path: {path}\n      headers:\n        Host: {host}\n"
-                        elif network == 'grpc':
-                            service_name = params.get('serviceName', ['GunService'])[0]
-                            transport_config = f"    network: grpc\n    grpc-opts:\n      grpc-service-name: {service_name}\n"
-                        flow_config = f"    flow: {flow}\n" if flow else ""
-                        proxy_config_yaml = f"""  - name: {proxy_name_final}
-    type: vless
-    server: {server}
-    port: {port}
-    uuid: {uuid}
-    udp: true
-{flow_config}{tls_config}{transport_config}"""
-                    
-                    # (省略其他协议的解析代码，保持 V6 一致)
-                    
-                    # TROJAN
-                    elif protocol == 'trojan':
-                        password = url_parts.username or ""
-                        server = url_parts.hostname
-                        port = url_parts.port or 443
-                        params = parse_qs(url_parts.query)
-                        sni = params.get('sni', params.get('peer', ['']))[0] or server
-                        allow_insecure = params.get('allowInsecure', params.get('allowinsecure', ['0']))[0] in ['1', 'true']
-                        tls_config = f"  tls: true\n  servername: {sni}\n  skip-cert-verify: {str(allow_insecure).lower()}\n"
-                        ws_config = ""
-                        if params.get('type', [''])[0].lower() == 'ws':
-                            path = unquote(params.get('path', ['/'])[0])
-                            host_header = params.get('host', [sni])[0]
-                            ws_config = f"  network: ws\n  ws-opts:\n    path: {path}\n    headers:\n      Host: {host_header}\n"
-                        proxy_config_yaml = f"""  - name: {proxy_name_final}
-    type: trojan
-    server: {server}
-    port: {port}
-    password: {password}
-{tls_config}{ws_config}"""
-
-                    # VMESS
-                    elif protocol == 'vmess':
-                        body = node_link[8:].split('#')[0]
-                        body += '=' * ((4 - len(body) % 4) % 4)
-                        vmess_json = json.loads(base64.b64decode(body).decode('utf-8'))
-                        server = vmess_json['add']
-                        port = int(vmess_json['port'])
-                        uuid = vmess_json['id']
-                        aid = int(vmess_json.get('aid', 0))
-                        scy = vmess_json.get('scy', 'auto')
-                        net = vmess_json.get('net', 'tcp')
-                        tls = vmess_json.get('tls', '')
-                        sni = vmess_json.get('sni', vmess_json.get('host', server))
-                        path = vmess_json.get('path', '')
-                        host = vmess_json.get('host', '')
-                        tls_config = f"    tls: true\n    servername: {sni}\n    skip-cert-verify: false\n" if tls == 'tls' else ""
-                        network_config = ""
-                        if net == 'ws':
-                            headers = f"\n        Host: {host or sni}" if host or sni else ""
-                            network_config = f"    network: ws\n    ws-opts:\n      path: {path or '/'}{headers}\n"
-                        elif net == 'grpc':
-                            network_config = f"    network: grpc\n    grpc-opts:\n      grpc-service-name: {path or 'GunService'}\n"
-                        proxy_config_yaml = f"""  - name: {proxy_name_final}
-    type: vmess
-    server: {server}
-    port: {port}
-    uuid: {uuid}
-    alterId: {aid}
-    cipher: {scy}
-    udp: true
-{tls_config}{network_config}"""
-                    
-                    # HYSTERIA2
-                    elif protocol == 'hysteria2':
-                        password = url_parts.username or ""
-                        server = url_parts.hostname
-                        port = url_parts.port or 443
-                        params = parse_qs(url_parts.query)
-                        if not password: password = params.get('auth', [''])[0] or params.get('password', [''])[0]
-                        sni = params.get('sni', params.get('peer', ['']))[0] or server
-                        insecure = params.get('insecure', params.get('allowInsecure', ['0']))[0] in ['1', 'true']
-                        up_mbps = params.get('up', ['100'])[0]
-                        down_mbps = params.get('down', ['100'])[0]
-                        obfs_type = params.get('obfs', [''])[0]
-                        obfs_password = params.get('obfs-password', [''])[0]
-                        obfs_config = ""
-                        if obfs_type == 'salamander':
-                            obfs_config = f"    obfs:\n      type: salamander\n      salamander-password: {obfs_password or 'crybaby'}\n"
-                        proxy_config_yaml = f"""  - name: {proxy_name_final}
-    type: hysteria2
-    server: {server}
-    port: {port}
-    password: {password}
-    up-mbps: {up_mbps}
-    down-mbps: {down_mbps}
-    tls: true
-    servername: {sni}
-    skip-cert-verify: {str(insecure).lower()}
-    alpn:
-      - h3
-{obfs_config}    fast-open: true
-"""
-                    else:
-                        return False, node_link, 99999
 
-                except Exception as e:
-                    if VERBOSE:
-                        print(f"  ❌ 解析失败: {e}", flush=True)
+class PortAllocator:
+    """
+    由内核分配空闲端口 (绑定 127.0.0.1:0)，并在锁保护下记录已发出的端口，
+    保证并行的 mihomo 实例之间不会拿到同一个端口；进程退出后用 release 归还。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reserved = set()
+
+    def allocate(self):
+        with self.lock:
+            while True:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    sock.bind(("127.0.0.1", 0))
+                    port = sock.getsockname()[1]
+                if port not in self.reserved:
+                    self.reserved.add(port)
+                    return port
+
+    def release(self, port):
+        with self.lock:
+            self.reserved.discard(port)
+
+
+PORT_ALLOCATOR = PortAllocator()
+
+
+def allocate_controller(work_dir, tag):
+    """为一个 mihomo 实例分配控制器地址：Unix 套接字路径或空闲 TCP 端口。"""
+    if CONTROLLER_UNIX:
+        return os.path.join(work_dir, f"{tag}.sock")
+    return PORT_ALLOCATOR.allocate()
+
+
+def release_controller(controller):
+    if controller is None:
+        return
+    if isinstance(controller, str):
+        if os.path.exists(controller):
+            os.unlink(controller)
+    else:
+        PORT_ALLOCATOR.release(controller)
+
+
+def new_supervisor(config_path, work_dir, controller, log_path):
+    """每个测试用 mihomo 实例一个监管器 (见 mihomo_supervisor.py)，启动失败不重试，由调用方决定剔除节点或回退。"""
+    return MihomoSupervisor(MIHOMO_BINARY, config_path, work_dir=work_dir, controller=controller, log_path=log_path,
+                            ready_timeout=MAX_API_WAIT_TIME, max_start_attempts=1, secret=API_SECRET)
+
+
+async def start_supervised(supervisor):
+    """启动并记录启动耗时，返回是否就绪。"""
+    if await supervisor.start():
+        STARTUP_STATS.record(supervisor.ready_seconds)
+        return True
+    STARTUP_STATS.record_failure()
+    await supervisor.stop()
+    return False
+
+
+# --- mihomo 就绪检测 ---
+class StartupStats:
+    """记录每次 mihomo 启动到 API 就绪的耗时，运行结束时输出直方图。"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.samples = []
+        self.failures = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def record_failure(self):
+        self.failures += 1
+
+    def print_histogram(self):
+        if not self.samples and not self.failures:
+            return
+        print(f"\n--- mihomo 启动耗时分布 (成功 {len(self.samples)} 次, 失败 {self.failures} 次) ---", flush=True)
+        if not self.samples:
+            return
+        ordered = sorted(self.samples)
+        lower = -1
+        for upper in self.buckets:
+            count = sum(1 for x in ordered if lower < x <= upper)
+            bar = "█" * max(1 if count else 0, round(count / len(ordered) * 40))
+            print(f"  ≤{upper:>5}s | {count:>5} {bar}", flush=True)
+            lower = upper
+        p50 = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        print(f"  平均 {sum(ordered) / len(ordered):.3f}s  P50 {p50:.3f}s  P95 {p95:.3f}s  最大 {ordered[-1]:.3f}s", flush=True)
+
+
+STARTUP_STATS = StartupStats(STARTUP_HISTOGRAM_BUCKETS)
+
+
+# --- asyncio 探测引擎 ---
+class ProbeEngine:
+    """
+    共享一个 httpx.AsyncClient (按控制器地址复用 keep-alive 连接)，
+    用全局信号量限制总并发，用每个控制器一个信号量保证各实例之间的公平性。
+    Unix 套接字控制器各自使用一个绑定到该套接字的客户端。
+    """
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            headers=API_HEADERS,
+            timeout=httpx.Timeout(NODE_TIMEOUT + 2, connect=2),
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONCURRENCY, max_keepalive_connections=ASYNC_MAX_CONCURRENCY),
+        )
+        self.global_limit = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+        self.host_limits = {}
+        self.unix_clients = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.client.aclose()
+        for client in self.unix_clients.values():
+            await client.aclose()
+
+    def endpoint(self, controller):
+        """返回访问该控制器所用的 (客户端, 基础 URL)。"""
+        if not isinstance(controller, str):
+            return self.client, f"http://127.0.0.1:{controller}"
+        if controller not in self.unix_clients:
+            self.unix_clients[controller] = httpx.AsyncClient(
+                headers=API_HEADERS,
+                timeout=httpx.Timeout(NODE_TIMEOUT + 2, connect=2),
+                limits=httpx.Limits(max_connections=ASYNC_PER_HOST_LIMIT, max_keepalive_connections=ASYNC_PER_HOST_LIMIT),
+                transport=httpx.AsyncHTTPTransport(uds=controller),
+            )
+        return self.unix_clients[controller], "http://mihomo"
+
+    def _host_limit(self, controller):
+        if controller not in self.host_limits:
+            self.host_limits[controller] = asyncio.Semaphore(ASYNC_PER_HOST_LIMIT)
+        return self.host_limits[controller]
+
+    async def release_host(self, controller):
+        self.host_limits.pop(controller, None)
+        client = self.unix_clients.pop(controller, None)
+        if client is not None:
+            await client.aclose()
+
+    async def _delay_once(self, controller, encoded_name, test_url):
+        client, base_url = self.endpoint(controller)
+        delay_url = f"{base_url}/proxies/{encoded_name}/delay"
+        params = {"url": test_url, "timeout": NODE_TIMEOUT * 1000}
+        async with self.global_limit, self._host_limit(controller):
+            try:
+                r = await client.get(delay_url, params=params)
+                delay_ms = r.json().get('delay', 0)
+            except (httpx.HTTPError, ValueError):
+                return None
+        return delay_ms if delay_ms > 0 else None
+
+    async def probe_delay(self, controller, proxy_name):
+        """并发请求全部 TEST_URLS，任一成功即取消其余请求；返回延迟 (ms)，全部失败返回 None。"""
+        encoded_name = quote(proxy_name, safe='')
+        tasks = [asyncio.ensure_future(self._delay_once(controller, encoded_name, url)) for url in TEST_URLS]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                delay_ms = await next_done
+                if delay_ms:
+                    return delay_ms
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+# --- 常驻 mihomo 进程池 ---
+class WarmWorker:
+    """一个常驻的 mihomo 进程：端口与 geodata 只在启动时准备一次，之后通过 PUT /configs 切换待测节点。"""
+
+    def __init__(self, worker_id, engine):
+        self.worker_id = worker_id
+        self.engine = engine
+        self.temp_dir = tempfile.mkdtemp(prefix=f"mihomo_warm{worker_id}_")
+        self.config_path = os.path.join(self.temp_dir, "config.json")
+        self.supervisor = None
+        self.controller = None
+        self.generation = 0
+        self.tests_done = 0
+
+    def alive(self):
+        return self.supervisor is not None and self.supervisor.alive()
+
+    async def start(self):
+        """启动 (或重启) mihomo 进程，成功返回 True。"""
+        await self.stop()
+        self.generation += 1
+        self.tests_done = 0
+        self.controller = allocate_controller(self.temp_dir, f"ctl{self.generation}")
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            f.write(render_mihomo_config([], self.controller))
+        self.supervisor = new_supervisor(self.config_path, self.temp_dir, self.controller,
+                                         os.path.join(self.temp_dir, f"mihomo_{self.generation}.log"))
+        if await start_supervised(self.supervisor):
+            return True
+        await self.stop()
+        return False
+
+    async def load(self, proxy):
+        """热切换为只包含一个节点的配置；mihomo 拒绝该配置时返回 (False, 错误信息)。"""
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            f.write(render_mihomo_config([proxy], self.controller))
+        client, base_url = self.engine.endpoint(self.controller)
+        try:
+            r = await client.put(
+                f"{base_url}/configs",
+                params={"force": "true"},
+                json={"path": os.path.abspath(self.config_path)},
+            )
+        except httpx.HTTPError as e:
+            return False, str(e)
+        if r.status_code >= 400:
+            return False, r.text[:300]
+        self.tests_done += 1
+        return True, ""
+
+    async def stop(self):
+        if self.supervisor is not None:
+            await self.supervisor.stop()
+        if self.controller is not None:
+            await self.engine.release_host(self.controller)
+            release_controller(self.controller)
+            self.controller = None
+
+    async def close(self):
+        await self.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+class WarmPool:
+    """固定大小的常驻 mihomo 进程池：按需启动，测满 WARM_POOL_RECYCLE_AFTER 个节点或进程崩溃后重启。"""
+
+    def __init__(self, engine, size):
+        self.workers = [WarmWorker(i, engine) for i in range(size)]
+        self.idle = asyncio.Queue()
+        for worker in self.workers:
+            self.idle.put_nowait(worker)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await asyncio.gather(*(worker.close() for worker in self.workers))
+
+    async def acquire(self):
+        """取出一个可用的进程，必要时 (首次使用、崩溃、达到回收次数) 先重启；启动失败返回 None。"""
+        worker = await self.idle.get()
+        if not worker.alive() or worker.tests_done >= WARM_POOL_RECYCLE_AFTER:
+            if worker.alive() and VERBOSE:
+                print(f"  ♻️ 常驻进程 {worker.worker_id} 已测试 {worker.tests_done} 个节点，重启回收", flush=True)
+            if not await worker.start():
+                log_text = worker.supervisor.log_text() if worker.supervisor else ""
+                print(f"❌ 常驻进程 {worker.worker_id} 启动失败:\n{log_text}", file=sys.stderr, flush=True)
+                self.idle.put_nowait(worker)
+                return None
+        return worker
+
+    def release(self, worker):
+        self.idle.put_nowait(worker)
+
+
+async def test_single_node(engine, pool, node_link, proxy):
+    """proxy 为预处理阶段生成的 Clash 字典，重试时直接复用。"""
+    proxy_name_final = proxy["name"]
+
+    if VERBOSE:
+        print(f"\n开始测试 → {proxy_name_final}", flush=True)
+
+    for attempt in range(MAX_RETRIES):
+        if VERBOSE and MAX_RETRIES > 1:
+            print(f"  第 {attempt+1}/{MAX_RETRIES} 次尝试", flush=True)
+
+        worker = await pool.acquire()
+        if worker is None:
+            continue
+        try:
+            # --- 热切换配置 ---
+            loaded, error = await worker.load(proxy)
+            if not loaded:
+                if VERBOSE:
+                    print(f"  ❌ 配置加载失败（第 {attempt+1} 次）: {error}", flush=True)
+                if worker.alive():
+                    # 进程正常但拒绝了配置，说明节点本身无法加载，重试无意义
                     return False, node_link, 99999
+                continue
+
+            # --- 连通性测试 ---
+            delay_ms = await engine.probe_delay(worker.controller, proxy_name_final)
+            if delay_ms:
+                if VERBOSE:
+                    print(f"  ✅ 成功！延迟 {delay_ms}ms", flush=True)
+                return True, node_link, delay_ms
+            if VERBOSE:
+                print(f"  ❌ {proxy_name_final} 第 {attempt+1} 次测试失败", flush=True)
+        finally:
+            pool.release(worker)
 
-                # --- 写入配置并启动 mihomo ---
-                yaml_content = f"""log-level: info
-allow-lan: false
-mode: rule
-mixed-port: {proxy_port}
-external-controller: 127.0.0.1:{api_port}
-secret: githubactions
-geodata-dir: {SHARED_GEO_DIR}
-geodata-loader: memconservative
-
-proxies:
-{proxy_config_yaml}
-proxy-groups:
-  - name: NODE_TEST_GROUP
-    type: select
-    proxies:
-      - {proxy_name_final}
-"""
+    return False, node_link, 99999
 
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    f.write(yaml_content)
-
-                clash_process = subprocess.Popen(
-                    ["./mihomo-linux-amd64", "-f", config_path, "-d", temp_dir],
-                    stdout=open(log_path, 'w'),
-                    stderr=subprocess.STDOUT
-                )
-
-                # --- API 启动检测 (30秒等待) ---
-                api_url = f"http://127.0.0.1:{api_port}/version"
-                headers = {'Authorization': 'Bearer githubactions'}
-                api_started = False
-                
-                for _ in range(API_WAIT_LOOPS): 
-                    try:
-                        r = requests.get(api_url, headers=headers, timeout=1)
-                        if r.status_code == 200:
-                            api_started = True
-                            break
-                    except:
-                        time.sleep(0.5)
-
-                if not api_started:
-                    if VERBOSE:
-                        print(f"  ❌ API 启动失败 (超时 {MAX_API_WAIT_TIME}秒)（第 {attempt+1} 次）", flush=True) 
-                    
-                    if clash_process:
-                        clash_process.terminate()
-                        try:
-                            clash_process.wait(timeout=1)
-                        except subprocess.TimeoutExpired:
-                            clash_process.kill()
-                            clash_process.wait()
-                    continue
-
-                time.sleep(1.8) # 启动后稳定延迟
-
-                # --- 连通性测试 ---
-                encoded_name = quote(proxy_name_final)
-                success = False
-                delay_ms = 99999
-
-                for test_url in TEST_URLS:
-                    delay_url = f"http://127.0.0.1:{api_port}/proxies/{encoded_name}/delay?url={quote(test_url)}&timeout={NODE_TIMEOUT * 1000}"
-                    try:
-                        r = requests.get(delay_url, headers=headers, timeout=NODE_TIMEOUT + 2)
-                        delay_ms = r.json().get('delay', 0)
-                        if delay_ms > 0:
-                            if VERBOSE:
-                                print(f"  ✅ 成功！延迟 {delay_ms}ms", flush=True)
-                            success = True
-                            break
-                    except:
-                        pass
-
-                if success:
-                    return True, node_link, delay_ms
-
-                # 节点测试失败，打印核心日志并清理
-                if os.path.exists(log_path):
-                    with open(log_path, 'r', encoding='utf-8') as f:
-                        log_content = f.read()[:3000]
-                    if log_content.strip():
-                        print(f"\n--- ❌ {proxy_name_final} 第 {attempt+1} 次失败日志 ---", file=sys.stderr, flush=True)
-                        print(log_content, file=sys.stderr, flush=True)
-                        print("-" * 60, file=sys.stderr, flush=True)
-
-                if clash_process:
-                    clash_process.terminate()
-                    try:
-                        clash_process.wait(timeout=1)
-                    except subprocess.TimeoutExpired:
-                        clash_process.kill()
-                        clash_process.wait()
 
+# --- 多路复用测试：一个 mihomo 进程加载一整片节点 ---
+async def test_shard(engine, shard_id, prepared_nodes, report):
+    """
+    将一片节点写入同一个 mihomo 配置，只启动一次进程，再并发调用 /proxies/{name}/delay。
+    配置加载失败时按日志中的 "proxy N:" 剔除问题节点后重启，剔除的节点交给单进程路径回退测试。
+    每个节点的结果通过 report 回调输出，返回需要回退的 (链接, 配置) 列表。
+    """
+    # 片内统一使用 N<序号> 作为节点名，避免备注中的特殊字符破坏整份配置
+    entries = [(f"N{shard_id}_{idx}", node_link, proxy) for idx, (node_link, proxy) in enumerate(prepared_nodes)]
+    fallback_nodes = []
+
+    reported = set()
+    supervisor = None
+    controller = None
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"mihomo_shard{shard_id}_") as temp_dir:
+            for repair in range(MULTIPLEX_MAX_REPAIRS + 1):
+                if not entries:
+                    break
+                controller = allocate_controller(temp_dir, f"ctl{repair}")
+                config_path = os.path.join(temp_dir, f"config_{repair}.json")
+                log_path = os.path.join(temp_dir, f"mihomo_{repair}.log")
+                with open(config_path, 'w', encoding='utf-8') as f:
+                    f.write(render_mihomo_config([dict(e[2], name=e[0]) for e in entries], controller))
+
+                supervisor = new_supervisor(config_path, temp_dir, controller, log_path)
+                if await start_supervised(supervisor):
+                    break
+
+                release_controller(controller)
+                controller = None
+                bad_index = re.search(r'proxy (\d+):', supervisor.last_error or supervisor.log_text(limit=20000))
+                if not bad_index or int(bad_index.group(1)) >= len(entries):
+                    print(f"⚠️ 分片 {shard_id} 启动失败且无法定位问题节点，整片回退到单进程测试", file=sys.stderr, flush=True)
+                    break
+                name, node_link, proxy = entries.pop(int(bad_index.group(1)))
+                fallback_nodes.append((node_link, proxy))
+                if VERBOSE:
+                    print(f"  🔧 分片 {shard_id} 剔除无法加载的节点 {name}，剩余 {len(entries)} 个", flush=True)
+
+            if controller is None:
+                fallback_nodes.extend(e[1:] for e in entries)
+                return fallback_nodes
+
+            print(f"🚀 分片 {shard_id}: 单个 mihomo 实例已加载 {len(entries)} 个节点", flush=True)
+
+            async def probe_entry(entry):
+                name, node_link, _ = entry
+                delay_ms = None
+                for attempt in range(MAX_RETRIES):
+                    delay_ms = await engine.probe_delay(controller, name)
+                    if delay_ms:
+                        break
+                reported.add(node_link)
+                report(bool(delay_ms), node_link, delay_ms or 99999)
+
+            await asyncio.gather(*(probe_entry(e) for e in entries))
     except Exception as e:
-        print(f"未知异常: {e}", file=sys.stderr, flush=True)
+        print(f"分片 {shard_id} 未知异常: {e}", file=sys.stderr, flush=True)
+        fallback_nodes.extend(e[1:] for e in entries if e[1] not in reported)
     finally:
-        if clash_process:
-            clash_process.terminate()
-            try:
-                clash_process.wait(timeout=1)
-            except subprocess.TimeoutExpired:
-                clash_process.kill()
-                clash_process.wait()
+        if supervisor is not None:
+            await supervisor.stop()
+        if controller is not None:
+            await engine.release_host(controller)
+            release_controller(controller)
+
+    return fallback_nodes
+
+
+async def run_multiplexed_tests(engine, prepared_nodes, report):
+    """按 MULTIPLEX_SHARD_SIZE 分片，每片一个 mihomo 进程；返回需要回退到单进程测试的节点。"""
+    shards = [prepared_nodes[i:i + MULTIPLEX_SHARD_SIZE] for i in range(0, len(prepared_nodes), MULTIPLEX_SHARD_SIZE)]
+    print(f"\n=== 多路复用模式: {len(prepared_nodes)} 个节点 → {len(shards)} 个 mihomo 实例 (并行 {MULTIPLEX_INSTANCES}) ===", flush=True)
+    instance_limit = asyncio.Semaphore(MULTIPLEX_INSTANCES)
+
+    async def run_shard(shard_id, shard):
+        async with instance_limit:
+            return await test_shard(engine, shard_id, shard, report)
+
+    shard_fallbacks = await asyncio.gather(*(run_shard(i, s) for i, s in enumerate(shards)))
+    return [node for fallback in shard_fallbacks for node in fallback]
+
+
+async def _run_parallel_tests(prepared_nodes, report):
+    if not prepared_nodes:
+        return
+    if DNS_PRERESOLVE_MODE:
+        prepared_nodes = await preresolve_nodes(prepared_nodes, report)
+        if not prepared_nodes:
+            return
+    if PREFILTER_MODE:
+        prepared_nodes = await prefilter_nodes(prepared_nodes, report)
+
+    async with ProbeEngine() as engine:
+        fallback_nodes = prepared_nodes
+        if MULTIPLEX_MODE:
+            fallback_nodes = await run_multiplexed_tests(engine, prepared_nodes, report)
+            if fallback_nodes:
+                print(f"\n=== {len(fallback_nodes)} 个节点回退到单进程测试 ===", flush=True)
+
+        if not fallback_nodes:
+            return
+
+        async with WarmPool(engine, min(WARM_POOL_SIZE, len(fallback_nodes))) as pool:
+            async def run_single(node_link, proxy):
+                try:
+                    status, link, delay_ms = await test_single_node(engine, pool, node_link, proxy)
+                    report(status, link, delay_ms)
+                except Exception as e:
+                    print(f"💥 节点测试失败 (未知错误): {e}", file=sys.stderr, flush=True)
+
+            await asyncio.gather(*(run_single(node_link, proxy) for node_link, proxy in fallback_nodes))
+
+
+# --- 预处理：解析全部节点并生成 mihomo 配置项 ---
+def _precompute_node(node_link):
+    node = parse_proxy_link(node_link)
+    return node.to_clash_dict(get_proxy_name(node_link)) if node else None
+
+
+def precompute_nodes(valid_nodes):
+    """
+    在进程池中解析全部节点，返回 ([(链接, Clash 字典)], [无法解析的链接])。
+    节点较少时直接在当前进程解析，省去进程池的启动开销。
+    """
+    started = time.monotonic()
+    if PRECOMPUTE_PROCESSES > 1 and len(valid_nodes) >= PRECOMPUTE_MIN_POOL_SIZE:
+        chunksize = max(1, len(valid_nodes) // (PRECOMPUTE_PROCESSES * 4))
+        with ProcessPoolExecutor(max_workers=PRECOMPUTE_PROCESSES) as executor:
+            proxies = list(executor.map(_precompute_node, valid_nodes, chunksize=chunksize))
+    else:
+        proxies = [_precompute_node(node_link) for node_link in valid_nodes]
+
+    prepared_nodes = [(node_link, proxy) for node_link, proxy in zip(valid_nodes, proxies) if proxy]
+    rejected_nodes = [node_link for node_link, proxy in zip(valid_nodes, proxies) if not proxy]
+    print(f"🧩 预处理完成: 可测试 {len(prepared_nodes)} 个, 无法解析 {len(rejected_nodes)} 个, 耗时 {time.monotonic() - started:.2f}s", flush=True)
+    return prepared_nodes, rejected_nodes
+
+
+# --- 预筛选漏斗：TCP 连接 → TLS/SNI 握手 → mihomo 延迟测试 ---
+def _tls_target(proxy):
+    """
+    返回 TLS 阶段要使用的 SNI；不适用 TLS 预检的节点返回 None：
+    未启用 TLS 的节点，以及 Reality (SNI 是伪装目标) 和 hysteria2 (QUIC/UDP)。
+    """
+    if proxy["type"] == "hysteria2" or "reality-opts" in proxy:
+        return None
+    if proxy["type"] == "trojan":
+        return proxy.get("sni") or proxy["server"]
+    if proxy.get("tls"):
+        return proxy.get("servername") or proxy["server"]
+    return None
+
+
+async def _close_writer(writer):
+    """关闭连接并等待传输层真正关闭，避免大批量预检时残留半关闭的 transport。"""
+    writer.close()
+    try:
+        await asyncio.wait_for(writer.wait_closed(), timeout=PREFILTER_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        pass
+
+
+async def _tcp_check(proxy):
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(RESOLVED_HOSTS.get(proxy["server"], proxy["server"]), proxy["port"]),
+            timeout=PREFILTER_TIMEOUT)
+    except (OSError, asyncio.TimeoutError, UnicodeError):
+        return False
+    await _close_writer(writer)
+    return True
+
+
+async def _tls_check(proxy, sni):
+    context = ssl.create_default_context()
+    if proxy.get("skip-cert-verify"):
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(RESOLVED_HOSTS.get(proxy["server"], proxy["server"]), proxy["port"],
+                                    ssl=context, server_hostname=sni),
+            timeout=PREFILTER_TIMEOUT)
+    except (OSError, asyncio.TimeoutError, UnicodeError, ssl.SSLError):
+        return False
+    await _close_writer(writer)
+    return True
+
+
+async def prefilter_nodes(prepared_nodes, report):
+    """
+    两级预筛选，每级有独立的并发上限。未通过的节点直接通过 report 判定失败，返回幸存节点。
+    TCP 阶段按 (server, port) 分组、TLS 阶段按 (server, port, SNI) 分组，每组只检查一次，结果分发给组内所有节点；
+    trojan_links.txt 中的节点共用同一个端点，只有 SNI 需要逐个检查。
+    hysteria2 走 UDP，不做 TCP/TLS 预检，直接进入 mihomo 测试。
+    """
+    tcp_limit = asyncio.Semaphore(PREFILTER_TCP_CONCURRENCY)
+    tls_limit = asyncio.Semaphore(PREFILTER_TLS_CONCURRENCY)
+
+    tcp_groups = {}
+    tls_groups = {}
+    for node_link, proxy in prepared_nodes:
+        if proxy["type"] == "hysteria2":
+            continue
+        endpoint = (proxy["server"], proxy["port"])
+        tcp_groups.setdefault(endpoint, proxy)
+        sni = _tls_target(proxy)
+        if sni is not None:
+            tls_groups.setdefault(endpoint + (sni, bool(proxy.get("skip-cert-verify"))), (proxy, sni))
+
+    async def check_endpoint(proxy):
+        async with tcp_limit:
+            return await _tcp_check(proxy)
+
+    async def check_sni(key, proxy, sni):
+        if not tcp_results[key[:2]]:
+            return False
+        async with tls_limit:
+            return await _tls_check(proxy, sni)
+
+    print(f"\n=== 预筛选 {len(prepared_nodes)} 个节点: {len(tcp_groups)} 个 TCP 端点, {len(tls_groups)} 个 TLS/SNI 组合 "
+          f"(TCP 并发 {PREFILTER_TCP_CONCURRENCY}, TLS 并发 {PREFILTER_TLS_CONCURRENCY}) ===", flush=True)
+    started = time.monotonic()
+    tcp_results = dict(zip(tcp_groups, await asyncio.gather(*(check_endpoint(p) for p in tcp_groups.values()))))
+    tls_results = dict(zip(tls_groups, await asyncio.gather(*(check_sni(k, p, sni) for k, (p, sni) in tls_groups.items()))))
+
+    survivors = []
+    for node_link, proxy in prepared_nodes:
+        ok = True
+        if proxy["type"] != "hysteria2":
+            endpoint = (proxy["server"], proxy["port"])
+            sni = _tls_target(proxy)
+            ok = tcp_results[endpoint] and (sni is None or tls_results[endpoint + (sni, bool(proxy.get("skip-cert-verify")))])
+        if ok:
+            survivors.append((node_link, proxy))
+        else:
+            report(False, node_link, 99999)
+    print(f"🔎 预筛选完成: TCP 端点通过 {sum(tcp_results.values())}/{len(tcp_results)}, "
+          f"TLS/SNI 通过 {sum(tls_results.values())}/{len(tls_results)}, "
+          f"进入延迟测试 {len(survivors)} 个, 耗时 {time.monotonic() - started:.2f}s", flush=True)
+    return survivors
+
+
+async def preresolve_nodes(prepared_nodes, report):
+    """
+    批量预解析全部节点的 server 与 SNI 域名 (带 TTL 的跨运行缓存)。
+    server 或 SNI 为 NXDOMAIN 的节点直接通过 report 判定失败；解析出的 server IP 记入 RESOLVED_HOSTS。
+    """
+    domains = set()
+    for _, proxy in prepared_nodes:
+        domains.add(proxy["server"])
+        sni = _tls_target(proxy)
+        if sni:
+            domains.add(sni)
+    cache = await pre_resolve_async(domains)
+    RESOLVED_HOSTS.update(cache.hosts({proxy["server"] for _, proxy in prepared_nodes}))
+
+    survivors = []
+    for node_link, proxy in prepared_nodes:
+        sni = _tls_target(proxy)
+        if cache.is_nxdomain(proxy["server"]) or (sni and cache.is_nxdomain(sni)):
+            report(False, node_link, 99999)
+        else:
+            survivors.append((node_link, proxy))
+    if len(survivors) < len(prepared_nodes):
+        print(f"🌐 剔除 NXDOMAIN 节点 {len(prepared_nodes) - len(survivors)} 个", flush=True)
+    return survivors
 
-    return False, node_link, 99999
 
 # --- 并行执行逻辑（run_parallel_tests） ---
 def run_parallel_tests(all_nodes):
-    print(f"\n=== 开始并行测试 Workers={MAX_WORKERS} ===", flush=True)
+    print(f"\n=== 开始并行测试 Workers={MAX_WORKERS} 总并发={ASYNC_MAX_CONCURRENCY} ===", flush=True)
     valid_nodes = [n for n in all_nodes if n.strip()]
     results = []
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(test_single_node, node): node for node in valid_nodes}
-        
-        for completed, future in enumerate(as_completed(futures), 1):
-            try:
-                status, link, delay_ms = future.result()
-                results.append((status, link))
-                
-                remark = link.split('#')[-1][:40] if '#' in link else '无备注'
-                mark = "✅" if status else "❌"
-                delay_str = f"{delay_ms}ms" if status else "失败"
-                print(f"[{completed:>{len(str(len(valid_nodes)))}}/{len(valid_nodes)}] {mark} {delay_str} → {remark}", flush=True)
-
-            except Exception as e:
-                print(f"💥 线程执行失败 (未知错误): {e}", file=sys.stderr, flush=True)
-                continue
+    width = len(str(len(valid_nodes)))
+
+    def report(status, link, delay_ms, cached=False):
+        results.append((status, link, delay_ms, cached))
+        remark = link.split('#')[-1][:40] if '#' in link else '无备注'
+        mark = "✅" if status else "❌"
+        delay_str = f"{delay_ms}ms" if status else ("退避中，跳过" if cached else "失败")
+        print(f"[{len(results):>{width}}/{len(valid_nodes)}] {mark} {delay_str} → {remark}", flush=True)
+
+    # 预处理：全部节点只解析一次，无法解析的节点直接判定失败，不占用测试资源
+    prepared_nodes, rejected_nodes = precompute_nodes(valid_nodes)
+    for node_link in rejected_nodes:
+        report(False, node_link, 99999)
+
+    if not HEALTH_CACHE_MODE:
+        asyncio.run(_run_parallel_tests(prepared_nodes, report))
+        STARTUP_STATS.print_histogram()
+        print("=== 并行测试结束 ===", flush=True)
+        return results
+
+    # 健康记录：命中缓存的节点直接输出上次结果，其余节点测试后写回
+    with NodeHealthStore(scope=HEALTH_SCOPE) as health_store:
+        fingerprints = {node_link: generate_proxy_fingerprint(proxy) for node_link, proxy in prepared_nodes}
+        health_records = health_store.lookup(fingerprints.values())
+        nodes_to_test = []
+        cached = 0
+        for node_link, proxy in prepared_nodes:
+            verdict = NodeHealthStore.cached_verdict(health_records.get(fingerprints[node_link]))
+            if verdict is None:
+                nodes_to_test.append((node_link, proxy))
+            else:
+                cached += 1
+                report(verdict[0], node_link, verdict[1] or 99999, cached=True)
+        print(f"🗂️ 健康记录命中 {cached} 个节点，需要测试 {len(nodes_to_test)} 个", flush=True)
+
+        # 只写入内存缓冲，退出 with 时批量写盘
+        def report_tested(status, link, delay_ms):
+            health_store.record(fingerprints[link], status, delay_ms if status else None)
+            report(status, link, delay_ms)
+
+        asyncio.run(_run_parallel_tests(nodes_to_test, report_tested))
+    STARTUP_STATS.print_histogram()
 
     print("=== 并行测试结束 ===", flush=True)
     return results
 
 # --- 结果保存逻辑（save_results） ---
+def latency_sidecar_path(output_path):
+    """结果文件旁的延迟记录: success-nodes-parallel.txt → success-nodes-parallel.latency.json。"""
+    return f"{os.path.splitext(output_path)[0]}.latency.json"
+
+
+def save_latency_sidecar(output_path, tested_at, latency, failed, skipped):
+    """
+    写出延迟记录 {"tested_at", "latency": {链接: 延迟ms}, "failed": [链接], "skipped": [链接]}，
+    供 generate_config.py 按延迟排序并统计连续失效次数。
+    skipped 为健康记录退避期内未重新测试的失效节点，不计入本次的连续失效次数。
+    """
+    sidecar_path = latency_sidecar_path(output_path)
+    with open(sidecar_path, 'w', encoding='utf-8') as f:
+        json.dump({"tested_at": tested_at, "latency": latency, "failed": failed, "skipped": skipped},
+                  f, ensure_ascii=False)
+    print(f"⏱️ 延迟记录已保存: {sidecar_path}", flush=True)
+
+
 def save_results(results):
     shanghai_tz = pytz.timezone('Asia/Shanghai')
     now_shanghai = datetime.datetime.now(shanghai_tz)
     output_dir = now_shanghai.strftime('%Y/%m')
-    output_filename = 'success-nodes-parallel.txt'
+    output_filename = f'success-nodes-parallel.shard-{NODE_SHARD}.txt' if NODE_SHARD else 'success-nodes-parallel.txt'
     output_path = os.path.join(output_dir, output_filename)
     
-    successful_nodes = [link for status, link in results if status]
+    successful_nodes = [link for status, link, _, _ in results if status]
     total = len(results)
     rate = len(successful_nodes) / total * 100 if total else 0
 
@@ -412,21 +843,86 @@ def save_results(results):
             for link in successful_nodes:
                 f.write(f"{link}\n")
         print(f"✅ 成功节点已保存: {output_path}", flush=True)
+        # 全部失败时不写延迟记录：多半是网络故障，不应计入节点的连续失效次数
+        save_latency_sidecar(
+            output_path, now_shanghai.isoformat(),
+            {link: delay_ms for status, link, delay_ms, _ in results if status},
+            [link for status, link, _, cached in results if not status and not cached],
+            [link for status, link, _, cached in results if not status and cached],
+        )
         return output_path
     else:
         print("⚠️ 无成功节点")
         return None
 
+def merge_results(shard_paths):
+    """合并各分片的测试结果 (save_results 写出的文件及其延迟记录)，去重后写入 success-nodes-parallel.txt。"""
+    shanghai_tz = pytz.timezone('Asia/Shanghai')
+    now_shanghai = datetime.datetime.now(shanghai_tz)
+    output_dir = now_shanghai.strftime('%Y/%m')
+    output_path = os.path.join(output_dir, 'success-nodes-parallel.txt')
+
+    successful_nodes = {}
+    total = 0
+    latency = {}
+    failed = []
+    skipped = []
+    for path in shard_paths:
+        sidecar_path = latency_sidecar_path(path)
+        if os.path.exists(sidecar_path):
+            try:
+                with open(sidecar_path, 'r', encoding='utf-8') as f:
+                    sidecar = json.load(f)
+                latency.update(sidecar.get("latency", {}))
+                failed.extend(sidecar.get("failed", []))
+                skipped.extend(sidecar.get("skipped", []))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 读取分片延迟记录失败: {sidecar_path} | 错误: {e}", file=sys.stderr, flush=True)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    rate_match = re.match(r'# 成功率: \d+/(\d+)', line)
+                    if rate_match:
+                        total += int(rate_match.group(1))
+                    elif line and not line.startswith('#') and line != '---':
+                        successful_nodes.setdefault(line, None)
+        except OSError as e:
+            print(f"⚠️ 读取分片结果失败: {path} | 错误: {e}", file=sys.stderr, flush=True)
+
+    rate = len(successful_nodes) / total * 100 if total else 0
+    print(f"\n--- 合并 {len(shard_paths)} 个分片结果 ---")
+    print(f"总节点: {total}  成功: {len(successful_nodes)}  成功率: {rate:.1f}%", flush=True)
+    if not successful_nodes:
+        print("⚠️ 无成功节点")
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(f"# 测试时间: {now_shanghai.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"# 成功率: {len(successful_nodes)}/{total} ({rate:.1f}%)\n---\n")
+        for link in successful_nodes:
+            f.write(f"{link}\n")
+    print(f"✅ 合并结果已保存: {output_path}", flush=True)
+    save_latency_sidecar(output_path, now_shanghai.isoformat(), latency, failed, skipped)
+    return output_path
+
 if __name__ == "__main__":
-    if not os.path.exists("./mihomo-linux-amd64"):
-        print("❌ 未找到 mihomo-linux-amd64", file=sys.stderr)
+    # 合并模式: python test_connectivity_parallel.py --merge <分片结果文件...>
+    if len(sys.argv) > 1 and sys.argv[1] == "--merge":
+        final_path = merge_results(sys.argv[2:])
+        if final_path:
+            print(f"\nREPORT_PATH={final_path}")
+        sys.exit(0)
+
+    if not os.path.exists(MIHOMO_BINARY):
+        print(f"❌ 未找到 {MIHOMO_BINARY}", file=sys.stderr)
         sys.exit(1)
 
-    os.system("chmod +x ./mihomo-linux-amd64")
+    os.chmod(MIHOMO_BINARY, 0o755)
     
-    # 强制清理：防止上一次运行残留的僵尸进程占用端口
-    print("🧹 强制清理残留进程...", flush=True)
-    os.system("killall mihomo-linux-amd64 || true") 
+    # 强制清理：防止上一次运行残留的进程占用端口 (只处理 mihomo_supervisor 登记过的 PID)
+    print(f"🧹 强制清理残留进程... 结束 {kill_registered()} 个", flush=True)
     
     print(f"✅ 脚本已调整：将以 MAX_WORKERS={MAX_WORKERS} 的低并发运行，并使用 {SHARED_GEO_DIR} 目录下的 GeoData 文件。", flush=True)
 
@@ -0,0 +1,19 @@
+# 测试直接导入 新建文件夹/ 下的脚本模块
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+@pytest.fixture(scope="session")
+def clashforge():
+    """以模块形式加载 ClashForge (2).py (文件名不是合法的模块名)。"""
+    pytest.importorskip("requests_html")
+    spec = importlib.util.spec_from_file_location("clashforge", os.path.join(SCRIPTS_DIR, "ClashForge (2).py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,89 @@
+# 测试用的 mihomo 控制器桩 (asyncio.start_server)：/version、/proxies/{name}/delay、/group/{name}/delay、GET /proxies
+import asyncio
+import json
+import urllib.parse
+
+
+class FakeController:
+    """
+    behavior(name, in_flight) 决定单个节点的测试结果：返回延迟 (ms)、"timeout" (mihomo 返回 504) 或 ("hang", 秒数)。
+    latency 为每个测通节点的耗时 (秒)，越长同时在测的节点越多；groups 为已加载的 {组名: [节点名]}，
+    由 GET /proxies 返回；requests 记录 (方法, 路径)。
+    """
+
+    def __init__(self, behavior, version_info=None, groups=None, group_delay=True, latency=0.03):
+        self.behavior = behavior
+        self.latency = latency
+        self.version_info = version_info or {"version": "v1.18.0", "meta": True}
+        self.groups = groups or {}
+        self.group_delay = group_delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+        self.server = None
+        self.port = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _probe(self, name):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            result = self.behavior(name, self.in_flight)
+            if isinstance(result, tuple):
+                await asyncio.sleep(result[1])
+                return None
+            await asyncio.sleep(self.latency)
+            return None if result == "timeout" else result
+        finally:
+            self.in_flight -= 1
+
+    async def _route(self, method, path, body):
+        parts = [urllib.parse.unquote(p) for p in urllib.parse.urlsplit(path).path.split("/") if p]
+        self.requests.append((method, "/".join(parts[:1] + parts[2:3])))
+        if method == "GET" and parts == ["version"]:
+            return 200, self.version_info
+        if method == "GET" and parts == ["proxies"]:
+            return 200, {"proxies": {name: {"type": "Selector", "all": members} for name, members in self.groups.items()}}
+        if method == "GET" and len(parts) == 3 and parts[0] == "proxies" and parts[2] == "delay":
+            delay = await self._probe(parts[1])
+            return (504, {"message": "Timeout"}) if delay is None else (200, {"delay": delay})
+        if method == "GET" and len(parts) == 3 and parts[0] == "group" and parts[2] == "delay":
+            if not self.group_delay or parts[1] not in self.groups:
+                return 404, {"message": "Resource not found"}
+            names = self.groups[parts[1]]
+            delays = await asyncio.gather(*(self._probe(name) for name in names))
+            result = {name: delay for name, delay in zip(names, delays) if delay is not None}
+            return (200, result) if result else (504, {"message": "get delay: all proxies timeout"})
+        return 404, {"message": "Resource not found"}
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload = await self._route(method, path, body)
+                data = b"" if payload is None else json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
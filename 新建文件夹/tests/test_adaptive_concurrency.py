@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from fake_controller import FakeController
+
+
+@pytest.fixture
+def cf(clashforge, monkeypatch):
+    # 小窗口、小上限，几百个节点就能走完增长、回退和触底
+    monkeypatch.setattr(clashforge, "CONCURRENCY_INITIAL", 8)
+    monkeypatch.setattr(clashforge, "CONCURRENCY_MIN", 4)
+    monkeypatch.setattr(clashforge, "MAX_CONCURRENT_TESTS", 24)
+    monkeypatch.setattr(clashforge, "CONCURRENCY_STEP", 4)
+    monkeypatch.setattr(clashforge, "CONCURRENCY_WINDOW", 10)
+    monkeypatch.setattr(clashforge, "GROUP_DELAY", False)
+    return clashforge
+
+
+def _run(cf, behavior, count, latency=0.03):
+    async def run():
+        async with FakeController(behavior, latency=latency) as controller:
+            async with cf.ClashAPI("127.0.0.1", [controller.port]) as api:
+                assert await api.check_connection()
+                results = await asyncio.gather(*(api.test_proxy_delay(f"n{i}") for i in range(count)))
+                return api.semaphore, results, controller
+    return asyncio.run(run())
+
+
+def test_additive_increase_up_to_ceiling(cf):
+    limiter, results, controller = _run(cf, lambda name, in_flight: 100, 400)
+    assert all(r.is_valid for r in results)
+    steps = [(old, new) for _, old, new, _ in limiter.history]
+    assert steps == [(8, 12), (12, 16), (16, 20), (20, 24)]
+    assert limiter.limit == 24
+    assert controller.max_in_flight <= 24
+
+
+def test_multiplicative_decrease_on_timeout_spike(cf):
+    # 同时超过 12 个测试时 mihomo 开始超时
+    limiter, results, controller = _run(cf, lambda name, in_flight: "timeout" if in_flight > 12 else 100, 400, latency=0.1)
+    decreases = [(old, new) for _, old, new, _ in limiter.history if new < old]
+    assert decreases
+    assert all(new == max(4, int(old * cf.CONCURRENCY_BACKOFF)) for old, new in decreases)
+    assert any("超时比例" in reason for *_, reason in limiter.history)
+    limits = [new for _, _, new, _ in limiter.history]
+    assert max(limits) <= 24
+    # 下降时仍在进行的旧请求不计入新窗口，并发在容量附近来回，而不是一路降到下限
+    assert min(limits) > 4
+
+
+def test_adaptive_limit_avoids_false_timeouts(cf, monkeypatch):
+    def behavior(name, in_flight):
+        return "timeout" if in_flight > 12 else 100
+
+    _, adaptive, _ = _run(cf, behavior, 400, latency=0.1)
+    monkeypatch.setattr(cf, "ADAPTIVE_CONCURRENCY", False)
+    _, fixed, _ = _run(cf, behavior, 400, latency=0.1)
+    assert sum(r.is_valid for r in adaptive) > sum(r.is_valid for r in fixed)
+
+
+def test_floor_on_client_timeouts(cf, monkeypatch):
+    monkeypatch.setattr(cf, "TIMEOUT", 0.1)
+    calls = {"n": 0}
+
+    def behavior(name, in_flight):
+        # 两个窗口建立基线后，控制器整体卡住，请求在客户端超时
+        calls["n"] += 1
+        return 100 if calls["n"] <= 20 else ("hang", 1)
+
+    limiter, results, controller = _run(cf, behavior, 300)
+    limits = [new for _, _, new, _ in limiter.history]
+    # 连续的超时窗口把并发降到下限且不会更低；之后全部超时成为新的基线 (与节点全部失效无法区分)，可以重新增长
+    assert limits[:5] == [12, 16, 11, 7, 4]
+    assert min(limits) == 4
+    assert sum(r.is_valid for r in results) == 20
+
+
+def test_fixed_limit_when_disabled(cf, monkeypatch):
+    monkeypatch.setattr(cf, "ADAPTIVE_CONCURRENCY", False)
+    limiter, results, controller = _run(cf, lambda name, in_flight: "timeout" if in_flight > 12 else 100, 200)
+    assert limiter.limit == 24 and limiter.history == []
+    assert controller.max_in_flight <= 24
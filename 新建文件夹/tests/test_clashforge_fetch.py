@@ -0,0 +1,19 @@
+import asyncio
+
+
+def test_fetch_sources_processes_results_in_source_order(clashforge, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    delays = {"https://a.example/sub": 0.05, "https://b.example/sub": 0.0, "https://c.example/sub": 0.02}
+
+    async def fake_process_url(fetcher, url):
+        await asyncio.sleep(delays[url])
+        if url.startswith("https://c."):
+            return None
+        return [{"name": "HK", "server": url, "port": 443}], True
+
+    monkeypatch.setattr(clashforge, "process_url", fake_process_url)
+    seen = []
+    # 完成顺序为 b、c、a，但结果必须按 links 的顺序处理
+    js_urls = asyncio.run(clashforge.fetch_sources(list(delays), lambda node: seen.append(node["server"])))
+    assert seen == ["https://a.example/sub", "https://b.example/sub"]
+    assert js_urls == ["https://c.example/sub"]
@@ -0,0 +1,61 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import convert_to_base64
+
+LINKS = b"trojan://pw@1.1.1.1:443?sni=a.example.com#a\ntrojan://pw@1.1.1.2:443?sni=b.example.com#b\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = {"/trojan_links.txt": LINKS, "/mirror.txt": LINKS, "/empty.ranked.txt": b""}.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("ranked", ["/missing.ranked.txt", "/empty.ranked.txt"])
+def test_missing_or_empty_ranked_list_falls_back(server, monkeypatch, ranked):
+    base = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(convert_to_base64, "SUBSCRIPTION_FALLBACKS", {base + ranked: base + "/trojan_links.txt"})
+    proxies, _ = convert_to_base64.fetch_and_decode_urls_to_clash_proxies([base + ranked], enable_connectivity_test=False)
+    assert server.requests == [ranked, "/trojan_links.txt"]
+    assert sorted(p["server"] for p in proxies) == ["1.1.1.1", "1.1.1.2"]
+
+
+def test_identical_body_without_validators_is_parsed_once(server, monkeypatch):
+    base = f"http://127.0.0.1:{server.server_port}"
+    parsed = []
+    original = convert_to_base64.iter_subscription_proxies
+    monkeypatch.setattr(convert_to_base64, "iter_subscription_proxies",
+                        lambda *args, **kwargs: parsed.append(args) or original(*args, **kwargs))
+    fetch = convert_to_base64.fetch_and_decode_urls_to_clash_proxies
+    first, _ = fetch([base + "/trojan_links.txt"], enable_connectivity_test=False)
+    # 服务器不发 ETag/Last-Modified：再次运行与内容相同的另一个链接都按正文哈希命中解析缓存
+    again, _ = fetch([base + "/trojan_links.txt", base + "/mirror.txt"], enable_connectivity_test=False)
+    assert len(parsed) == 1
+    assert server.requests == ["/trojan_links.txt", "/trojan_links.txt", "/mirror.txt"]
+    assert len(first) == 2 and len(again) == 2
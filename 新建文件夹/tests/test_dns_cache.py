@@ -0,0 +1,112 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+import dns_cache
+from dns_cache import DnsCache, STATUS_NXDOMAIN, STATUS_OK, pre_resolve_async
+
+
+class StubDnsServer:
+    """本地 UDP DNS 测试桩：answers 为 {域名: (IP, TTL)}，其余域名 (或 nxdomain_all 时全部) 返回 NXDOMAIN。"""
+
+    def __init__(self, answers, nxdomain_all=False):
+        self.answers = answers
+        self.nxdomain_all = nxdomain_all
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.address = f"127.0.0.1:{self.sock.getsockname()[1]}"
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            self.sock.sendto(self._answer(data), addr)
+
+    def _answer(self, data):
+        query_id = struct.unpack("!H", data[:2])[0]
+        offset = 12
+        labels = []
+        while data[offset]:
+            labels.append(data[offset + 1:offset + 1 + data[offset]].decode())
+            offset += 1 + data[offset]
+        question = data[12:offset + 5]
+        domain = ".".join(labels)
+        self.queries.append(domain)
+        answer = None if self.nxdomain_all else self.answers.get(domain)
+        if answer is None:
+            return struct.pack("!HHHHHH", query_id, 0x8183, 1, 0, 0, 0) + question
+        ip, ttl = answer
+        record = b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, ttl, 4) + bytes(int(b) for b in ip.split("."))
+        return struct.pack("!HHHHHH", query_id, 0x8180, 1, 1, 0, 0) + question + record
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def stub():
+    server = StubDnsServer({"a.example.com": ("10.0.0.1", 300), "b.example.com": ("10.0.0.2", 5)})
+    yield server
+    server.close()
+
+
+def test_resolves_and_caches_nxdomain(stub, tmp_path):
+    path = str(tmp_path / "dns.json")
+    cache = asyncio.run(pre_resolve_async({"a.example.com", "missing.example.com", "1.1.1.1"}, path, [stub.address]))
+    assert cache.lookup_ip("a.example.com") == "10.0.0.1"
+    assert cache.is_nxdomain("missing.example.com")
+    assert cache.get("missing.example.com")["status"] == STATUS_NXDOMAIN
+    assert cache.hosts(["a.example.com", "missing.example.com", "1.1.1.1"]) == {"a.example.com": "10.0.0.1"}
+
+    # 第二次运行从磁盘缓存读取，不再查询 (包括负缓存)
+    stub.queries.clear()
+    cache = asyncio.run(pre_resolve_async({"a.example.com", "missing.example.com"}, path, [stub.address]))
+    assert stub.queries == []
+    assert cache.is_nxdomain("missing.example.com")
+
+
+def test_ttl_expiry_triggers_requery(stub, tmp_path):
+    cache = DnsCache(str(tmp_path / "dns.json"), [stub.address])
+    asyncio.run(cache.resolve_many(["b.example.com"]))
+    record = cache.get("b.example.com")
+    assert record["status"] == STATUS_OK
+    # TTL 5 秒被提升到 DNS_MIN_TTL
+    assert record["expires"] - time.time() == pytest.approx(dns_cache.DNS_MIN_TTL, abs=2)
+    assert cache.get("b.example.com", now=record["expires"] + 1) is None
+
+    record["expires"] = time.time() - 1
+    stub.queries.clear()
+    assert asyncio.run(cache.resolve_many(["b.example.com"])) == 1
+    assert stub.queries == ["b.example.com"]
+    assert cache.get("b.example.com")["expires"] > time.time()
+
+
+def test_nxdomain_flood_is_discarded(tmp_path):
+    server = StubDnsServer({}, nxdomain_all=True)
+    try:
+        domains = {f"n{i}.example.com" for i in range(dns_cache.DNS_NXDOMAIN_SANITY_MIN + 5)}
+        cache = asyncio.run(pre_resolve_async(domains, str(tmp_path / "dns.json"), [server.address]))
+    finally:
+        server.close()
+    assert not any(cache.is_nxdomain(d) for d in domains)
+    # 作废的结果也不写入磁盘，下次运行重新解析
+    assert DnsCache(str(tmp_path / "dns.json")).records == {}
+
+
+def test_few_nxdomain_answers_are_kept(stub, tmp_path):
+    # 样本不足 DNS_NXDOMAIN_SANITY_MIN 时不触发整体作废
+    cache = asyncio.run(pre_resolve_async({"x.example.com", "y.example.com"}, str(tmp_path / "dns.json"), [stub.address]))
+    assert cache.is_nxdomain("x.example.com") and cache.is_nxdomain("y.example.com")
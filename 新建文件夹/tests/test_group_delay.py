@@ -0,0 +1,142 @@
+import asyncio
+import json
+
+import pytest
+
+from fake_controller import FakeController
+
+
+@pytest.fixture
+def cf(clashforge, monkeypatch):
+    monkeypatch.setattr(clashforge, "GROUP_DELAY", True)
+    monkeypatch.setattr(clashforge, "GROUP_DELAY_CHUNK_SIZE", 10)
+    monkeypatch.setattr(clashforge, "CONCURRENCY_INITIAL", 20)
+    monkeypatch.setattr(clashforge, "CONCURRENCY_MIN", 10)
+    monkeypatch.setattr(clashforge, "MAX_CONCURRENT_TESTS", 60)
+    monkeypatch.setattr(clashforge, "CONCURRENCY_STEP", 10)
+    monkeypatch.setattr(clashforge, "CONCURRENCY_WINDOW", 20)
+    return clashforge
+
+
+def _config(count):
+    names = [f"n{i}" for i in range(count)]
+    return {
+        "proxies": [{"name": name, "type": "ss", "server": f"{name}.example.com", "port": 443} for name in names],
+        "proxy-groups": [{"name": "节点选择", "type": "select", "proxies": ["自动选择"]},
+                         {"name": "自动选择", "type": "url-test", "proxies": names}],
+    }
+
+
+def _run(cf, tmp_path, config, behavior, proxies=None, cached=(), **controller_options):
+    # mihomo 加载的是启动时写出的运行时配置：控制器中的组与其中的 proxy-groups 一致
+    path = tmp_path / "config.runtime.json"
+    cf.write_runtime_config(config, str(path))
+    runtime_config = json.loads(path.read_text(encoding="utf-8"))
+
+    async def run():
+        groups = {g["name"]: g["proxies"] for g in runtime_config["proxy-groups"]}
+        async with FakeController(behavior, groups=groups, **controller_options) as controller:
+            async with cf.ClashAPI("127.0.0.1", [controller.port]) as api:
+                assert await api.check_connection()
+                supported = api.group_delay_supported
+                for name in cached:
+                    api._test_results_cache[name] = cf.ProxyTestResult(name, 80)
+                controller.requests.clear()
+                results = await cf.test_group_proxies(api, proxies or config["proxy-groups"][1]["proxies"])
+                return supported, api, results, controller
+    return asyncio.run(run())
+
+
+def _dead(name):
+    return int(name[1:]) % 3 == 0
+
+
+@pytest.mark.parametrize("version_info, expected", [
+    ({"version": "v1.18.9", "meta": True}, True),
+    ({"version": "v1.14.0", "meta": True}, True),
+    ({"version": "v1.13.2", "meta": True}, False),
+    ({"version": "alpha-8a2f3c1", "meta": True}, True),
+    ({"version": "2023.08.17", "premium": True}, False),
+    ({"version": "v1.18.9"}, False),
+])
+def test_supports_group_delay(cf, version_info, expected):
+    assert cf.supports_group_delay(version_info) is expected
+
+
+def test_runtime_config_adds_delay_groups_without_touching_config(cf, tmp_path):
+    config = _config(25)
+    original = json.loads(json.dumps(config))
+    path = tmp_path / "config.runtime.json"
+    cf.write_runtime_config(config, str(path))
+    runtime_config = json.loads(path.read_text(encoding="utf-8"))
+    assert config == original
+    assert runtime_config["proxies"] == config["proxies"]
+    assert runtime_config["proxy-groups"][:2] == config["proxy-groups"]
+    temporary = runtime_config["proxy-groups"][2:]
+    assert [g["name"] for g in temporary] == [f"{cf.GROUP_DELAY_PREFIX}{i}" for i in range(3)]
+    assert [len(g["proxies"]) for g in temporary] == [10, 10, 5]
+
+
+def test_group_delay_uses_preloaded_groups_without_reload(cf, tmp_path):
+    config = _config(95)
+    supported, api, results, controller = _run(cf, tmp_path, config, lambda name, in_flight: "timeout" if _dead(name) else 120)
+    assert supported
+    assert sorted(r.name for r in results) == sorted(p["name"] for p in config["proxies"])
+    assert {r.name for r in results if not r.is_valid} == {p["name"] for p in config["proxies"] if _dead(p["name"])}
+    assert controller.requests.count(("GET", "group/delay")) == 10
+    assert ("GET", "proxies/delay") not in controller.requests
+    # 临时组随启动配置加载，测速过程中不热加载配置
+    assert not any(method == "PUT" for method, _ in controller.requests)
+
+
+def test_mostly_cached_groups_are_tested_per_proxy(cf, tmp_path):
+    # n0-n9 一组中只剩 2 个待测节点 (低于 GROUP_DELAY_MIN_PENDING)，逐个测试；n10-n19 一组中有 6 个待测，整组测试
+    config = _config(20)
+    cached = [f"n{i}" for i in range(2, 10)] + [f"n{i}" for i in range(10, 14)]
+    supported, api, results, controller = _run(cf, tmp_path, config, lambda name, in_flight: 90, cached=cached)
+    assert sorted(r.name for r in results) == sorted(p["name"] for p in config["proxies"])
+    assert controller.requests.count(("GET", "group/delay")) == 1
+    assert controller.requests.count(("GET", "proxies/delay")) == 2
+
+
+def test_nodes_outside_delay_groups_are_tested_per_proxy(cf, tmp_path):
+    # 启动后新增的节点不在任何临时组中
+    config = _config(20)
+    proxies = config["proxy-groups"][1]["proxies"] + ["late0", "late1"]
+    supported, api, results, controller = _run(cf, tmp_path, config, lambda name, in_flight: 90, proxies=proxies)
+    assert sorted(r.name for r in results) == sorted(proxies)
+    assert controller.requests.count(("GET", "group/delay")) == 2
+    assert controller.requests.count(("GET", "proxies/delay")) == 2
+
+
+def test_group_delay_is_throttled_by_limiter(cf, tmp_path):
+    # mihomo 同时测试超过 30 个节点时开始超时：组测试的名额与结果都计入限制器
+    config = _config(400)
+    supported, api, results, controller = _run(cf, tmp_path, config, lambda name, in_flight: "timeout" if in_flight > 30 else 100,
+                                               latency=0.1)
+    limiter = api.semaphore
+    assert controller.max_in_flight <= cf.MAX_CONCURRENT_TESTS
+    assert any(new > old for _, old, new, _ in limiter.history)
+    assert any(new < old for _, old, new, _ in limiter.history)
+    assert limiter.in_flight == 0
+
+
+def test_falls_back_to_per_proxy_when_version_lacks_group_api(cf, tmp_path):
+    config = _config(30)
+    supported, api, results, controller = _run(cf, tmp_path, config, lambda name, in_flight: 100,
+                                               version_info={"version": "v1.13.2", "meta": True})
+    assert not supported
+    assert controller.requests.count(("GET", "proxies/delay")) == 30
+    assert ("GET", "group/delay") not in controller.requests
+    assert all(r.is_valid for r in results)
+
+
+def test_falls_back_to_per_proxy_when_group_endpoint_is_missing(cf, tmp_path):
+    # 版本号看起来支持，但 /group 接口返回 404 (例如精简构建)：回退逐个测试
+    config = _config(30)
+    supported, api, results, controller = _run(cf, tmp_path, config, lambda name, in_flight: 100, group_delay=False)
+    assert supported and not api.group_delay_supported
+    assert controller.requests.count(("GET", "proxies/delay")) == 30
+    assert sorted(r.name for r in results) == sorted(p["name"] for p in config["proxies"])
+    assert all(r.is_valid for r in results)
+    assert api.semaphore.in_flight == 0
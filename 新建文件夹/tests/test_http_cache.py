@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_cache import HttpCache
+
+BODY = b"proxies:\n- {name: a, type: ss, server: 1.1.1.1, port: 443, cipher: aes-128-gcm, password: x}\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        validators = {"/etag": ("ETag", '"v1"', "If-None-Match"),
+                      "/modified": ("Last-Modified", "Wed, 21 Oct 2026 07:28:00 GMT", "If-Modified-Since")}
+        header, value, conditional = validators[self.path]
+        if self.headers.get(conditional) == value:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header(header, value)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _fetch(cache, url):
+    response = requests.get(url, headers=cache.request_headers(url), timeout=5)
+    return cache.handle_response(url, response.status_code, response.headers, response.content)
+
+
+@pytest.mark.parametrize("path", ["/etag", "/modified"])
+def test_revalidation_reuses_body_and_parse_result(server, tmp_path, path):
+    url = f"http://127.0.0.1:{server.server_port}{path}"
+    cache = HttpCache(str(tmp_path / "cache"))
+
+    status, body = _fetch(cache, url)
+    assert (status, body) == (200, BODY)
+    assert cache.load_parsed(url, "nodes", body) == (False, None)
+    cache.store_parsed(url, "nodes", body, [{"name": "a"}])
+    cache.save()
+
+    # 新的运行：带上条件请求头，服务器返回 304，正文和解析结果都来自缓存
+    cache = HttpCache(str(tmp_path / "cache"))
+    status, body = _fetch(cache, url)
+    assert (status, body) == (200, BODY)
+    assert len(server.requests) == 2 and len(cache.request_headers(url)) == 1
+    assert cache.hits == 1
+    assert cache.load_parsed(url, "nodes", body) == (True, [{"name": "a"}])
+    assert cache.load_parsed(url, "nodes") == (True, [{"name": "a"}])
+
+
+def test_parse_result_is_invalidated_when_body_changes(tmp_path):
+    cache = HttpCache(str(tmp_path / "cache"))
+    url = "http://example.invalid/sub"
+    cache.handle_response(url, 200, {"ETag": '"v1"'}, BODY)
+    cache.store_parsed(url, "nodes", BODY, ["old"])
+    cache.handle_response(url, 200, {"ETag": '"v2"'}, BODY + b"# changed\n")
+    assert cache.load_parsed(url, "nodes") == (False, None)
+    # 没有验证器的响应不缓存
+    cache.handle_response(url, 200, {}, BODY)
+    assert cache.request_headers(url) == {}
+
+
+def test_spooled_body_is_hashed_and_revalidated(tmp_path):
+    url = "http://example.invalid/clash.yaml"
+    cache = HttpCache(str(tmp_path / "cache"))
+    chunks = [BODY[i:i + 16] for i in range(0, len(BODY), 16)]
+    assert cache.spool_response(url, 200, {"ETag": '"e1"'}, iter(chunks)) == (200, hashlib.sha256(BODY).hexdigest())
+    cache.save()
+
+    cache = HttpCache(str(tmp_path / "cache"))
+    assert cache.request_headers(url) == {"If-None-Match": '"e1"'}
+    assert cache.spool_response(url, 304, {}, iter(())) == (200, hashlib.sha256(BODY).hexdigest())
+    assert b"".join(cache.iter_body(url)) == BODY
+    # 没有验证器的正文同样落盘并给出哈希，但不发条件请求
+    other = "http://example.invalid/plain"
+    assert cache.spool_response(other, 200, {}, iter(chunks))[1] == hashlib.sha256(BODY).hexdigest()
+    assert cache.request_headers(other) == {}
+    assert b"".join(cache.iter_body(other)) == BODY
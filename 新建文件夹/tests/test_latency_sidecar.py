@@ -0,0 +1,20 @@
+import json
+
+import test_connectivity_parallel as tester
+
+
+def test_backoff_skipped_nodes_are_not_reported_as_failed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    results = [
+        (True, "trojan://alive", 120, False),
+        (True, "trojan://cached-alive", 80, True),
+        (False, "trojan://dead", 99999, False),
+        (False, "trojan://skipped", 99999, True),
+    ]
+    output_path = tester.save_results(results)
+    with open(tester.latency_sidecar_path(output_path), encoding="utf-8") as f:
+        sidecar = json.load(f)
+    assert sidecar["latency"] == {"trojan://alive": 120, "trojan://cached-alive": 80}
+    # 退避期内未重测的节点单独记录，generate_config.py 不会把它计入连续失效次数
+    assert sidecar["failed"] == ["trojan://dead"]
+    assert sidecar["skipped"] == ["trojan://skipped"]
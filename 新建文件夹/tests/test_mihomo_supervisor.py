@@ -0,0 +1,97 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import mihomo_supervisor
+from mihomo_supervisor import MihomoSupervisor
+
+# 假的 mihomo：不打印就绪日志，可选地在控制器端口上应答 /version (需要 Bearer 认证)，或直接退出
+FAKE_MIHOMO = textwrap.dedent("""
+    import sys, time
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    mode, port = sys.argv[1], int(sys.argv[2])
+    if mode == "exit":
+        time.sleep(0.3)
+        sys.exit(1)
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        def do_GET(self):
+            ok = self.path == "/version" and self.headers.get("Authorization") == "Bearer s3cret"
+            body = b'{"version": "v1.18.0", "meta": true}' if ok else b'{"message": "Unauthorized"}'
+            self.send_response(200 if ok else 401)
+            self.end_headers()
+            self.wfile.write(body)
+    HTTPServer(("127.0.0.1", port), Handler).serve_forever()
+""")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _supervisor(tmp_path, mode, port, secret="s3cret"):
+    script = tmp_path / "fake_mihomo.py"
+    script.write_text(FAKE_MIHOMO)
+    launcher = tmp_path / "mihomo"
+    # MihomoSupervisor 以 [binary, "-f", config] 启动，用 shell 包装把参数换成假 mihomo 的参数
+    launcher.write_text(f"#!/bin/sh\nexec {sys.executable} {script} {mode} {port}\n")
+    launcher.chmod(0o755)
+    return MihomoSupervisor(str(launcher), str(tmp_path / "config.yaml"), controller=port, ready_timeout=3,
+                            max_start_attempts=1, registry_path=str(tmp_path / "pids.json"), secret=secret)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要 /bin/sh")
+def test_ready_when_controller_answers_authenticated_version(tmp_path):
+    async def run():
+        supervisor = _supervisor(tmp_path, "serve", _free_port())
+        try:
+            return await supervisor.start()
+        finally:
+            await supervisor.stop()
+    assert asyncio.run(run())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要 /bin/sh")
+def test_wrong_secret_is_not_ready(tmp_path):
+    async def run():
+        supervisor = _supervisor(tmp_path, "serve", _free_port(), secret="wrong")
+        supervisor.ready_timeout = 1
+        try:
+            return await supervisor.start()
+        finally:
+            await supervisor.stop()
+    assert not asyncio.run(run())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要 /bin/sh")
+def test_foreign_listener_does_not_make_failed_start_look_ready(tmp_path):
+    async def run():
+        # 端口上已有其他进程在监听，而我们的进程启动失败退出
+        foreign = await asyncio.start_server(lambda reader, writer: writer.close(), "127.0.0.1", 0)
+        port = foreign.sockets[0].getsockname()[1]
+        supervisor = _supervisor(tmp_path, "exit", port)
+        try:
+            return await supervisor.start(), supervisor.state
+        finally:
+            await supervisor.stop()
+            foreign.close()
+    ready, state = asyncio.run(run())
+    assert not ready and state == "failed"
+
+
+def test_registry_path_does_not_depend_on_working_directory(tmp_path, monkeypatch):
+    # kill_registered 可能从其他目录调用 (例如 WebUI)，登记表必须始终落在脚本目录
+    monkeypatch.delenv("NODE_MIHOMO_REGISTRY", raising=False)
+    scripts_dir = os.path.dirname(os.path.abspath(mihomo_supervisor.__file__))
+    monkeypatch.setenv("PYTHONPATH", scripts_dir)
+    out = subprocess.run([sys.executable, "-c", "import mihomo_supervisor; print(mihomo_supervisor.MIHOMO_REGISTRY_PATH)"],
+                         cwd=tmp_path, capture_output=True, text=True, check=True).stdout.strip()
+    assert out == os.path.join(scripts_dir, "mihomo_pids.json")
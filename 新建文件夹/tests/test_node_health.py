@@ -0,0 +1,58 @@
+from node_health import NodeHealthStore
+
+
+def test_records_are_written_when_any_node_succeeds(tmp_path):
+    with NodeHealthStore(path=str(tmp_path / "health.sqlite3"), scope="tcp") as store:
+        store.record("a", True, 120)
+        store.record("b", False)
+    with NodeHealthStore(path=str(tmp_path / "health.sqlite3"), scope="tcp") as store:
+        records = store.lookup(["a", "b"])
+    assert records["a"].ok and records["a"].latency_ms == 120
+    assert not records["b"].ok and records["b"].failure_streak == 1
+
+
+def test_all_dead_retest_batch_advances_backoff(tmp_path):
+    path = str(tmp_path / "health.sqlite3")
+    with NodeHealthStore(path=path, scope="tcp") as store:
+        store.record("healthy", True, 80)
+        store.record("dead-1", False)
+        store.record("dead-2", False)
+    # 之后的运行只重测退避到期的失效节点 (健康节点命中缓存)：全部失败也照常写入，退避随之延长
+    for expected_streak in (2, 3):
+        with NodeHealthStore(path=path, scope="tcp") as store:
+            store.record("dead-1", False)
+            store.record("dead-2", False)
+        with NodeHealthStore(path=path, scope="tcp") as store:
+            records = store.lookup(["dead-1", "dead-2"])
+        assert [r.failure_streak for r in records.values()] == [expected_streak] * 2
+
+
+def test_previously_healthy_nodes_failing_together_is_an_outage(tmp_path):
+    path = str(tmp_path / "health.sqlite3")
+    healthy = [f"ok-{i}" for i in range(10)]
+    with NodeHealthStore(path=path, scope="tcp") as store:
+        for fp in healthy:
+            store.record(fp, True, 100)
+        store.record("dead", False)
+    # 上次健康的节点本次全部失败 (例如网络中断)：失败记录不写入，节点不会进入退避
+    with NodeHealthStore(path=path, scope="tcp") as store:
+        for fp in healthy + ["dead", "new"]:
+            store.record(fp, False)
+    with NodeHealthStore(path=path, scope="tcp") as store:
+        records = store.lookup(healthy + ["dead", "new"])
+    assert all(records[fp].ok for fp in healthy)
+    assert records["dead"].failure_streak == 1
+    assert "new" not in records
+
+
+def test_few_previously_healthy_failures_are_written(tmp_path):
+    path = str(tmp_path / "health.sqlite3")
+    with NodeHealthStore(path=path, scope="tcp") as store:
+        for i in range(10):
+            store.record(f"ok-{i}", True, 100)
+    with NodeHealthStore(path=path, scope="tcp") as store:
+        for i in range(10):
+            store.record(f"ok-{i}", i >= 2, 100 if i >= 2 else None)
+    with NodeHealthStore(path=path, scope="tcp") as store:
+        records = store.lookup([f"ok-{i}" for i in range(10)])
+    assert [records[f"ok-{i}"].ok for i in range(3)] == [False, False, True]
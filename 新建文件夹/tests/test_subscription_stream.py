@@ -0,0 +1,42 @@
+import base64
+import json
+
+from subscription_stream import iter_subscription_proxies
+
+PROXY_LINES = "".join(
+    f"  - {{name: n{i}, type: ss, server: s{i}.example.com, port: 443, cipher: aes-128-gcm, password: p{i}}}\n"
+    for i in range(200)
+)
+YAML_BODY = ("port: 7890\nproxies:\n" + PROXY_LINES + "proxy-groups:\n  - {name: g, type: select, proxies: [n0]}\n"
+             + "rules:\n" + "".join(f"  - DOMAIN-SUFFIX,d{i}.example.com,g\n" for i in range(2000))).encode()
+
+
+def _chunks(body, size=1024):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def test_yaml_with_trailing_keys_is_fully_consumed():
+    chunks = _chunks(YAML_BODY)
+    consumed = []
+    proxies = list(iter_subscription_proxies(consumed.append(c) or c for c in chunks))
+    assert [p["name"] for p in proxies] == [f"n{i}" for i in range(200)]
+    assert len(consumed) == len(chunks)
+
+
+def test_json_array_with_trailing_bytes_is_fully_consumed():
+    nodes = [{"v": "2", "ps": f"n{i}", "add": f"s{i}.example.com", "port": "443", "id": "b831381d-6324-4d53-ad4f-8cda48b30811",
+              "aid": "0", "net": "tcp", "type": "none", "tls": ""} for i in range(50)]
+    body = (json.dumps(nodes) + "\n" + " " * 5000).encode()
+    chunks = _chunks(body, 512)
+    consumed = []
+    proxies = list(iter_subscription_proxies(consumed.append(c) or c for c in chunks))
+    assert len(proxies) == 50
+    assert len(consumed) == len(chunks)
+
+
+def test_base64_wrapped_links():
+    links = "\n".join(f"trojan://pw{i}@t{i}.example.com:443?sni=t{i}.example.com#t{i}" for i in range(30))
+    formats = []
+    proxies = list(iter_subscription_proxies(_chunks(base64.b64encode(links.encode()), 100), formats=formats))
+    assert formats == ["base64", "links"]
+    assert [p["server"] for p in proxies] == [f"t{i}.example.com" for i in range(30)]